@@ -1,162 +1,1045 @@
 from __future__ import annotations
 
 import datetime
+import json
+import logging
+import os
 import threading
-from typing import Dict, List
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 # 安装 flask-cors: pip install flask-cors
 from flask_cors import CORS  # 新增引用
+import requests
+
+try:
+    from .compression import CompressedWeights, decode as decode_compressed
+    from .fedavg_engine import (
+        DenseContribution, RoundAccumulator, UpdateRejected, WeightStats,
+        available_engines, get_engine,
+    )
+    from .checkpoints import WEIGHTS_DTYPE, CheckpointStore
+    from .history_store import HistoryStore
+    from .update_record import ModelUpdate
+    from . import metrics
+    from .round_registry import (
+        CLOSE_MODES, LOCK_WAIT, RULES, AggregationRule, ClosePolicy, RoundClosedError,
+        RoundRegistry, TooManyRoundsError,
+    )
+    from .robust import aggregate as robust_aggregate
+    from .async_buffer import STALENESS_MODES, AsyncBuffer, StalenessPolicy
+    from .hierarchy import (
+        ForwardOutbox, forward as forward_partial, partial_update, summarize_upstream,
+    )
+    from .wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, JSON_CONTENT_TYPE, decode_update
+except ImportError:  # 以脚本方式运行 (python aggregator.py)
+    from compression import CompressedWeights, decode as decode_compressed
+    from fedavg_engine import (
+        DenseContribution, RoundAccumulator, UpdateRejected, WeightStats,
+        available_engines, get_engine,
+    )
+    from checkpoints import WEIGHTS_DTYPE, CheckpointStore
+    from history_store import HistoryStore
+    from update_record import ModelUpdate
+    import metrics
+    from round_registry import (
+        CLOSE_MODES, LOCK_WAIT, RULES, AggregationRule, ClosePolicy, RoundClosedError,
+        RoundRegistry, TooManyRoundsError,
+    )
+    from robust import aggregate as robust_aggregate
+    from async_buffer import STALENESS_MODES, AsyncBuffer, StalenessPolicy
+    from hierarchy import (
+        ForwardOutbox, forward as forward_partial, partial_update, summarize_upstream,
+    )
+    from wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, JSON_CONTENT_TYPE, decode_update
 
 app = Flask(__name__)
 CORS(app)  # 开启跨域
 
+log = logging.getLogger(__name__)
+
 
 # =========================
-# 全局状态（单轮模拟）
+# 全局状态
 # =========================
 
 STATE = {
-    "roundId": None,
-    "expected_clients": {"HospitalA", "HospitalB"},
-    "updates": {},          # clientId -> payload
-    "global_weights": None, # List[float]
-    "history": []           # 每轮聚合记录
+    "global_weights": None, # 最新检查点的只读 mmap（np.memmap / memoryview）
+    "global_round": None,   # global_weights 来自哪一轮（topk 增量的 baseRound）
+    "global_model": None,   # 最新检查点 info：{version, sha256, dim, ...}
 }
 
-LOCK = threading.Lock()
+# 每轮聚合记录落盘（SQLite 元数据 + 权重文件），可通过 --data-dir 修改位置
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fl_data")
+HISTORY = HistoryStore(DATA_DIR)
+CHECKPOINTS = CheckpointStore(os.path.join(DATA_DIR, "checkpoints"))
+
+# 设置后每个新检查点的 sha256 会登记到 ledger (backend2 /record_model)
+LEDGER_URL = None
+
+# 分层聚合（见 hierarchy.py）：设置 UPSTREAM_URL 后本进程作为 region 聚合器，
+# 每轮结果以 REGION_ID 的身份上传给 root，不在本地保存检查点
+UPSTREAM_URL = None
+REGION_ID = None
+# region 模式下待上传的 partial（<data-dir>/outbox），上传失败时由后台线程重试
+OUTBOX: Optional[ForwardOutbox] = None
+
+# LOCK 只保护 STATE（global model）；
+# 各 round 的累加在各自的 Round.lock 下进行，不同 round 互不争用
+LOCK = metrics.timed_lock(threading.Lock(), LOCK_WAIT, "global")
+
+# 可同时打开多个 round，每个 round 有独立的 expected_clients 与关闭策略
+ROUNDS = RoundRegistry(default_expected={"HospitalA", "HospitalB"})
+
+# 聚合引擎（可通过 --engine 切换）
+ENGINE = get_engine("auto")
+
+# 异步模式（--async-buffer K，见 async_buffer.py）：设置后 update 不再按 round 聚合，
+# 每攒满 K 个产出一个新的检查点版本
+ASYNC: Optional[AsyncBuffer] = None
+
+
+# =========================
+# 指标（GET /metrics，见 metrics.py；FL_METRICS=0 关闭）
+# =========================
+
+PAYLOAD_BYTES = metrics.histogram(
+    "fl_update_payload_bytes", "Size of uploaded /submit_update bodies", ("format",),
+    buckets=metrics.BYTES_BUCKETS,
+)
+UPDATE_DIM = metrics.histogram(
+    "fl_update_dim", "Weights dimension of submitted updates", buckets=metrics.DIM_BUCKETS
+)
+SUBMIT_SECONDS = metrics.histogram(
+    "fl_submit_seconds", "Time to fold one update (and close its round), by HTTP status", ("code",)
+)
+FOLD_SECONDS = metrics.histogram(
+    "fl_fold_seconds", "Time to fold one update into its accumulator (rounds or async buffer)", ("mode",)
+)
+AGGREGATION_SECONDS = metrics.histogram(
+    "fl_aggregation_seconds", "Round finalize time (normalize or robust merge)", ("rule",)
+)
+PERSIST_SECONDS = metrics.histogram(
+    "fl_persist_seconds", "Checkpoint save + history append per aggregated round"
+)
+ROUNDS_AGGREGATED = metrics.counter(
+    "fl_rounds_aggregated_total", "Aggregated rounds by close policy", ("policy",)
+)
+LEDGER_SECONDS = metrics.histogram(
+    "fl_ledger_seconds", "Ledger /record_model call latency", ("outcome",)
+)
+UPSTREAM_SECONDS = metrics.histogram(
+    "fl_upstream_seconds", "Region mode: time to forward a round to the root", ("code",)
+)
+STALENESS = metrics.histogram(
+    "fl_async_staleness", "Async mode: model versions between an update's base and the current model",
+    buckets=(0,) + metrics.COUNT_BUCKETS,
+)
+metrics.gauge("fl_open_rounds", "Rounds currently open", lambda: len(ROUNDS.snapshot()))
+metrics.gauge(
+    "fl_async_buffered", "Async mode: updates waiting in the buffer",
+    lambda: len(ASYNC.entries) if ASYNC is not None else 0,
+)
 
 
 # =========================
 # 工具函数
 # =========================
 
-def _validate_payload(p: dict) -> None:
-    """严格校验 client 上传的 JSON schema"""
-    required = {
-        "roundId": str,
-        "clientId": str,
-        "weights": list,
-        "samples": int,
-        "localAcc": float,
-        "timestamp": str,
-    }
+def _to_contribution(weights):
+    """上传的 weights -> 可折叠对象；压缩格式只校验不展开"""
+    if isinstance(weights, CompressedWeights):
+        return decode_compressed(ENGINE, weights)
+    return DenseContribution.from_vector(ENGINE, ENGINE.as_vector(weights))
+
 
-    for k, t in required.items():
-        if k not in p:
-            raise ValueError(f"Missing field: {k}")
-        if not isinstance(p[k], t):
-            raise ValueError(f"Field `{k}` must be {t}")
+def parse_upload(data: bytes, mimetype: str) -> ModelUpdate:
+    """按 Content-Type 解析上传 body：二进制格式零拷贝，其余按 JSON 处理。
 
-    if not p["weights"]:
-        raise ValueError("weights cannot be empty")
+    Flask 路由与 asgi.py 共用；body 不合法时抛出 ValueError。
+    """
+    if mimetype == WIRE_CONTENT_TYPE:
+        PAYLOAD_BYTES.labels("binary").observe(len(data))
+        header, weights = decode_update(data)
+        header["weights"] = weights
+        return ModelUpdate.from_dict(header)
+    PAYLOAD_BYTES.labels("json").observe(len(data))
+    try:
+        payload = json.loads(data)
+    except ValueError:
+        raise ValueError(f"body must be JSON or {WIRE_CONTENT_TYPE}") from None
+    return ModelUpdate.from_dict(payload)
 
 
 def _fedavg(updates: List[dict]) -> List[float]:
-    """FedAvg: 按 samples 加权平均"""
-    total_samples = sum(u["samples"] for u in updates)
+    """FedAvg: 按 samples 加权平均（具体计算交给 ENGINE）"""
+    return ENGINE.fedavg(
+        [u["weights"] for u in updates],
+        [u["samples"] for u in updates],
+    )
+
 
-    dim = len(updates[0]["weights"])
-    agg = [0.0] * dim
+def _global_base(dim: int):
+    """(global_round, global model 的引擎向量)，作为 topk 增量的基准"""
+    with LOCK:
+        base_round = STATE["global_round"]
+        gw = STATE["global_weights"]
 
-    for u in updates:
-        w = u["weights"]
-        s = u["samples"]
-        for i in range(dim):
-            agg[i] += w[i] * s / total_samples
+    if gw is None or len(gw) != dim:
+        return base_round, None
+    # global_weights 只会整体替换，不会原地修改，可在锁外转换
+    return base_round, ENGINE.as_vector(gw)
 
-    return agg
 
+def _aggregate_round(rnd) -> dict:
+    """执行一次完整聚合（调用方持有 rnd.lock；累加已在 submit 时完成，这里只剩 O(dim) 的归一化）。
 
-def _aggregate_round(round_id: str) -> dict:
-    """执行一次完整聚合"""
-    updates = list(STATE["updates"].values())
+    检查点落盘成功后才关闭并退役该 round；中途出错时 round 与累加器保持原样，
+    之后的 update 或 deadline 清扫会再次尝试聚合。
+    """
+    round_id = rnd.round_id
+    acc = rnd.accumulator
 
-    global_weights = _fedavg(updates)
+    num_clients = len(acc)
+    total_samples = acc.total_samples
+    compression = acc.compression_stats()
 
-    avg_acc = sum(
-        u["localAcc"] * u["samples"] for u in updates
-    ) / sum(u["samples"] for u in updates)
+    t0 = time.perf_counter()
+    selected = None
+    if rnd.rule.buffered:
+        # 鲁棒规则：从临时文件读回全部 update 再合并
+        global_weights, avg_acc, selected = robust_aggregate(rnd.rule, acc, close=False)
+    else:
+        global_weights, avg_acc = acc.finalize(close=False)
+    agg_ms = (time.perf_counter() - t0) * 1000
+    AGGREGATION_SECONDS.labels(rnd.rule.name).observe(agg_ms / 1000)
 
     record = {
         "roundId": round_id,
-        "numClients": len(updates),
-        "globalWeights": global_weights,
+        "numClients": num_clients,
         "avgLocalAcc": round(avg_acc, 6),
+        "engine": ENGINE.name,
+        "aggregation": rnd.rule.name,
+        "aggregationMs": round(agg_ms, 3),
+        "compression": compression,
+        "closePolicy": rnd.policy.mode,
         "timestamp": datetime.datetime.now(
             datetime.timezone.utc
         ).isoformat()
     }
 
-    STATE["global_weights"] = global_weights
-    STATE["history"].append(record)
-    STATE["updates"] = {}
+    if selected is not None:
+        record["selectedClients"] = selected
+
+    if UPSTREAM_URL:
+        return _stage_partial(rnd, record, global_weights, total_samples, avg_acc)
+
+    _publish_model(round_id, record, global_weights)
+
+    rnd.closed = True
+    acc.close()
+    rnd.accumulator = None
+    ROUNDS.retire(rnd)
+    ROUNDS_AGGREGATED.labels(rnd.policy.mode).inc()
+
+    # 返回给本轮最后一个 client 的结果仍带上 global weights
+    return dict(record, globalWeights=global_weights)
+
+
+def _publish_model(round_id: str, record: dict, global_weights) -> dict:
+    """保存检查点 + 历史记录，并替换 STATE 中的 global model（record 补上 modelVersion 等字段）"""
+    with PERSIST_SECONDS.time():
+        ckpt = CHECKPOINTS.save(round_id, global_weights, record["timestamp"])
+        record["modelVersion"] = ckpt["version"]
+        record["modelHash"] = ckpt["sha256"]
+        record["seq"] = HISTORY.append(record, CHECKPOINTS.path(ckpt), ckpt["dim"])
+
+    # 之后 global model 只以 mmap 形式驻留，本轮的 list 随响应一起释放
+    mapped = CHECKPOINTS.load(ckpt)
+    with LOCK:
+        STATE["global_weights"] = mapped
+        STATE["global_round"] = round_id
+        STATE["global_model"] = ckpt
+
+    if LEDGER_URL:
+        _record_on_ledger(round_id, ckpt["sha256"])
+    return ckpt
+
+
+def _model_version() -> int:
+    """当前 global model 的检查点版本（0 = 还没有）"""
+    with LOCK:
+        ckpt = STATE["global_model"]
+    return ckpt["version"] if ckpt else 0
+
+
+def _flush_async(buf) -> dict:
+    """异步模式：缓冲区攒满 K 个后产出新的 global model（调用方持有 buf.lock）"""
+    acc = buf.accumulator
+    summary = buf.summary()
+    num_clients = len(acc)
+    compression = acc.compression_stats()
+
+    t0 = time.perf_counter()
+    # 缓冲区内按 samples * s(staleness) 加权，再按 server_lr * 平均 s 与当前模型混合
+    weighted_samples = acc.total_samples
+    base = acc.base
+    avg, avg_acc = acc.finalize(close=False)
+    mix = buf.server_lr * weighted_samples / summary["totalSamples"]
+    if base is None:
+        global_weights = avg
+    else:
+        mixed = ENGINE.scaled_add(ENGINE.zeros(len(base)), base, 1.0 - mix)
+        mixed = ENGINE.scaled_add(mixed, ENGINE.as_vector(avg), mix)
+        global_weights = ENGINE.finish(mixed, 1.0)
+    agg_ms = (time.perf_counter() - t0) * 1000
+    AGGREGATION_SECONDS.labels("fedbuff").observe(agg_ms / 1000)
+
+    # 检查点版本只在这里递增（异步模式下没有 round），可预先得出本次的版本号
+    round_id = f"async-v{buf.base_version + 1}"
+    summary["baseVersion"] = buf.base_version
+    summary["mixRate"] = round(mix, 6)
+    record = {
+        "roundId": round_id,
+        "numClients": num_clients,
+        "avgLocalAcc": round(avg_acc, 6),
+        "engine": ENGINE.name,
+        "aggregation": "fedbuff",
+        "aggregationMs": round(agg_ms, 3),
+        "compression": compression,
+        "closePolicy": "async",
+        "async": summary,
+        "timestamp": datetime.datetime.now(
+            datetime.timezone.utc
+        ).isoformat()
+    }
+
+    _publish_model(round_id, record, global_weights)
+    # 落盘成功后才清空缓冲区；失败时保留，下一个 update 到达时重试
+    acc.close()
+    buf.reset()
+    ROUNDS_AGGREGATED.labels("async").inc()
+    return dict(record, globalWeights=global_weights)
+
+
+def _stage_partial(rnd, record: dict, global_weights, total_samples: int, avg_acc: float) -> dict:
+    """region 模式：本轮加权平均先落盘（权重文件 + 历史记录 + outbox）再退役 round（调用方持有 rnd.lock）。
+
+    上传给 root 可能要等重试退避，在锁外由 _forward_staged 完成。
+    """
+    payload = partial_update(rnd.round_id, REGION_ID, global_weights, total_samples, avg_acc)
+    del payload["weights"]
+
+    record["region"] = REGION_ID
+    record["totalSamples"] = total_samples
+    record["upstream"] = {"status": "pending"}
+    with PERSIST_SECONDS.time():
+        path = OUTBOX.new_weights_file(global_weights)
+        seq = HISTORY.append(record, path, len(global_weights))
+        OUTBOX.put(seq, dict(record), payload, path)
+    record["seq"] = seq
+
+    rnd.closed = True
+    rnd.accumulator.close()
+    rnd.accumulator = None
+    ROUNDS.retire(rnd)
+    ROUNDS_AGGREGATED.labels(rnd.policy.mode).inc()
+    return dict(record, globalWeights=global_weights)
 
-    return record
+
+def _forward_staged(seq: int) -> Optional[dict]:
+    """把 outbox 中的一个 partial 上传给 root；返回 upstream 摘要，条目正被其他线程上传时返回 None。
+
+    网络错误 / 5xx 时保留条目稍后重试；root 的其他响应（包括 4xx 拒绝）写回历史记录后删除条目。
+    """
+    try:
+        entry = OUTBOX.claim(seq)
+    except ValueError as e:
+        # 条目已按退避重新排队；不让一个损坏的条目中断其它条目的重试
+        log.error("cannot forward staged partial: %s", e)
+        return {"status": "pending", "error": str(e)}
+    if entry is None:
+        return None
+    record = entry["record"]
+
+    t0 = time.perf_counter()
+    body, code = forward_partial(UPSTREAM_URL, entry["payload"])
+    UPSTREAM_SECONDS.labels(code).observe(time.perf_counter() - t0)
+    upstream = summarize_upstream(body, code)
+
+    if code >= 500:
+        delay = OUTBOX.failed(seq)
+        log.warning(
+            "forwarding round %s to %s failed (%d): %s; retrying in %.0fs",
+            record["roundId"], UPSTREAM_URL, code, body.get("error"), delay,
+        )
+        return dict(upstream, status="pending", retryInSec=round(delay, 1))
+
+    if code >= 400:
+        log.error("upstream rejected round %s (%d): %s", record["roundId"], code, body)
+    record["upstream"] = upstream
+    HISTORY.update(seq, record)
+    OUTBOX.done(seq)
+    return upstream
+
+
+def _retry_forwards() -> None:
+    for seq in OUTBOX.pending():
+        _forward_staged(seq)
+
+
+def _start_forwarder(interval: float) -> None:
+    """region 模式：后台重试上传失败（或上次进程退出前没来得及上传）的 partial"""
+    def loop():
+        while True:
+            try:
+                _retry_forwards()
+            except Exception:
+                log.exception("retrying upstream forwards failed")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="upstream-forwarder", daemon=True).start()
+
+
+def _record_on_ledger(round_id: str, model_hash: str) -> None:
+    """后台线程调用 ledger /record_model，不阻塞聚合响应"""
+    def post():
+        t0 = time.perf_counter()
+        outcome = "ok"
+        try:
+            requests.post(
+                LEDGER_URL.rstrip("/") + "/record_model",
+                json={"roundId": round_id, "modelHash": model_hash},
+                timeout=10,
+            )
+        except requests.RequestException as e:
+            outcome = "error"
+            print(f"ledger record_model failed: {e}")
+        LEDGER_SECONDS.labels(outcome).observe(time.perf_counter() - t0)
+
+    threading.Thread(target=post, daemon=True).start()
+
+
+def _load_latest_checkpoint() -> None:
+    """启动时 mmap 最新检查点，恢复 global model（无需重放历史）"""
+    ckpt = CHECKPOINTS.latest()
+    if ckpt is None:
+        return
+    mapped = CHECKPOINTS.load(ckpt)
+    with LOCK:
+        STATE["global_weights"] = mapped
+        STATE["global_round"] = ckpt["roundId"]
+        STATE["global_model"] = ckpt
+
+
+def _discard_round(rnd) -> None:
+    """不聚合，直接关闭并退役（调用方持有 rnd.lock）；之后该 round 的 update 得到 409"""
+    rnd.closed = True
+    if rnd.accumulator is not None:
+        rnd.accumulator.close()
+        rnd.accumulator = None
+    ROUNDS.retire(rnd)
+
+
+def _sweep_deadlines() -> None:
+    """关闭已过 deadline 的 round（没有任何 update 的直接丢弃），并丢弃空闲过久的 round"""
+    for rnd in ROUNDS.idle():
+        with rnd.lock:
+            if rnd.closed or rnd.idle_for() < (ROUNDS.idle_ttl or 0):
+                continue
+            log.warning(
+                "discarding round %s: idle for %.0fs with %d/%d clients",
+                rnd.round_id, rnd.idle_for(), len(rnd.received), len(rnd.expected_clients),
+            )
+            _discard_round(rnd)
+
+    for rnd in ROUNDS.expired():
+        with rnd.lock:
+            if rnd.closed:
+                continue
+            if rnd.received:
+                try:
+                    result = _aggregate_round(rnd)
+                except Exception:
+                    log.exception("aggregating round %s at its deadline failed", rnd.round_id)
+                    continue
+                if UPSTREAM_URL:
+                    OUTBOX.expedite(result["seq"])
+            else:
+                _discard_round(rnd)
+
+
+def _start_deadline_sweeper(interval: float) -> None:
+    def loop():
+        while True:
+            time.sleep(interval)
+            _sweep_deadlines()
+
+    threading.Thread(target=loop, name="round-deadline-sweeper", daemon=True).start()
 
 
 # =========================
 # API
 # =========================
 
-@app.route("/submit_update", methods=["POST"])
-def submit_update():
-    payload = request.get_json(force=True)
+def submit(
+    payload,
+    screen: Optional[Callable[[WeightStats], Optional[str]]] = None,
+) -> Tuple[dict, int]:
+    """处理一个 update（dict 或已解析的 ModelUpdate），返回 (响应 body, HTTP 状态码)。
+
+    /submit_update 与 coordinator 共用此入口。权重在折叠进累加器的同一次遍历中
+    测得 WeightStats；screen(stats) 返回拒绝原因时该 update 被撤销（422）。
+    含 NaN / Inf 的 update 总是被拒绝。
+    """
+    if not metrics.ENABLED:
+        return _submit(payload, screen)
+    t0 = time.perf_counter()
+    body, code = _submit(payload, screen)
+    SUBMIT_SECONDS.labels(code).observe(time.perf_counter() - t0)
+    return body, code
+
 
+def _submit(payload, screen) -> Tuple[dict, int]:
     try:
-        _validate_payload(payload)
+        if not isinstance(payload, ModelUpdate):
+            payload = ModelUpdate.from_dict(payload)
+        # 转换 / 解码放在锁外完成
+        contrib = _to_contribution(payload.weights)
     except ValueError as e:
-        return jsonify({"error": str(e)}), 400
+        return {"error": str(e)}, 400
+    UPDATE_DIM.observe(contrib.dim)
 
-    with LOCK:
-        round_id = payload["roundId"]
-        client_id = payload["clientId"]
+    if ASYNC is not None:
+        return _submit_async(ASYNC, payload, contrib, screen)
+
+    round_id = payload.round_id
+    client_id = payload.client_id
+
+    try:
+        rnd = ROUNDS.get_or_open(round_id)
+    except RoundClosedError:
+        return {"error": "Round already aggregated", "roundId": round_id}, 409
+    except TooManyRoundsError:
+        return {"error": "Too many open rounds"}, 429
+
+    with rnd.lock:
+        if rnd.closed:
+            return {"error": "Round already aggregated", "roundId": round_id}, 409
+
+        if rnd.accumulator is None:
+            rnd.base_round, base = _global_base(contrib.dim)
+            rnd.accumulator = RoundAccumulator(ENGINE, contrib.dim, base=base)
+        acc = rnd.accumulator
+
+        if contrib.needs_base and payload.base_round != rnd.base_round:
+            return {
+                "error": "Stale base model",
+                "globalRound": rnd.base_round
+            }, 409
+
+        try:
+            with FOLD_SECONDS.labels("round").time():
+                replaced, stats = acc.fold(
+                    client_id, contrib, payload.samples, payload.local_acc,
+                    recon_error=payload.recon_error, screen=screen
+                )
+        except UpdateRejected as e:
+            return {
+                "status": "rejected",
+                "reason": e.reason,
+                "measured": e.stats.to_dict()
+            }, 422
+        except ValueError as e:
+            return {"error": str(e)}, 400
+        rnd.touch()
+
+        # 是否满足该 round 的关闭策略
+        if not rnd.ready():
+            return {
+                "status": "waiting",
+                "received": acc.clients,
+                "replaced": replaced,
+                "measured": stats.to_dict()
+            }, 200
+
+        try:
+            result = _aggregate_round(rnd)
+        except Exception:
+            log.exception("aggregating round %s failed", round_id)
+            return {
+                "error": "Aggregation failed; the round stays open and will be retried",
+                "roundId": round_id
+            }, 500
+
+    # region 模式：round 已落盘并退役，在锁外上传给 root
+    if UPSTREAM_URL:
+        result["upstream"] = _forward_staged(result["seq"]) or result["upstream"]
+
+    return {
+        "status": "aggregated",
+        "measured": stats.to_dict(),
+        "result": result
+    }, 200
+
+
+def _submit_async(buf, payload, contrib, screen) -> Tuple[dict, int]:
+    """异步模式：按 baseVersion 计算 staleness 并折叠进缓冲区，攒满 K 个即产出新版本。
+
+    未带 baseVersion 的 update 视为基于当前版本（staleness 0）。
+    """
+    client_id = payload.client_id
+
+    with buf.lock:
+        version = _model_version()
+        base_version = version if payload.base_version is None else payload.base_version
+        if base_version > version:
+            return {
+                "error": "Unknown base model version",
+                "modelVersion": version
+            }, 400
 
-        if STATE["roundId"] is None:
-            STATE["roundId"] = round_id
+        staleness = version - base_version
+        limit = buf.staleness.max_staleness
+        if limit is not None and staleness > limit:
+            return {
+                "error": "Update too stale",
+                "staleness": staleness,
+                "modelVersion": version
+            }, 409
+        # topk 增量只能加到它所基于的那个模型上
+        if contrib.needs_base and staleness:
+            return {
+                "error": "Stale base model",
+                "modelVersion": version
+            }, 409
 
-        if round_id != STATE["roundId"]:
-            return jsonify({
-                "error": "Round mismatch",
-                "currentRound": STATE["roundId"]
-            }), 400
+        if buf.accumulator is None:
+            buf.base_round, base = _global_base(contrib.dim)
+            buf.base_version = version
+            buf.accumulator = RoundAccumulator(ENGINE, contrib.dim, base=base)
+        acc = buf.accumulator
 
-        STATE["updates"][client_id] = payload
+        weight = buf.staleness.weight(staleness)
+        key = buf.key(client_id, base_version)
+        try:
+            with FOLD_SECONDS.labels("async").time():
+                replaced, stats = acc.fold(
+                    key, contrib, payload.samples * weight, payload.local_acc,
+                    recon_error=payload.recon_error, screen=screen
+                )
+        except UpdateRejected as e:
+            return {
+                "status": "rejected",
+                "reason": e.reason,
+                "measured": e.stats.to_dict()
+            }, 422
+        except ValueError as e:
+            return {"error": str(e)}, 400
 
-        # 是否已收齐
-        if STATE["expected_clients"].issubset(STATE["updates"].keys()):
-            result = _aggregate_round(round_id)
-            STATE["roundId"] = None
-            return jsonify({
+        buf.entries[key] = (payload.samples, staleness)
+        buf.updates += 1
+        STALENESS.observe(staleness)
+
+        if buf.ready():
+            try:
+                result = _flush_async(buf)
+            except Exception:
+                log.exception("publishing async model version %d failed", buf.base_version + 1)
+                return {
+                    "error": "Aggregation failed; the buffer is kept and will be retried",
+                    "modelVersion": version
+                }, 500
+            return {
                 "status": "aggregated",
+                "staleness": staleness,
+                "stalenessWeight": round(weight, 6),
+                "measured": stats.to_dict(),
+                "modelVersion": result["modelVersion"],
                 "result": result
-            })
+            }, 200
+
+        return {
+            "status": "buffered",
+            "staleness": staleness,
+            "stalenessWeight": round(weight, 6),
+            "buffered": len(buf.entries),
+            "bufferSize": buf.size,
+            "replaced": replaced,
+            "measured": stats.to_dict(),
+            "modelVersion": version
+        }, 200
+
+
+def _describe(rnd) -> dict:
+    with rnd.lock:
+        return rnd.describe()
+
+
+def _int_arg(args: Mapping[str, str], name: str, default: Optional[int]) -> Optional[int]:
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an int") from None
+
+
+# ---- 与框架无关的处理函数（Flask 路由与 asgi.py 共用）----
+
+def open_round_request(body) -> Tuple[dict, int]:
+    """显式打开 round：{roundId, expectedClients?, policy?: {mode, quorum, deadlineSec},
+    aggregation?: {rule, trimRatio, byzantine, select}}"""
+    if ASYNC is not None:
+        return {"error": "Rounds are not used in async mode"}, 409
+    if not isinstance(body, dict) or not isinstance(body.get("roundId"), str):
+        return {"error": "Field `roundId` must be str"}, 400
+
+    expected = body.get("expectedClients")
+    if expected is not None and (
+        not isinstance(expected, list) or not all(isinstance(c, str) for c in expected)
+    ):
+        return {"error": "Field `expectedClients` must be a list of str"}, 400
+
+    policy = None
+    if body.get("policy") is not None:
+        p = body["policy"]
+        try:
+            policy = ClosePolicy(
+                mode=p.get("mode", "all"),
+                quorum=p.get("quorum"),
+                deadline_s=p.get("deadlineSec"),
+            )
+        except (AttributeError, ValueError) as e:
+            return {"error": f"Invalid policy: {e}"}, 400
+
+    # all 策略下没有 expected client 的 round 永远不会关闭
+    mode = policy.mode if policy is not None else ROUNDS.default_policy.mode
+    if expected is not None and not expected and mode == "all":
+        return {"error": "`expectedClients` cannot be empty with the `all` close policy"}, 400
+
+    rule = None
+    if body.get("aggregation") is not None:
+        a = body["aggregation"]
+        try:
+            rule = AggregationRule(
+                name=a.get("rule", "fedavg"),
+                trim_ratio=a.get("trimRatio", 0.1),
+                byzantine=a.get("byzantine", 1),
+                select=a.get("select"),
+            )
+        except (AttributeError, ValueError) as e:
+            return {"error": f"Invalid aggregation: {e}"}, 400
+
+    try:
+        rnd = ROUNDS.open(body["roundId"], expected_clients=expected, policy=policy, rule=rule)
+    except RoundClosedError:
+        return {"error": "Round already aggregated"}, 409
+    except TooManyRoundsError:
+        return {"error": "Too many open rounds"}, 429
+    except ValueError as e:
+        return {"error": str(e)}, 409
+
+    return _describe(rnd), 200
+
+
+def abort_round_request(round_id: str) -> Tuple[dict, int]:
+    """丢弃一个未关闭的 round（不聚合），释放其 max_open 名额"""
+    rnd = ROUNDS.get(round_id)
+    if rnd is None:
+        return {"error": "Round not open", "roundId": round_id}, 404
+    with rnd.lock:
+        if rnd.closed:
+            return {"error": "Round not open", "roundId": round_id}, 404
+        info = rnd.describe()
+        _discard_round(rnd)
+    return dict(info, status="aborted"), 200
+
+
+def rounds_info() -> List[dict]:
+    return [_describe(r) for r in ROUNDS.snapshot()]
+
+
+def status_info() -> dict:
+    # currentRound / receivedClients 保留给旧版 dashboard：取最近打开的 round
+    open_rounds = ROUNDS.snapshot()
+    latest = _describe(open_rounds[-1]) if open_rounds else None
+
+    return {
+        "currentRound": latest["roundId"] if latest else None,
+        "receivedClients": latest["receivedClients"] if latest else [],
+        "openRounds": [r.round_id for r in open_rounds],
+        "historyRounds": HISTORY.count(),
+        "region": REGION_ID,
+        "upstream": UPSTREAM_URL,
+        "modelVersion": _model_version(),
+        "mode": "async" if ASYNC is not None else "rounds",
+        "async": _describe_async()
+    }
+
+
+def _describe_async() -> Optional[dict]:
+    if ASYNC is None:
+        return None
+    with ASYNC.lock:
+        return ASYNC.describe()
+
+
+def global_model_info() -> dict:
+    with LOCK:
+        gw = STATE["global_weights"]
+        ckpt = STATE["global_model"]
+        round_id = STATE["global_round"]
+
+    return {
+        "roundId": round_id,
+        "version": ckpt["version"] if ckpt else None,
+        "sha256": ckpt["sha256"] if ckpt else None,
+        "weights": gw.tolist() if gw is not None else None
+    }
+
+
+def models_request(args: Mapping[str, str]) -> Tuple[Any, int]:
+    """最近的检查点版本列表：?limit=（默认 50，最多 1000）"""
+    try:
+        limit = _int_arg(args, "limit", 50)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return CHECKPOINTS.versions(min(max(limit, 1), 1000)), 200
+
+
+def _model_info(version: str):
+    if version == "latest":
+        return CHECKPOINTS.latest()
+    if not version.isdigit():
+        return None
+    return CHECKPOINTS.get(int(version))
+
+
+def model_weights_headers(info: dict) -> Dict[str, str]:
+    return {
+        "X-Model-Version": str(info["version"]),
+        "X-Model-Sha256": info["sha256"],
+        "X-Weights-Dtype": WEIGHTS_DTYPE,
+    }
+
+
+def history_request(args: Mapping[str, str]) -> Tuple[dict, int]:
+    """分页历史：?limit=&after=（向后翻页）或 ?limit=&before=；默认不含权重"""
+    try:
+        limit = min(max(_int_arg(args, "limit", 50), 1), 1000)
+        after = _int_arg(args, "after", None)
+        before = _int_arg(args, "before", None)
+    except ValueError as e:
+        return {"error": str(e)}, 400
 
-        return jsonify({
-            "status": "waiting",
-            "received": list(STATE["updates"].keys())
-        })
+    include_weights = args.get("weights", "0").lower() in ("1", "true")
+
+    return HISTORY.page(
+        limit=limit, after=after, before=before, include_weights=include_weights
+    ), 200
+
+
+# ---- Flask 路由（开发服务器；生产部署见 asgi.py）----
+
+@app.route("/submit_update", methods=["POST"])
+def submit_update():
+    try:
+        payload = parse_upload(request.get_data(), request.mimetype)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    body, code = submit(payload)
+    return jsonify(body), code
+
+
+# client_lib.send_update(wire="auto") 通过 OPTIONS 读取该头协商格式
+ACCEPT_POST = f"{JSON_CONTENT_TYPE}, {WIRE_CONTENT_TYPE}"
+
+
+@app.after_request
+def _advertise_wire_formats(resp):
+    if request.path == "/submit_update":
+        resp.headers["Accept-Post"] = ACCEPT_POST
+    return resp
+
+
+@app.route("/rounds", methods=["POST"])
+def open_round():
+    body, code = open_round_request(request.get_json(force=True, silent=True))
+    return jsonify(body), code
+
+
+@app.route("/rounds/<round_id>", methods=["DELETE"])
+def abort_round(round_id: str):
+    body, code = abort_round_request(round_id)
+    return jsonify(body), code
+
+
+@app.route("/rounds", methods=["GET"])
+def list_rounds():
+    return jsonify(rounds_info())
 
 
 @app.route("/status", methods=["GET"])
 def status():
-    with LOCK:
-        return jsonify({
-            "currentRound": STATE["roundId"],
-            "receivedClients": list(STATE["updates"].keys()),
-            "historyRounds": len(STATE["history"])
-        })
+    return jsonify(status_info())
+
+
+@app.route("/global_model", methods=["GET"])
+def global_model():
+    return jsonify(global_model_info())
+
+
+@app.route("/models", methods=["GET"])
+def list_models():
+    body, code = models_request(request.args)
+    return jsonify(body), code
+
+
+@app.route("/models/<version>", methods=["GET"])
+def model_info(version: str):
+    info = _model_info(version)
+    if info is None:
+        return jsonify({"error": "Model version not found"}), 404
+    return jsonify(info)
+
+
+@app.route("/models/<version>/weights", methods=["GET"])
+def model_weights(version: str):
+    """按版本流式返回检查点原始字节，支持 Range 分段下载"""
+    info = _model_info(version)
+    if info is None:
+        return jsonify({"error": "Model version not found"}), 404
+
+    resp = send_file(
+        CHECKPOINTS.path(info), mimetype="application/octet-stream", conditional=True
+    )
+    resp.headers.update(model_weights_headers(info))
+    return resp
 
 
 @app.route("/history", methods=["GET"])
 def history():
-    with LOCK:
-        return jsonify(STATE["history"])
+    body, code = history_request(request.args)
+    return jsonify(body), code
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_text():
+    """Prometheus 文本格式；FL_METRICS=0 时 404"""
+    text = metrics.snapshot()
+    if text is None:
+        return jsonify({"error": "Metrics disabled"}), 404
+    return text, 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+@app.route("/history/<round_id>/weights", methods=["GET"])
+def history_weights(round_id: str):
+    """以原始 little-endian float64 字节流返回该轮 global weights"""
+    path = HISTORY.weights_path(round_id)
+    if path is None:
+        return jsonify({"error": "Round not found"}), 404
+
+    resp = send_file(path, mimetype="application/octet-stream", conditional=True)
+    resp.headers["X-Weights-Dtype"] = WEIGHTS_DTYPE
+    return resp
 
 
 # =========================
 # 启动
 # =========================
 
+def build_parser(description: str = "FedAvg aggregator"):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--engine", choices=available_engines(), default="auto")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64")
+    parser.add_argument("--policy", choices=CLOSE_MODES, default="all",
+                        help="default close policy for implicitly opened rounds")
+    parser.add_argument("--quorum", type=int, default=None)
+    parser.add_argument("--deadline", type=float, default=None, help="seconds")
+    parser.add_argument("--aggregation", choices=RULES, default="fedavg",
+                        help="default aggregation rule (robust rules buffer every update of a round)")
+    parser.add_argument("--trim-ratio", type=float, default=0.1, help="trimmed_mean: fraction cut per side")
+    parser.add_argument("--byzantine", type=int, default=1, help="krum / multi_krum: assumed bad clients f")
+    parser.add_argument("--max-open-rounds", type=int, default=64)
+    parser.add_argument("--round-idle-ttl", type=float, default=3600,
+                        help="discard open rounds that receive no update for this many seconds (0 = never)")
+    parser.add_argument("--async-buffer", type=int, default=0, metavar="K",
+                        help="asynchronous mode: ignore rounds and publish a new model every K updates "
+                             "(0 = off)")
+    parser.add_argument("--staleness", choices=STALENESS_MODES, default="polynomial",
+                        help="async mode: how updates trained on older model versions are down-weighted")
+    parser.add_argument("--staleness-alpha", type=float, default=0.5,
+                        help="async mode: polynomial exponent / hinge slope")
+    parser.add_argument("--staleness-hinge", type=int, default=4,
+                        help="async mode: hinge staleness below which updates keep full weight")
+    parser.add_argument("--max-staleness", type=int, default=None,
+                        help="async mode: reject updates more than this many versions behind")
+    parser.add_argument("--server-lr", type=float, default=1.0,
+                        help="async mode: how far each buffer moves the global model, in (0, 1]")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="round history / checkpoint storage")
+    parser.add_argument("--ledger-url", default=None,
+                        help="record each model checkpoint hash on the ledger, e.g. http://localhost:4000")
+    parser.add_argument("--upstream", default=None,
+                        help="run as a regional aggregator forwarding each round to this root, "
+                             "e.g. http://root:8000")
+    parser.add_argument("--region-id", default=None,
+                        help="client id used at the root (default: region-<port>)")
+    parser.add_argument("--expected", default=None,
+                        help="comma separated default expectedClients for implicitly opened rounds")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    return parser
+
+
+def configure(args) -> None:
+    """按命令行参数设置模块级状态（python aggregator.py 与 asgi.py 共用）"""
+    global HISTORY, CHECKPOINTS, LEDGER_URL, UPSTREAM_URL, REGION_ID, ENGINE, ASYNC, OUTBOX
+
+    HISTORY = HistoryStore(args.data_dir)
+    CHECKPOINTS = CheckpointStore(os.path.join(args.data_dir, "checkpoints"))
+    LEDGER_URL = args.ledger_url
+    UPSTREAM_URL = args.upstream
+    if UPSTREAM_URL:
+        REGION_ID = args.region_id or f"region-{args.port}"
+        OUTBOX = ForwardOutbox(os.path.join(args.data_dir, "outbox"))
+        _start_forwarder(interval=1.0)
+    _load_latest_checkpoint()
+
+    ENGINE = get_engine(args.engine, dtype=args.dtype)
+    print(f"aggregation engine: {ENGINE.name}")
+
+    ROUNDS.default_policy = ClosePolicy(args.policy, args.quorum, args.deadline)
+    ROUNDS.default_rule = AggregationRule(args.aggregation, args.trim_ratio, args.byzantine)
+    ROUNDS.max_open = args.max_open_rounds
+    ROUNDS.idle_ttl = args.round_idle_ttl or None
+    if args.expected:
+        ROUNDS.default_expected = frozenset(args.expected.split(","))
+
+    if args.async_buffer:
+        if UPSTREAM_URL:
+            raise SystemExit("--async-buffer cannot be combined with --upstream")
+        ASYNC = AsyncBuffer(
+            args.async_buffer,
+            StalenessPolicy(
+                args.staleness, args.staleness_alpha, args.staleness_hinge, args.max_staleness
+            ),
+            server_lr=args.server_lr,
+        )
+        print(f"async mode: new model every {args.async_buffer} updates, staleness={args.staleness}")
+    _start_deadline_sweeper(interval=0.5)
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000, debug=True)
+    # Flask 开发服务器，仅用于本地调试；部署请用 python asgi.py（uvicorn）
+    parser = build_parser()
+    parser.add_argument("--debug", action="store_true", help="enable the Flask debugger and reloader")
+    args = parser.parse_args()
+    configure(args)
+
+    app.run(host=args.host, port=args.port, debug=args.debug, threaded=True)
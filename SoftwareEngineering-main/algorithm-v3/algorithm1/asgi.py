@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import os
+import shlex
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
+
+try:
+    from . import aggregator as core
+except ImportError:  # 以脚本方式运行 (python asgi.py)
+    import aggregator as core
+
+
+# =========================
+# 生产部署入口（FastAPI + uvicorn）
+# =========================
+#
+#   python asgi.py --port 8000 [aggregator.py 的全部参数]
+#   AGGREGATOR_ARGS="--policy quorum --quorum 80" uvicorn algorithm1.asgi:app --port 8000
+#
+# 与 aggregator.py 的 Flask 路由共用同一组处理函数与模块级状态；
+# 解析 / 折叠等 CPU 工作与会等待 round 锁的调用都放到线程池，事件循环只负责 I/O。
+#
+# round 的累加器在进程内存中，因此只能跑 1 个 worker 进程。
+# 需要多个进程时按 region 拆分（--upstream / --region-id，见 hierarchy.py）。
+
+_CONFIGURED = False
+
+
+def _configure(args) -> None:
+    global _CONFIGURED
+    core.configure(args)
+    _CONFIGURED = True
+
+
+@asynccontextmanager
+async def _lifespan(_app):
+    # 通过 uvicorn module:app 启动时，从环境变量读取参数
+    if not _CONFIGURED:
+        _configure(core.build_parser().parse_args(shlex.split(os.environ.get("AGGREGATOR_ARGS", ""))))
+    yield
+
+
+app = FastAPI(title="FedAvg Aggregator", lifespan=_lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+class _JSON(JSONResponse):
+    # 与 Flask jsonify 一致：被拒绝 update 的实测统计可能含 NaN / Infinity
+    def render(self, content) -> bytes:
+        return json.dumps(content, separators=(",", ":")).encode()
+
+
+def _submit(data: bytes, mimetype: str):
+    try:
+        payload = core.parse_upload(data, mimetype)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    return core.submit(payload)
+
+
+@app.post("/submit_update")
+async def submit_update(request: Request):
+    data = await request.body()
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+    body, code = await run_in_threadpool(_submit, data, mimetype)
+    return _JSON(body, status_code=code, headers={"Accept-Post": core.ACCEPT_POST})
+
+
+@app.options("/submit_update")
+def submit_update_options():
+    # client_lib.send_update(wire="auto") 通过 Accept-Post 协商格式
+    return Response(headers={"Allow": "OPTIONS, POST", "Accept-Post": core.ACCEPT_POST})
+
+
+@app.post("/rounds")
+async def open_round(request: Request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    result, code = await run_in_threadpool(core.open_round_request, body)
+    return _JSON(result, status_code=code)
+
+
+# 以下为同步函数，FastAPI 自动放到线程池执行
+
+@app.delete("/rounds/{round_id}")
+def abort_round(round_id: str):
+    result, code = core.abort_round_request(round_id)
+    return _JSON(result, status_code=code)
+
+
+@app.get("/rounds")
+def list_rounds():
+    return _JSON(core.rounds_info())
+
+
+@app.get("/status")
+def status():
+    return _JSON(core.status_info())
+
+
+@app.get("/global_model")
+def global_model():
+    return _JSON(core.global_model_info())
+
+
+@app.get("/models")
+def list_models(request: Request):
+    body, code = core.models_request(request.query_params)
+    return _JSON(body, status_code=code)
+
+
+@app.get("/models/{version}")
+def model_info(version: str):
+    info = core._model_info(version)
+    if info is None:
+        return _JSON({"error": "Model version not found"}, status_code=404)
+    return _JSON(info)
+
+
+@app.get("/models/{version}/weights")
+def model_weights(version: str):
+    """按版本流式返回检查点原始字节，支持 Range 分段下载"""
+    info = core._model_info(version)
+    if info is None:
+        return _JSON({"error": "Model version not found"}, status_code=404)
+    return FileResponse(
+        core.CHECKPOINTS.path(info), media_type="application/octet-stream",
+        headers=core.model_weights_headers(info),
+    )
+
+
+@app.get("/history")
+def history(request: Request):
+    body, code = core.history_request(request.query_params)
+    return _JSON(body, status_code=code)
+
+
+@app.get("/metrics")
+def metrics_text():
+    text = core.metrics.snapshot()
+    if text is None:
+        return _JSON({"error": "Metrics disabled"}, status_code=404)
+    return Response(text, media_type=core.metrics.CONTENT_TYPE)
+
+
+@app.get("/history/{round_id}/weights")
+def history_weights(round_id: str):
+    path = core.HISTORY.weights_path(round_id)
+    if path is None:
+        return _JSON({"error": "Round not found"}, status_code=404)
+    return FileResponse(
+        path, media_type="application/octet-stream",
+        headers={"X-Weights-Dtype": core.WEIGHTS_DTYPE},
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = core.build_parser("FedAvg aggregator (ASGI / uvicorn)")
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+    _configure(args)
+
+    # 单 worker：round 状态在进程内（见文件头注释）。
+    # keep-alive 超时放宽到 30s：大轮次里 client 的连接可能空闲数秒后才复用
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level,
+                timeout_keep_alive=30)
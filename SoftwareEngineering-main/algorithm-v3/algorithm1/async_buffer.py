@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional, Tuple
+
+try:
+    from . import metrics
+    from .round_registry import LOCK_WAIT
+except ImportError:  # 以脚本方式运行
+    import metrics
+    from round_registry import LOCK_WAIT
+
+
+# =========================
+# 异步缓冲聚合（FedBuff）
+# =========================
+#
+# 不再等一轮的 expected_clients 全部到齐：update 随到随折叠进缓冲区，
+# 每攒满 K 个就产出一个新的 global model（新的检查点版本）。
+#
+# client 上传时带 baseVersion（训练所基于的检查点版本），
+# staleness = 当前版本 - baseVersion。缓冲区内按 samples * s(staleness) 加权平均，
+# 再按 server_lr * 平均 s 与当前 global model 混合：
+#
+#   avg = Σ n_i s_i w_i / Σ n_i s_i
+#   new = global + server_lr * s̄ * (avg - global),   s̄ = Σ n_i s_i / Σ n_i
+#
+# 全部为新鲜 update（s = 1）且 server_lr = 1 时 new = avg，即 K 个 client 的 FedAvg。
+
+STALENESS_MODES = ("constant", "polynomial", "hinge")
+
+
+@dataclass(frozen=True)
+class StalenessPolicy:
+    """staleness -> 权重 s(τ) ∈ (0, 1]（FedAsync 的三种形式）。
+
+    - constant:   s = 1
+    - polynomial: s = (1 + τ) ^ -alpha
+    - hinge:      τ <= hinge_b 时 s = 1，否则 s = 1 / (alpha * (τ - hinge_b) + 1)
+
+    max_staleness 不为 None 时，τ 超过它的 update 直接拒绝。
+    """
+    mode: str = "polynomial"
+    alpha: float = 0.5
+    hinge_b: int = 4
+    max_staleness: Optional[int] = None
+
+    def __post_init__(self):
+        if self.mode not in STALENESS_MODES:
+            raise ValueError(f"Unknown staleness mode: {self.mode}")
+        if not isinstance(self.alpha, (int, float)) or self.alpha < 0:
+            raise ValueError("`alpha` must be a non-negative number")
+        if not isinstance(self.hinge_b, int) or self.hinge_b < 0:
+            raise ValueError("`hinge_b` must be a non-negative int")
+        if self.max_staleness is not None and (
+            not isinstance(self.max_staleness, int) or self.max_staleness < 0
+        ):
+            raise ValueError("`max_staleness` must be a non-negative int")
+
+    def weight(self, staleness: int) -> float:
+        if self.mode == "polynomial":
+            return (1.0 + staleness) ** -self.alpha
+        if self.mode == "hinge" and staleness > self.hinge_b:
+            return 1.0 / (self.alpha * (staleness - self.hinge_b) + 1.0)
+        return 1.0
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class AsyncBuffer:
+    """异步模式的缓冲区状态；accumulator 与字段读写都在 self.lock 下进行。
+
+    accumulator 是普通的 RoundAccumulator，按 "clientId@v<baseVersion>" 记录：
+    同一 client 基于同一版本重复提交时替换旧 update，基于不同版本的提交各算一次到达。
+    """
+
+    def __init__(self, size: int, staleness: Optional[StalenessPolicy] = None, server_lr: float = 1.0):
+        if not isinstance(size, int) or size < 1:
+            raise ValueError("buffer size must be a positive int")
+        if not isinstance(server_lr, (int, float)) or not 0 < server_lr <= 1:
+            raise ValueError("`server_lr` must be in (0, 1]")
+        self.size = size
+        self.staleness = staleness or StalenessPolicy()
+        self.server_lr = float(server_lr)
+        self.lock = metrics.timed_lock(threading.Lock(), LOCK_WAIT, "async")
+        self.accumulator = None
+        self.base_version = 0           # accumulator 创建时的检查点版本（0 = 还没有 global model）
+        self.base_round: Optional[str] = None
+        self.entries: Dict[str, Tuple[int, int]] = {}   # key -> (samples, staleness)
+        self.opened_at = time.monotonic()
+        self.flushes = 0
+        self.updates = 0
+
+    @staticmethod
+    def key(client_id: str, base_version: int) -> str:
+        return f"{client_id}@v{base_version}"
+
+    def ready(self) -> bool:
+        return self.accumulator is not None and len(self.accumulator) >= self.size
+
+    def reset(self) -> None:
+        """产出新模型后清空（调用方需持有 self.lock）"""
+        self.accumulator = None
+        self.entries = {}
+        self.opened_at = time.monotonic()
+        self.flushes += 1
+
+    def summary(self) -> Dict:
+        """本次缓冲区的 samples / staleness 汇总（写入历史记录）"""
+        samples = sum(n for n, _ in self.entries.values())
+        stale = [s for _, s in self.entries.values()]
+        return {
+            "bufferSize": self.size,
+            "totalSamples": samples,
+            "meanStaleness": round(sum(stale) / len(stale), 4) if stale else 0,
+            "maxStaleness": max(stale, default=0),
+            "staleness": self.staleness.to_dict(),
+            "serverLr": self.server_lr,
+        }
+
+    def describe(self) -> Dict:
+        return {
+            "bufferSize": self.size,
+            "buffered": len(self.entries),
+            "bufferedClients": sorted(self.entries),
+            "baseVersion": self.base_version,
+            "staleness": self.staleness.to_dict(),
+            "serverLr": self.server_lr,
+            "flushes": self.flushes,
+            "updates": self.updates,
+            "ageSec": round(time.monotonic() - self.opened_at, 3),
+        }
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时用 mmap + memoryview
+    np = None
+
+
+# =========================
+# Global model 版本化检查点
+# =========================
+#
+#   <root>/model-v000001.f64     little-endian float64 原始字节（不可变）
+#   <root>/model-v000001.json    {version, roundId, sha256, dim, file, timestamp}
+#   <root>/LATEST.json           指向最新版本的 sidecar 内容
+#
+# sha256 对权重原始字节计算，即 ledger RecordModelVersion 的 modelHash。
+# 文件写完后不再修改，启动时直接 mmap 最新版本，不占 Python 堆。
+
+WEIGHTS_DTYPE = "float64"
+
+_LITTLE = sys.byteorder == "little"
+
+
+def _write_json(path: str, obj: Dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+class CheckpointStore:
+    """按版本号递增保存 global model（线程安全）"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _sidecar(self, version: int) -> str:
+        return os.path.join(self.root, f"model-v{version:06d}.json")
+
+    def save(self, round_id: str, weights: Sequence[float], timestamp: str) -> Dict:
+        """写入新版本并返回其 info；权重先写临时文件，再原子 rename"""
+        os.makedirs(self.root, exist_ok=True)
+
+        buf = array("d", weights)
+        if not _LITTLE:
+            buf.byteswap()
+        digest = hashlib.sha256(memoryview(buf).cast("B")).hexdigest()
+
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(memoryview(buf).cast("B"))
+
+        with self._lock:
+            latest = self.latest()
+            version = latest["version"] + 1 if latest else 1
+            name = f"model-v{version:06d}.f64"
+            os.replace(tmp, os.path.join(self.root, name))
+
+            info = {
+                "version": version,
+                "roundId": round_id,
+                "sha256": digest,
+                "dim": len(buf),
+                "file": name,
+                "timestamp": timestamp,
+            }
+            _write_json(self._sidecar(version), info)
+            _write_json(os.path.join(self.root, "LATEST.json"), info)
+            return info
+
+    def latest(self) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self.root, "LATEST.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get(self, version: int) -> Optional[Dict]:
+        try:
+            with open(self._sidecar(version)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def versions(self, limit: int = 50) -> List[Dict]:
+        """最近 limit 个版本（升序）"""
+        latest = self.latest()
+        if latest is None:
+            return []
+        first = max(1, latest["version"] - limit + 1)
+        infos = (self.get(v) for v in range(first, latest["version"] + 1))
+        return [i for i in infos if i is not None]
+
+    def path(self, info: Dict) -> str:
+        return os.path.join(self.root, info["file"])
+
+    def load(self, info: Dict):
+        """只读 mmap 该版本的权重：numpy 时为 np.memmap，否则为 memoryview"""
+        path = self.path(info)
+        if np is not None:
+            return np.memmap(path, dtype="<f8", mode="r")
+
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if _LITTLE:
+            return memoryview(mm).cast("d")
+        # 大端机器只能拷贝一次做字节序转换
+        buf = array("d", mm[:])
+        buf.byteswap()
+        return buf
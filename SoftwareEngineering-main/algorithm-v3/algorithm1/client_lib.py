@@ -7,6 +7,22 @@ import datetime
 import typing as t
 import requests
 import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # rng="numpy" / 批量生成需要 numpy
+    np = None
+
+try:
+    from .compression import CODECS
+    from .wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, MAGIC as WIRE_MAGIC, encode_update
+except ImportError:  # 以脚本方式运行 / hospital_*.py 直接 import client_lib
+    from compression import CODECS
+    from wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, MAGIC as WIRE_MAGIC, encode_update
+
+# base_url -> 服务端是否接受二进制格式（wire="auto" 协商结果缓存）
+_WIRE_SUPPORT: t.Dict[str, bool] = {}
 
 
 def _derive_seed(round_id: str, client_id: str) -> int:
@@ -14,12 +30,49 @@ def _derive_seed(round_id: str, client_id: str) -> int:
     return int(h, 16) % (2 ** 32)
 
 
-def generate_update(round_id: str, client_id: str, weights_len: int = 20, steps: int = 5) -> dict:
+def _samples_for(client_id: str) -> int:
+    # 固定样本量
+    return 120 if client_id == "HospitalA" else 80
+
+
+def _round_num(round_id: str) -> int:
+    # 解析 round number（若 roundId 末尾包含数字则使用），用于表现 accuracy 随轮次略微上升
+    m = re.search(r"(\d+)$", round_id)
+    if m:
+        return int(m.group(1))
+    # fallback deterministic small number
+    return int(hashlib.sha256(round_id.encode()).hexdigest(), 16) % 20
+
+
+def _local_acc(client_id: str, round_num: int, jitter: float) -> float:
+    base = 0.6 if client_id == "HospitalA" else 0.55
+    local_acc = base + 0.01 * min(round_num, 20) + jitter
+    return max(0.0, min(1.0, local_acc))
+
+
+def generate_update(
+    round_id: str,
+    client_id: str,
+    weights_len: int = 20,
+    steps: int = 5,
+    rng: str = "python",
+    as_array: bool = False,
+) -> dict:
     """生成可复现的本地更新。
 
     - 使用 round_id 与 client_id 派生 seed，保证同一 round+client 可复现。
     - 返回字典严格匹配要求的 JSON schema（除了 timestamp 可不同）。
+    - rng="python"（默认）：random.Random 位流，与历史版本输出逐位一致。
+    - rng="numpy"：向量化 PCG64 位流（见 generate_updates_batch），同样按 seed 可复现，
+      但数值与 rng="python" 不同；as_array=True 时 weights 保留为 float64 ndarray。
     """
+    if rng == "numpy":
+        return generate_updates_batch(
+            [(round_id, client_id)], weights_len, steps, as_array=as_array
+        )[0]
+    if rng != "python":
+        raise ValueError(f"Unknown rng: {rng}")
+
     seed = _derive_seed(round_id, client_id)
     rnd = random.Random(seed)
 
@@ -33,20 +86,8 @@ def generate_update(round_id: str, client_id: str, weights_len: int = 20, steps:
         weights = [w - lr * g for w, g in zip(weights, grads)]
         lr *= 0.9
 
-    # 固定样本量
-    samples = 120 if client_id == "HospitalA" else 80
-
-    # 解析 round number（若 roundId 末尾包含数字则使用），用于表现 accuracy 随轮次略微上升
-    m = re.search(r"(\d+)$", round_id)
-    if m:
-        round_num = int(m.group(1))
-    else:
-        # fallback deterministic small number
-        round_num = int(hashlib.sha256(round_id.encode()).hexdigest(), 16) % 20
-
-    base = 0.6 if client_id == "HospitalA" else 0.55
-    local_acc = base + 0.01 * min(round_num, 20) + rnd.uniform(-0.002, 0.002)
-    local_acc = max(0.0, min(1.0, local_acc))
+    samples = _samples_for(client_id)
+    local_acc = _local_acc(client_id, _round_num(round_id), rnd.uniform(-0.002, 0.002))
 
     timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
 
@@ -62,16 +103,213 @@ def generate_update(round_id: str, client_id: str, weights_len: int = 20, steps:
     return payload
 
 
-def send_update(base_url: str, payload: dict, timeout: int = 10) -> requests.Response:
-    """POST 更新到聚合器并返回 Response。发生请求错误则抛出异常。"""
-    url = base_url.rstrip("/") + "/fl/upload_update"
+def generate_updates_batch(
+    pairs: t.Sequence[t.Tuple[str, str]],
+    weights_len: int = 20,
+    steps: int = 5,
+    as_array: bool = False,
+) -> t.List[dict]:
+    """一次生成多组 (round_id, client_id) 的更新（rng="numpy" 位流）。
+
+    每行使用 _derive_seed 派生的独立 PCG64，一次调用取出该行全部噪声，
+    伪梯度下降对整批 (batch, weights_len) 矩阵做向量化更新。
+    任意一行的结果都与单独调用 generate_update(..., rng="numpy") 相同。
+    """
+    if np is None:
+        raise RuntimeError("rng='numpy' requires numpy")
+    if not pairs:
+        return []
+
+    # draws[i] = [init, noise_1 .. noise_steps, jitter]
+    draws = np.empty((len(pairs), steps + 1, weights_len))
+    jitter = np.empty(len(pairs))
+    for i, (round_id, client_id) in enumerate(pairs):
+        g = np.random.Generator(np.random.PCG64(_derive_seed(round_id, client_id)))
+        draws[i] = g.standard_normal((steps + 1, weights_len))
+        jitter[i] = g.uniform(-0.002, 0.002)
+
+    weights = draws[:, 0, :].copy()
+    lr = 0.1
+    for s in range(steps):
+        # w <- w - lr * (w + 0.1 * noise)
+        grads = weights + 0.1 * draws[:, s + 1, :]
+        weights -= lr * grads
+        lr *= 0.9
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    payloads = []
+    for i, (round_id, client_id) in enumerate(pairs):
+        local_acc = _local_acc(client_id, _round_num(round_id), float(jitter[i]))
+        payloads.append({
+            "roundId": round_id,
+            "clientId": client_id,
+            "weights": weights[i] if as_array else weights[i].tolist(),
+            "samples": _samples_for(client_id),
+            "localAcc": float(round(local_acc, 6)),
+            "timestamp": timestamp,
+        })
+    return payloads
+
+
+def iter_updates(
+    pairs: t.Iterable[t.Tuple[str, str]],
+    weights_len: int = 20,
+    steps: int = 5,
+    batch_size: int = 64,
+    as_array: bool = False,
+) -> t.Iterator[dict]:
+    """惰性生成更新：每次只物化 batch_size 个 payload，适合大规模模拟"""
+    batch: t.List[t.Tuple[str, str]] = []
+    for pair in pairs:
+        batch.append(pair)
+        if len(batch) >= batch_size:
+            yield from generate_updates_batch(batch, weights_len, steps, as_array=as_array)
+            batch = []
+    if batch:
+        yield from generate_updates_batch(batch, weights_len, steps, as_array=as_array)
+
+
+def _accepts_binary(url: str, timeout: int) -> bool:
+    """OPTIONS 一次目标地址，看 Accept-Post 是否包含二进制格式（结果按 url 缓存）"""
+    if url not in _WIRE_SUPPORT:
+        try:
+            resp = requests.options(url, timeout=timeout)
+            _WIRE_SUPPORT[url] = WIRE_CONTENT_TYPE in resp.headers.get("Accept-Post", "")
+        except requests.RequestException:
+            _WIRE_SUPPORT[url] = False
+    return _WIRE_SUPPORT[url]
+
+
+def fetch_global_model(base_url: str, timeout: int = 10) -> t.Tuple[t.Optional[str], t.Optional[t.List[float]]]:
+    """获取聚合器当前 global model，返回 (roundId, weights)；topk 压缩需以此为基准"""
+    resp = requests.get(base_url.rstrip("/") + "/global_model", timeout=timeout)
+    resp.raise_for_status()
+    body = resp.json()
+    return body.get("roundId"), body.get("weights")
+
+
+def fetch_model(
+    base_url: str,
+    version: t.Union[int, str] = "latest",
+    chunk_bytes: int = 4 << 20,
+    timeout: int = 10,
+) -> t.Tuple[dict, array]:
+    """按 Range 分段下载某个 global model 版本，校验 sha256 后返回 (info, weights)。
+
+    weights 为 array('d')；检查点格式见 checkpoints.py（little-endian float64）。
+    """
+    models = base_url.rstrip("/") + "/models"
+    info = requests.get(f"{models}/{version}", timeout=timeout)
+    info.raise_for_status()
+    info = info.json()
+
+    # "latest" 解析成具体版本号后再分段下载，避免中途有新版本
+    url = f"{models}/{info['version']}/weights"
+
+    total = info["dim"] * 8
+    digest = hashlib.sha256()
+    buf = bytearray()
+    with requests.Session() as s:
+        while len(buf) < total:
+            end = min(len(buf) + chunk_bytes, total) - 1
+            resp = s.get(
+                url,
+                headers={"Range": f"bytes={len(buf)}-{end}"},
+                timeout=timeout,
+            )
+            resp.raise_for_status()
+            if not resp.content:
+                break
+            buf += resp.content
+            digest.update(resp.content)
+
+    if digest.hexdigest() != info["sha256"]:
+        raise ValueError(f"model v{info['version']} sha256 mismatch")
+
+    weights = array("d")
+    weights.frombytes(bytes(buf))
+    if sys.byteorder != "little":
+        weights.byteswap()
+    return info, weights
+
+
+def send_update(
+    base_url: str,
+    payload: dict,
+    timeout: int = 10,
+    wire: str = "json",
+    dtype: str = "float32",
+    codec: t.Optional[str] = None,
+    base_weights: t.Optional[t.List[float]] = None,
+    base_round: t.Optional[str] = None,
+    topk_ratio: float = 0.01,
+) -> requests.Response:
+    """POST 更新到聚合器并返回 Response。发生请求错误则抛出异常。
+
+    - wire="json"（默认）：与旧版一致，weights 为 JSON float 列表。
+    - wire="binary"：weights 以 little-endian float32/float64 原始字节发送（见 wire.py）。
+    - wire="auto"：服务端声明支持二进制时用 binary，否则回退 JSON。
+
+    codec 选择压缩方式（"fp16" / "q8" / "topk"，见 compression.py），仅二进制格式可用；
+    auto 协商回退到 JSON 时按未压缩发送。topk 需要 base_weights / base_round
+    （可由 fetch_global_model 获取）。
+    """
+    url = base_url.rstrip("/") + "/submit_update"
+
+    if wire == "auto":
+        wire = "binary" if _accepts_binary(url, timeout) else "json"
+        if wire == "json":
+            codec = None
+    elif wire == "json" and codec is not None:
+        raise ValueError("compression requires wire='binary' or wire='auto'")
+
     try:
-        resp = requests.post(url, json=payload, timeout=timeout)
+        if wire == "binary":
+            body = encode_update(
+                payload, dtype=dtype, codec=codec, base=base_weights,
+                base_round=base_round, topk_ratio=topk_ratio,
+            )
+            resp = requests.post(
+                url,
+                data=body,
+                headers={"Content-Type": WIRE_CONTENT_TYPE},
+                timeout=timeout,
+            )
+        else:
+            resp = requests.post(url, json=payload, timeout=timeout)
         return resp
     except requests.RequestException:
         raise
 
 
+def sent_wire(resp: requests.Response) -> str:
+    """按实际发出的 body 判断用了哪种格式（"binary" / "json"）"""
+    body = resp.request.body or b""
+    return "binary" if bytes(body[:len(WIRE_MAGIC)]) == WIRE_MAGIC else "json"
+
+
+def check_wire(base_url: str, timeout: int = 10) -> t.Dict[str, dict]:
+    """端到端检查三种 wire 模式：每种模式单独开一个只期待 1 个 client 的 round 并上传。
+
+    返回 {wire: {status, sent}}；服务端支持二进制时 auto 应当实际发送 FLW1。
+    """
+    base = base_url.rstrip("/")
+    prefix = f"WIRE-CHECK-{datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+    _WIRE_SUPPORT.pop(base + "/submit_update", None)
+
+    out = {}
+    for wire in ("json", "binary", "auto"):
+        round_id = f"{prefix}-{wire}"
+        # 异步模式的聚合器不接受 /rounds（409），直接上传即可
+        requests.post(base + "/rounds", json={
+            "roundId": round_id, "expectedClients": ["HospitalA"],
+        }, timeout=timeout)
+        resp = send_update(base, generate_update(round_id, "HospitalA"), timeout=timeout, wire=wire)
+        out[wire] = {"status": resp.status_code, "sent": sent_wire(resp)}
+    return out
+
+
 def _fmt_head(weights: t.List[float], n: int = 3) -> str:
     return ", ".join(f"{w:.6f}" for w in weights[:n])
 
@@ -81,11 +319,33 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
-    parser.add_argument("--round", required=True)
-    parser.add_argument("--client", choices=("HospitalA", "HospitalB"), required=True)
+    parser.add_argument("--round")
+    parser.add_argument("--client", choices=("HospitalA", "HospitalB"))
     parser.add_argument("--base_url", default="http://127.0.0.1:8000")
+    parser.add_argument("--wire", choices=("json", "binary", "auto"), default="json")
+    parser.add_argument("--codec", choices=CODECS, default=None)
+    parser.add_argument("--check-wire", action="store_true",
+                        help="upload once per wire mode and verify auto negotiates binary")
     args = parser.parse_args()
 
+    if args.check_wire:
+        try:
+            results = check_wire(args.base_url)
+        except requests.RequestException as e:
+            print("request failed:", e, file=sys.stderr)
+            sys.exit(1)
+        for wire, r in results.items():
+            print(f"  {wire:<7} status={r['status']} sent={r['sent']}")
+        ok = (
+            all(r["status"] == 200 for r in results.values())
+            and results["binary"]["sent"] == "binary"
+            and results["auto"]["sent"] == "binary"
+        )
+        print("wire check:", "ok" if ok else "FAILED")
+        sys.exit(0 if ok else 1)
+    if not args.round or not args.client:
+        parser.error("--round and --client are required (unless --check-wire)")
+
     payload = generate_update(args.round, args.client)
     print("generated:")
     print("  clientId:", payload["clientId"]) 
@@ -93,7 +353,13 @@ if __name__ == "__main__":
     print("  localAcc:", payload["localAcc"]) 
     print("  weights head:", _fmt_head(payload["weights"]))
     try:
-        r = send_update(args.base_url, payload)
+        base_round, base_weights = (
+            fetch_global_model(args.base_url) if args.codec == "topk" else (None, None)
+        )
+        r = send_update(
+            args.base_url, payload, wire=args.wire, codec=args.codec,
+            base_weights=base_weights, base_round=base_round,
+        )
         print("sent, status:", r.status_code)
         try:
             print(r.json())
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import heapq
+import math
+import struct
+import sys
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时走纯 Python 编解码
+    np = None
+
+try:
+    from .fedavg_engine import NON_FINITE, WeightStats
+except ImportError:  # 以脚本方式运行
+    from fedavg_engine import NON_FINITE, WeightStats
+
+
+# =========================
+# Update 压缩（client 编码 / server 解码）
+# =========================
+#
+#   fp16  每个权重 2 字节半精度
+#   q8    线性 8-bit 量化：w ≈ qmin + code * qscale
+#   topk  相对上一轮 global model 的稀疏增量：k 个严格递增的 uint32 下标 + k 个 float32 值
+#
+# 所有多字节数值均为 little-endian。
+
+CODECS = ("fp16", "q8", "topk")
+
+_LITTLE = sys.byteorder == "little"
+
+
+class CompressedWeights:
+    """二进制上传中的压缩权重段（尚未解码）"""
+
+    __slots__ = ("codec", "meta", "data", "dim")
+
+    def __init__(self, codec: str, meta: dict, data, dim: int):
+        self.codec = codec
+        self.meta = meta
+        self.data = data
+        self.dim = dim
+
+    def __len__(self) -> int:
+        return self.dim
+
+
+# =========================
+# Client 端编码
+# =========================
+
+def _le_bytes(typecode: str, values) -> bytes:
+    buf = array(typecode, values)
+    if not _LITTLE:
+        buf.byteswap()
+    return buf.tobytes()
+
+
+def _rel_error(weights: Sequence[float], approx: Sequence[float]) -> float:
+    """相对 L2 重建误差 ||w - ŵ|| / ||w||"""
+    if np is not None:
+        w = np.asarray(weights, dtype=np.float64)
+        diff = np.linalg.norm(w - np.asarray(approx, dtype=np.float64))
+        norm = np.linalg.norm(w)
+    else:
+        diff = math.sqrt(sum((a - b) ** 2 for a, b in zip(weights, approx)))
+        norm = math.sqrt(sum(a * a for a in weights))
+    return float(diff / norm) if norm else float(diff)
+
+
+def compress(
+    weights: Sequence[float],
+    codec: str,
+    base: Optional[Sequence[float]] = None,
+    topk_ratio: float = 0.01,
+) -> Tuple[dict, bytes, float]:
+    """压缩权重，返回 (meta, data, reconstruction_error)。
+
+    topk 需要 base（client 所基于的 global model），只发送变化最大的 k 个增量。
+    """
+    dim = len(weights)
+
+    if codec == "fp16":
+        if np is not None:
+            data = np.asarray(weights, dtype="<f2").tobytes()
+        else:
+            data = struct.pack(f"<{dim}e", *weights)
+        approx = _decode_fp16_list(data)
+        return {}, data, _rel_error(weights, approx)
+
+    if codec == "q8":
+        qmin = float(min(weights))
+        qmax = float(max(weights))
+        qscale = (qmax - qmin) / 255 or 1.0
+        if np is not None:
+            w = np.asarray(weights, dtype=np.float64)
+            codes = np.rint((w - qmin) / qscale).astype(np.uint8)
+            data = codes.tobytes()
+        else:
+            data = bytes(int(round((w - qmin) / qscale)) for w in weights)
+        meta = {"qmin": qmin, "qscale": qscale}
+        approx = [qmin + c * qscale for c in data]
+        return meta, data, _rel_error(weights, approx)
+
+    if codec == "topk":
+        if base is None or len(base) != dim:
+            raise ValueError("topk compression requires base weights of the same dimension")
+        k = max(1, min(dim, int(dim * topk_ratio)))
+        if np is not None:
+            delta = np.asarray(weights, dtype=np.float64) - np.asarray(base, dtype=np.float64)
+            idx = np.sort(np.argpartition(np.abs(delta), dim - k)[dim - k:])
+            vals = delta[idx].astype("<f4")
+            data = idx.astype("<u4").tobytes() + vals.tobytes()
+            approx = np.asarray(base, dtype=np.float64).copy()
+            approx[idx] += vals
+        else:
+            delta = [w - b for w, b in zip(weights, base)]
+            idx = sorted(heapq.nlargest(k, range(dim), key=lambda i: abs(delta[i])))
+            vals = array("f", (delta[i] for i in idx))
+            data = _le_bytes("I", idx) + _le_bytes("f", vals)
+            approx = list(base)
+            for i, v in zip(idx, vals):
+                approx[i] += v
+        return {"k": k}, data, _rel_error(weights, approx)
+
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def _decode_fp16_list(data: bytes):
+    if np is not None:
+        return np.frombuffer(data, dtype="<f2")
+    return [x for (x,) in struct.iter_unpack("<e", data)]
+
+
+# =========================
+# Server 端解码：直接折叠进累加器
+# =========================
+#
+# 解码对象与 fedavg_engine.DenseContribution 同构：
+#   __init__(engine, meta, data) / raw / meta / dim / fold_into(accum, factor)
+# 累加器在重复提交时用同一构造函数从临时文件重建对象并以 -samples 折回。
+
+class _Contribution:
+    codec = ""
+    needs_base = False
+
+    def __init__(self, engine, meta: dict, data):
+        self.engine = engine
+        self.meta = meta
+        self.raw = data
+        self.dim = meta["dim"]
+
+    def ratio(self) -> float:
+        """相对 float32 稠密编码的压缩比（服务端按实际收到的字节数计算）"""
+        return self.dim * 4 / len(self.raw) if len(self.raw) else 0.0
+
+    def _vector(self):
+        raise NotImplementedError
+
+    def fold_into(self, accum, factor: float) -> None:
+        accum.acc = self.engine.scaled_add(accum.acc, self._vector(), factor)
+
+    def fold_measured(self, accum, factor: float):
+        """解码后的向量只遍历一次：累加同时测量（见 fedavg_engine.WeightStats）"""
+        accum.acc, stats = self.engine.fold_measured(
+            accum.acc, self._vector(), factor, accum.base, accum.base_sq
+        )
+        return stats
+
+    def dense(self, base=None):
+        """解码成稠密向量（鲁棒聚合需要逐 client 的完整权重）"""
+        return self._vector()
+
+
+class Fp16Contribution(_Contribution):
+    codec = "fp16"
+
+    def __init__(self, engine, meta: dict, data):
+        super().__init__(engine, meta, data)
+        if len(data) != self.dim * 2:
+            raise ValueError("fp16 weights buffer size mismatch")
+
+    def _vector(self):
+        if np is not None:
+            vec = np.frombuffer(self.raw, dtype="<f2")
+            # 纯 Python 引擎逐元素运算，先转成 Python float，避免以 float16 累加
+            return vec if self.engine.name == "numpy" else vec.tolist()
+        return [x for (x,) in struct.iter_unpack("<e", self.raw)]
+
+
+class Q8Contribution(_Contribution):
+    codec = "q8"
+
+    def __init__(self, engine, meta: dict, data):
+        super().__init__(engine, meta, data)
+        if len(data) != self.dim:
+            raise ValueError("q8 weights buffer size mismatch")
+        for k in ("qmin", "qscale"):
+            if not isinstance(meta.get(k), (int, float)):
+                raise ValueError(f"Field `{k}` must be a number")
+
+    def _vector(self):
+        qmin = self.meta["qmin"]
+        qscale = self.meta["qscale"]
+        if np is not None:
+            # codes * qscale + qmin 只生成一个临时数组，不构造 Python 列表
+            vec = np.frombuffer(self.raw, dtype=np.uint8) * qscale
+            vec += qmin
+            return vec
+        return [qmin + c * qscale for c in bytes(self.raw)]
+
+
+class TopKContribution(_Contribution):
+    codec = "topk"
+    needs_base = True
+
+    def __init__(self, engine, meta: dict, data):
+        super().__init__(engine, meta, data)
+        k = meta.get("k")
+        if not isinstance(k, int) or not 0 < k <= self.dim:
+            raise ValueError("Field `k` must be an int in (0, dim]")
+        if len(data) != k * 8:
+            raise ValueError("topk weights buffer size mismatch")
+        self.idx, self.vals = self._indices_values()
+
+    def _indices_values(self):
+        k = self.meta["k"]
+        if np is not None:
+            idx = np.frombuffer(self.raw, dtype="<u4", count=k)
+            vals = np.frombuffer(self.raw, dtype="<f4", count=k, offset=k * 4)
+            if int(idx.max()) >= self.dim:
+                raise ValueError("topk index out of range")
+            # 重复下标在 numpy（缓冲索引，后者覆盖前者）与纯 Python（逐个相加）下结果不同，
+            # 也会让 fold_measured 的范数与实际折叠的增量不一致
+            if k > 1 and np.any(np.diff(idx.astype(np.int64)) <= 0):
+                raise ValueError("topk indices must be strictly increasing")
+            return idx, vals
+        idx = array("I", bytes(self.raw[:k * 4]))
+        vals = array("f", bytes(self.raw[k * 4:]))
+        if not _LITTLE:
+            idx.byteswap()
+            vals.byteswap()
+        if max(idx) >= self.dim:
+            raise ValueError("topk index out of range")
+        if any(a >= b for a, b in zip(idx, idx[1:])):
+            raise ValueError("topk indices must be strictly increasing")
+        return idx, vals
+
+    def fold_into(self, accum, factor: float) -> None:
+        # 稠密的 base * samples 部分统一在 finalize 时加一次，这里只做 O(k) 的 scatter
+        accum.acc = self.engine.scatter_add(accum.acc, self.idx, self.vals, factor)
+        accum.base_samples += factor
+
+    def fold_measured(self, accum, factor: float):
+        """O(k) 统计：w = base + delta，利用每轮预先算好的 ||base||² 与 max|base|。
+
+        max_abs 对未改动的坐标取 max|base|，是上界而非精确值。
+        """
+        base = accum.base
+        if np is not None:
+            b = np.asarray(base, dtype=np.float64)[self.idx]
+            v = self.vals.astype(np.float64)
+            bv = float(np.dot(b, v))
+            vv = float(np.dot(v, v))
+            touched = float(np.abs(b + v).max())
+        else:
+            b = [base[i] for i in self.idx]
+            bv = sum(x * y for x, y in zip(b, self.vals))
+            vv = sum(y * y for y in self.vals)
+            touched = max(abs(x + y) for x, y in zip(b, self.vals))
+
+        sq = accum.base_sq + 2 * bv + vv
+        if not math.isfinite(sq):
+            return NON_FINITE
+        self.fold_into(accum, factor)
+
+        norm = math.sqrt(max(sq, 0.0))
+        dot = accum.base_sq + bv
+        cosine = dot / (norm * math.sqrt(accum.base_sq)) if norm and accum.base_sq else None
+        return WeightStats(norm, max(touched, accum.base_max_abs), True, cosine)
+
+    def dense(self, base=None):
+        if np is not None:
+            out = np.array(base, dtype=np.float64)
+            out[self.idx] += self.vals
+            return out
+        out = list(base)
+        for i, v in zip(self.idx, self.vals):
+            out[i] += v
+        return out
+
+
+DECODERS: Dict[str, type] = {
+    "fp16": Fp16Contribution,
+    "q8": Q8Contribution,
+    "topk": TopKContribution,
+}
+
+
+def decode(engine, weights: CompressedWeights):
+    """CompressedWeights -> 可折叠的解码对象（只校验，不展开成稠密向量）"""
+    cls = DECODERS.get(weights.codec)
+    if cls is None:
+        raise ValueError(f"Unknown codec: {weights.codec}")
+    meta = dict(weights.meta, dim=weights.dim)
+    return cls(engine, meta, weights.data)
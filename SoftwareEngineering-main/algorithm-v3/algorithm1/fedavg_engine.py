@@ -0,0 +1,525 @@
+from __future__ import annotations
+
+import math
+import tempfile
+import time
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy 可选，缺失时退回纯 Python 引擎
+    np = None
+
+try:
+    from .robust import alloc_matrix
+except ImportError:  # 以脚本方式运行
+    from robust import alloc_matrix
+
+
+# =========================
+# 服务端实测的权重统计
+# =========================
+
+class WeightStats(NamedTuple):
+    """融合累加时顺带测得的统计量（不依赖 client 自报的 agentClaim）"""
+    norm: float                 # L2 范数
+    max_abs: float              # max |w|
+    finite: bool                # 是否不含 NaN / Inf
+    cosine: Optional[float]     # 与本轮 base（当前 global model）的余弦相似度
+
+    def to_dict(self) -> dict:
+        return {
+            "norm": round(self.norm, 6) if self.finite else None,
+            "maxAbs": round(self.max_abs, 6) if self.finite else None,
+            "finite": self.finite,
+            "cosine": round(self.cosine, 6) if self.cosine is not None else None,
+        }
+
+
+NON_FINITE = WeightStats(math.nan, math.nan, False, None)
+
+
+def _weight_stats(sq: float, max_abs: float, dot: Optional[float], base_sq: Optional[float]) -> WeightStats:
+    norm = math.sqrt(sq)
+    cosine = None
+    if dot is not None and base_sq and norm:
+        cosine = dot / (norm * math.sqrt(base_sq))
+    return WeightStats(norm, max_abs, True, cosine)
+
+
+class UpdateRejected(Exception):
+    """update 未通过实测检查；累加器保持不变"""
+
+    def __init__(self, reason: str, stats: WeightStats):
+        super().__init__(reason)
+        self.reason = reason
+        self.stats = stats
+
+
+# =========================
+# 聚合引擎
+# =========================
+
+class PythonEngine:
+    """纯 Python FedAvg（无第三方依赖的兜底实现）"""
+
+    name = "python"
+
+    def fedavg(self, weights_list: Sequence[Sequence[float]], samples: Sequence[int]) -> List[float]:
+        dim = _check_shapes(weights_list, samples)
+        total = float(sum(samples))
+
+        agg = [0.0] * dim
+        for w, s in zip(weights_list, samples):
+            agg = [a + x * s for a, x in zip(agg, w)]
+
+        # 只在最后做一次除法
+        return [a / total for a in agg]
+
+    # ---- 流式累加所需的向量原语 ----
+
+    def as_vector(self, weights: Sequence[float]) -> array:
+        # ModelUpdate 已转好的 array('d') 直接复用，不再拷贝
+        if isinstance(weights, array) and weights.typecode == "d":
+            return weights
+        return array("d", weights)
+
+    def zeros(self, dim: int) -> List[float]:
+        return [0.0] * dim
+
+    def scaled_add(self, acc: List[float], vec: Sequence[float], factor: float) -> List[float]:
+        return [a + x * factor for a, x in zip(acc, vec)]
+
+    def scatter_add(self, acc: List[float], idx: Sequence[int], vals: Sequence[float], factor: float) -> List[float]:
+        for i, v in zip(idx, vals):
+            acc[i] += float(v) * factor
+        return acc
+
+    def fold_measured(self, acc: List[float], vec: Sequence[float], factor: float,
+                      base=None, base_sq: Optional[float] = None):
+        """scaled_add 与统计量在同一次遍历中完成；含 NaN / Inf 时 acc 原样返回"""
+        sq = max_abs = 0.0
+        out = []
+        if base is None:
+            dot = None
+            for a, x in zip(acc, vec):
+                sq += x * x
+                if abs(x) > max_abs:
+                    max_abs = abs(x)
+                out.append(a + x * factor)
+        else:
+            dot = 0.0
+            for a, x, b in zip(acc, vec, base):
+                sq += x * x
+                dot += x * b
+                if abs(x) > max_abs:
+                    max_abs = abs(x)
+                out.append(a + x * factor)
+
+        # 平方和有限 <=> 每个元素都有限（溢出的极大值同样按非法处理）
+        if not math.isfinite(sq):
+            return acc, NON_FINITE
+        return out, _weight_stats(sq, max_abs, dot, base_sq)
+
+    def norm_stats(self, vec: Sequence[float]) -> Tuple[float, float]:
+        """(平方和, max|x|)"""
+        return sum(x * x for x in vec), max((abs(x) for x in vec), default=0.0)
+
+    def finish(self, acc: List[float], total: float) -> List[float]:
+        return [a / total for a in acc]
+
+    def byte_view(self, vec: array) -> memoryview:
+        return memoryview(vec).cast("B")
+
+    def from_bytes(self, data: bytes) -> array:
+        vec = array("d")
+        vec.frombytes(data)
+        return vec
+
+    def itemsize(self) -> int:
+        return array("d").itemsize
+
+
+class NumpyEngine:
+    """NumPy FedAvg：堆叠为连续矩阵后一次加权归约"""
+
+    name = "numpy"
+
+    def __init__(self, dtype: str = "float64"):
+        if np is None:
+            raise RuntimeError("numpy engine requested but numpy is not installed")
+        self.dtype = np.dtype(dtype)
+
+    def fedavg(self, weights_list: Sequence[Sequence[float]], samples: Sequence[int]) -> List[float]:
+        _check_shapes(weights_list, samples)
+
+        # (n_clients, dim) 连续数组
+        stacked = np.asarray(weights_list, dtype=self.dtype)
+        coeffs = np.asarray(samples, dtype=self.dtype)
+
+        agg = coeffs @ stacked
+        agg /= coeffs.sum()
+        return agg.tolist()
+
+    # ---- 流式累加所需的向量原语 ----
+
+    def as_vector(self, weights: Sequence[float]):
+        return np.ascontiguousarray(weights, dtype=self.dtype)
+
+    def zeros(self, dim: int):
+        # 累加器固定用 float64，避免多次加减后精度漂移
+        return np.zeros(dim, dtype=np.float64)
+
+    def scaled_add(self, acc, vec, factor: float):
+        acc += vec.astype(np.float64, copy=False) * factor
+        return acc
+
+    def scatter_add(self, acc, idx, vals, factor: float):
+        acc[idx] += vals.astype(np.float64) * factor
+        return acc
+
+    def fold_measured(self, acc, vec, factor: float, base=None, base_sq: Optional[float] = None):
+        """分块融合：每块在缓存中一次完成 平方和 / max|x| / 与 base 点积 / 累加。
+
+        遇到含 NaN / Inf 的块立即停止，并撤销已累加的前缀，acc 保持不变。
+        """
+        n = len(vec)
+        chunk = min(n, _FUSED_CHUNK)
+        cur = np.empty(chunk, dtype=np.float64)
+        tmp = np.empty(chunk, dtype=np.float64)
+        sq = max_abs = 0.0
+        dot = None if base is None else 0.0
+
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            c, t = cur[:stop - start], tmp[:stop - start]
+            c[...] = vec[start:stop]          # 统一转 float64（fp16 / float32 上传）
+
+            s = float(np.dot(c, c))
+            if not math.isfinite(s):
+                if start:
+                    acc[:start] -= np.asarray(vec[:start], dtype=np.float64) * factor
+                return acc, NON_FINITE
+            sq += s
+
+            np.abs(c, out=t)
+            max_abs = max(max_abs, float(t.max()))
+            if base is not None:
+                dot += float(np.dot(c, base[start:stop]))
+
+            np.multiply(c, factor, out=t)
+            acc[start:stop] += t
+
+        return acc, _weight_stats(sq, max_abs, dot, base_sq)
+
+    def norm_stats(self, vec) -> Tuple[float, float]:
+        v = np.asarray(vec, dtype=np.float64)
+        return float(np.dot(v, v)), float(np.abs(v).max()) if len(v) else 0.0
+
+    def finish(self, acc, total: float) -> List[float]:
+        return (acc / total).tolist()
+
+    def byte_view(self, vec) -> memoryview:
+        # as_vector 保证 C 连续，可零拷贝按字节查看
+        return memoryview(vec).cast("B")
+
+    def from_bytes(self, data: bytes):
+        return np.frombuffer(data, dtype=self.dtype)
+
+    def itemsize(self) -> int:
+        return self.dtype.itemsize
+
+
+# fold_measured 的分块大小（float64 个数，128 KiB，可留在 L2 中）
+_FUSED_CHUNK = 16384
+
+ENGINES = {
+    "python": PythonEngine,
+    "numpy": NumpyEngine,
+}
+
+
+class _ClientRecord(NamedTuple):
+    cls: type           # 解码类，重复提交时用于从临时文件重建
+    meta: dict
+    offset: int
+    nbytes: int
+    samples: int
+    local_acc: float
+    ratio: float
+    recon_error: Optional[float]
+
+
+class DenseContribution:
+    """稠密权重（JSON 或未压缩的二进制上传）。
+
+    与 compression.py 中的解码对象同构：raw 为写入临时文件的字节，
+    cls(engine, meta, raw) 可从临时文件重建。
+    """
+
+    codec = "dense"
+    needs_base = False
+
+    def __init__(self, engine, meta: dict, data):
+        self.engine = engine
+        self.meta = meta
+        self.raw = data
+        self.vec = engine.from_bytes(data)
+        self.dim = len(self.vec)
+
+    @classmethod
+    def from_vector(cls, engine, vec) -> "DenseContribution":
+        obj = cls.__new__(cls)
+        obj.engine = engine
+        obj.meta = {}
+        obj.vec = vec
+        obj.raw = engine.byte_view(vec)
+        obj.dim = len(vec)
+        return obj
+
+    def ratio(self) -> float:
+        return 1.0
+
+    def fold_into(self, accum, factor: float) -> None:
+        accum.acc = self.engine.scaled_add(accum.acc, self.vec, factor)
+
+    def fold_measured(self, accum, factor: float) -> WeightStats:
+        accum.acc, stats = self.engine.fold_measured(
+            accum.acc, self.vec, factor, accum.base, accum.base_sq
+        )
+        return stats
+
+    def dense(self, base=None):
+        return self.vec
+
+
+class RoundAccumulator:
+    """流式 FedAvg 累加器。
+
+    每个 update 到达时立即折叠进 sum(w * samples)，聚合时只需一次 O(dim) 除法。
+    各 client 的上传（稠密或压缩后的原始字节）写入临时文件（不占堆内存），
+    同一轮内重复提交时读回旧记录做 subtract-and-replace。
+
+    base 为本轮 client 所基于的 global model，topk 稀疏增量的稠密部分
+    (base * samples) 合并记在 base_samples 上，finalize 时只加一次。
+
+    折叠与实测统计（范数 / max|w| / NaN-Inf / 与 base 的余弦）在同一次遍历中完成，
+    权重只读一遍；未通过检查的 update 会被撤销，不影响累加结果。
+    """
+
+    def __init__(self, engine, dim: int, base=None):
+        self.engine = engine
+        self.dim = dim
+        self.base = base
+        # base 的平方和 / max|base|，每轮只算一次（余弦与 topk 统计使用）
+        self.base_sq, self.base_max_abs = (
+            engine.norm_stats(base) if base is not None else (None, None)
+        )
+        self.acc = engine.zeros(dim)
+        self.base_samples = 0
+        self.total_samples = 0
+        self.acc_weighted = 0.0             # sum(localAcc * samples)
+        self._clients: Dict[str, _ClientRecord] = {}
+        self._spill = tempfile.TemporaryFile()
+
+    @property
+    def clients(self) -> List[str]:
+        return list(self._clients.keys())
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def fold(
+        self,
+        client_id: str,
+        contrib,
+        samples: int,
+        local_acc: float,
+        recon_error: Optional[float] = None,
+        screen: Optional[Callable[[WeightStats], Optional[str]]] = None,
+    ) -> Tuple[bool, WeightStats]:
+        """折叠一个 update（DenseContribution 或 compression 解码对象）。
+
+        screen(stats) 返回拒绝原因（或 None）；含 NaN / Inf 的 update 总是拒绝。
+        拒绝时抛出 UpdateRejected，累加器与该 client 之前的提交保持不变。
+        返回 (是否为重复提交, 实测统计)。
+        """
+        if contrib.dim != self.dim:
+            raise ValueError(f"weights dimension mismatch: expected {self.dim}, got {contrib.dim}")
+        if contrib.needs_base and self.base is None:
+            raise ValueError(f"{contrib.codec} update requires a global model to apply deltas to")
+
+        # 先折叠新 update（同时测量），通过检查后再撤销旧提交
+        stats = contrib.fold_measured(self, samples)
+        reason = "Non-finite weights" if not stats.finite else (screen(stats) if screen else None)
+        if reason is not None:
+            if stats.finite:
+                contrib.fold_into(self, -samples)
+            raise UpdateRejected(reason, stats)
+
+        raw = contrib.raw
+        prev = self._clients.get(client_id)
+        if prev is not None:
+            self._spill.seek(prev.offset)
+            old = prev.cls(self.engine, prev.meta, self._spill.read(prev.nbytes))
+            old.fold_into(self, -prev.samples)
+            self.total_samples -= prev.samples
+            self.acc_weighted -= prev.local_acc * prev.samples
+            offset = prev.offset
+            if len(raw) > prev.nbytes:
+                # 新记录放不下时追加到文件末尾
+                self._spill.seek(0, 2)
+                offset = self._spill.tell()
+        else:
+            self._spill.seek(0, 2)
+            offset = self._spill.tell()
+
+        self._spill.seek(offset)
+        self._spill.write(raw)
+
+        self.total_samples += samples
+        self.acc_weighted += local_acc * samples
+        self._clients[client_id] = _ClientRecord(
+            type(contrib), contrib.meta, offset, len(raw),
+            samples, local_acc, contrib.ratio(), recon_error,
+        )
+
+        return prev is not None, stats
+
+    def compression_stats(self) -> Optional[dict]:
+        """本轮压缩上传的汇总（无压缩上传时返回 None）。
+
+        ratio 由服务端按收到的字节数测得；reconError 为 client 编码时
+        测得的相对 L2 误差（只有 client 持有原始权重）。
+        """
+        rows = [r for r in self._clients.values() if r.cls.codec != "dense"]
+        if not rows:
+            return None
+
+        errors = [r.recon_error for r in rows if r.recon_error is not None]
+        return {
+            "clients": len(rows),
+            "codecs": sorted({r.cls.codec for r in rows}),
+            "ratio": round(sum(r.ratio for r in rows) / len(rows), 4),
+            "reconError": round(sum(errors) / len(errors), 8) if errors else None,
+            "maxReconError": round(max(errors), 8) if errors else None,
+        }
+
+    def stack(self):
+        """读回本轮每个 client 的稠密权重（鲁棒聚合用，见 robust.py）。
+
+        返回 (client_ids, samples, local_accs, W)，W 为 (n, dim) float64 矩阵；
+        没有 numpy 时为 list of list。
+        """
+        ids, samples, accs, rows = [], [], [], []
+        matrix = alloc_matrix(len(self._clients), self.dim) if np is not None else None
+
+        for i, (client_id, rec) in enumerate(self._clients.items()):
+            self._spill.seek(rec.offset)
+            contrib = rec.cls(self.engine, rec.meta, self._spill.read(rec.nbytes))
+            vec = contrib.dense(self.base)
+            if matrix is not None:
+                matrix[i] = vec
+            else:
+                rows.append(list(vec))
+            ids.append(client_id)
+            samples.append(rec.samples)
+            accs.append(rec.local_acc)
+
+        return ids, samples, accs, (matrix if matrix is not None else rows)
+
+    def finalize(self, close: bool = True) -> Tuple[List[float], float]:
+        """返回 (global_weights, avg_local_acc)，默认同时释放临时文件。
+
+        close=False 时累加器保持可用（聚合器在检查点落盘成功后才关闭，失败可重试）。
+        """
+        if not self._clients:
+            raise ValueError("no updates to aggregate")
+        if self.total_samples <= 0:
+            raise ValueError("total samples must be positive")
+
+        if self.base_samples:
+            # 只加一次，重复调用 finalize 结果不变
+            self.acc = self.engine.scaled_add(self.acc, self.base, self.base_samples)
+            self.base_samples = 0
+        global_weights = self.engine.finish(self.acc, float(self.total_samples))
+        avg_acc = self.acc_weighted / self.total_samples
+        if close:
+            self.close()
+        return global_weights, avg_acc
+
+    def close(self) -> None:
+        self._spill.close()
+
+
+def _check_shapes(weights_list: Sequence[Sequence[float]], samples: Sequence[int]) -> int:
+    if not weights_list:
+        raise ValueError("no updates to aggregate")
+    if len(weights_list) != len(samples):
+        raise ValueError("weights / samples length mismatch")
+
+    dim = len(weights_list[0])
+    for w in weights_list:
+        if len(w) != dim:
+            raise ValueError(f"weights dimension mismatch: expected {dim}, got {len(w)}")
+    return dim
+
+
+def available_engines() -> List[str]:
+    names = ["auto", "python"]
+    if np is not None:
+        names.append("numpy")
+    return names
+
+
+def get_engine(name: str = "auto", dtype: str = "float64"):
+    """按名字构造引擎；auto 在装有 numpy 时选 numpy，否则 python"""
+    if name == "auto":
+        name = "numpy" if np is not None else "python"
+
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}")
+
+    if name == "numpy":
+        return NumpyEngine(dtype=dtype)
+    return PythonEngine()
+
+
+# =========================
+# 简单对比（python vs numpy）
+# =========================
+
+def _compare(clients: int, dim: int, dtype: str) -> Dict[str, float]:
+    import random
+
+    rnd = random.Random(0)
+    weights_list = [[rnd.gauss(0, 1) for _ in range(dim)] for _ in range(clients)]
+    samples = [rnd.randint(50, 150) for _ in range(clients)]
+
+    timings = {}
+    results = {}
+    for name in available_engines()[1:]:
+        engine = get_engine(name, dtype=dtype)
+        t0 = time.perf_counter()
+        results[name] = engine.fedavg(weights_list, samples)
+        timings[name] = time.perf_counter() - t0
+
+    if len(results) == 2:
+        timings["max_abs_diff"] = max(
+            abs(a - b) for a, b in zip(results["python"], results["numpy"])
+        )
+    return timings
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare FedAvg engines")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=100_000)
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64")
+    args = parser.parse_args()
+
+    for k, v in _compare(args.clients, args.dim, args.dtype).items():
+        print(f"{k}: {v:.6g}")
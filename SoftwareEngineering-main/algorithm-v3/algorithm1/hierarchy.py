@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+try:
+    from .fedavg_engine import DenseContribution, RoundAccumulator, get_engine
+    from .wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, decode_update, encode_update
+except ImportError:  # 以脚本方式运行
+    from fedavg_engine import DenseContribution, RoundAccumulator, get_engine
+    from wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, decode_update, encode_update
+
+
+# =========================
+# 分层聚合（region 预聚合 -> root）
+# =========================
+#
+# 每个 region 聚合器是一个独立进程（aggregator.py --region-id R --upstream ROOT），
+# 只接收本区医院的 update，照常流式 FedAvg。本轮关闭后把区内结果作为一个普通
+# update 上传给 root：
+#
+#   clientId = region id
+#   weights  = 区内加权平均 m_r = Σ w_i n_i / T_r      （float64 二进制格式）
+#   samples  = T_r = Σ n_i
+#   localAcc = Σ acc_i n_i / T_r
+#
+# root 折叠 m_r * T_r = Σ w_i n_i，除以 Σ T_r 后与对全部医院直接 FedAvg 相同
+# （只差浮点舍入），avgLocalAcc 同理；root 端不需要任何改动，只需把 region id
+# 作为 expectedClients。
+#
+# 解析 / 解码 / 折叠 update 的 CPU 开销分散到各 region 进程（不受单进程 GIL 限制），
+# root 每轮只处理 region 数个 update。
+#
+# 注意：鲁棒规则（median / krum ...）在 region 内生效，root 上再做 FedAvg 不等价于
+# 对全部医院直接应用该规则；topk 增量需要 global model，region 上没有，不支持。
+
+# 转发失败时的重试间隔（秒）
+FORWARD_BACKOFF = (0.5, 1.0, 2.0)
+
+# 一次 forward() 全部重试失败后，outbox 里的 partial 再次尝试的间隔（秒，指数增长）
+OUTBOX_RETRY = (5.0, 300.0)
+
+_LITTLE = sys.byteorder == "little"
+
+
+def partial_update(
+    round_id: str,
+    region_id: str,
+    weights,
+    total_samples: int,
+    avg_acc: float,
+) -> dict:
+    """把 region 本轮结果包装成 root 可直接接收的 update"""
+    return {
+        "roundId": round_id,
+        "clientId": region_id,
+        "weights": weights,
+        "samples": int(total_samples),
+        "localAcc": float(avg_acc),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+
+def forward(upstream: str, payload: dict, timeout: float = 30.0) -> Tuple[dict, int]:
+    """以 float64 二进制格式把 partial 上传到 root /submit_update，返回 (body, status)。
+
+    网络错误与 5xx 按 FORWARD_BACKOFF 重试；4xx 直接返回（重试不会改变结果）。
+    """
+    body = encode_update(payload, dtype="float64")
+    url = upstream.rstrip("/") + "/submit_update"
+
+    last_error = None
+    for delay in (0.0,) + FORWARD_BACKOFF:
+        time.sleep(delay)
+        try:
+            resp = requests.post(
+                url, data=body, headers={"Content-Type": WIRE_CONTENT_TYPE}, timeout=timeout
+            )
+        except requests.RequestException as e:
+            last_error = str(e)
+            continue
+        if resp.status_code < 500:
+            try:
+                return resp.json(), resp.status_code
+            except ValueError:
+                return {"error": resp.text}, resp.status_code
+        last_error = f"upstream returned {resp.status_code}"
+
+    return {"error": last_error}, 502
+
+
+def write_weights(path: str, weights) -> None:
+    """little-endian float64 原始字节（与检查点 / history 权重文件同格式），先写临时文件再 rename"""
+    buf = array("d", weights)
+    if not _LITTLE:
+        buf.byteswap()
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(memoryview(buf).cast("B"))
+    os.replace(tmp, path)
+
+
+def read_weights(path: str) -> array:
+    buf = array("d")
+    with open(path, "rb") as f:
+        buf.frombytes(f.read())
+    if not _LITTLE:
+        buf.byteswap()
+    return buf
+
+
+class ForwardOutbox:
+    """region 模式下待上传给 root 的 partial。
+
+    round 关闭时先把区内结果落盘（权重文件 + <root>/<seq>.json）再退役 round，
+    上传成功或被 root 明确拒绝（4xx）后删除；网络错误 / 5xx 时保留，按 OUTBOX_RETRY
+    退避重试，进程重启后同样继续。seq 为该轮在 HistoryStore 中的行号。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.partials = os.path.join(root, "partials")
+        self._lock = threading.Lock()
+        self._busy = set()
+        self._retry: Dict[int, Tuple[float, float]] = {}   # seq -> (下次尝试时间, 当前间隔)
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.root, f"{seq:010d}.json")
+
+    def new_weights_file(self, weights) -> str:
+        os.makedirs(self.partials, exist_ok=True)
+        path = os.path.join(self.partials, f"{uuid.uuid4().hex}.f64")
+        write_weights(path, weights)
+        return path
+
+    def put(self, seq: int, record: dict, payload: dict, weights_file: str) -> None:
+        """payload 为 partial_update() 的结果去掉 weights。
+
+        新条目先留给关闭该 round 的请求线程上传，OUTBOX_RETRY[0] 秒后才交给后台重试。
+        """
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._path(seq) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"seq": seq, "record": record, "payload": payload, "weightsFile": weights_file}, f)
+        os.replace(tmp, self._path(seq))
+        first = OUTBOX_RETRY[0]
+        with self._lock:
+            self._retry[seq] = (time.monotonic() + first, first / 2)
+
+    def pending(self) -> List[int]:
+        """到了重试时间、且没有线程正在上传的条目"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            return [
+                seq for seq in sorted(int(n[:-5]) for n in names if n.endswith(".json"))
+                if seq not in self._busy and self._retry.get(seq, (0.0, 0.0))[0] <= now
+            ]
+
+    def claim(self, seq: int) -> Optional[dict]:
+        """取出一个条目并标记为上传中（其他线程不会重复上传）；不存在或正在上传时返回 None。
+
+        条目或权重文件缺失 / 损坏时取消标记、按 failed() 退避，并抛出 ValueError。
+        """
+        with self._lock:
+            if seq in self._busy:
+                return None
+            self._busy.add(seq)
+        try:
+            with open(self._path(seq)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:       # 已被其他线程上传完成
+            with self._lock:
+                self._busy.discard(seq)
+            return None
+        except ValueError as e:
+            self.failed(seq)
+            raise ValueError(f"outbox entry {seq} is unreadable: {e}") from None
+        try:
+            entry["payload"]["weights"] = read_weights(entry["weightsFile"])
+        except (OSError, ValueError, KeyError) as e:
+            self.failed(seq)
+            raise ValueError(f"partial weights for outbox entry {seq} are unreadable: {e!r}") from None
+        return entry
+
+    def expedite(self, seq: int) -> None:
+        """不等退避，交给下一次后台重试（deadline 清扫关闭的 round 没有请求线程来上传）"""
+        with self._lock:
+            _, delay = self._retry.get(seq, (0.0, OUTBOX_RETRY[0] / 2))
+            self._retry[seq] = (0.0, delay)
+
+    def done(self, seq: int) -> None:
+        with self._lock:
+            self._busy.discard(seq)
+            self._retry.pop(seq, None)
+            try:
+                os.remove(self._path(seq))
+            except FileNotFoundError:
+                pass
+
+    def failed(self, seq: int) -> float:
+        """保留条目，返回距下次重试的秒数"""
+        first, cap = OUTBOX_RETRY
+        with self._lock:
+            self._busy.discard(seq)
+            _, delay = self._retry.get(seq, (0.0, first / 2))
+            delay = min(delay * 2, cap)
+            self._retry[seq] = (time.monotonic() + delay, delay)
+        return delay
+
+
+def summarize_upstream(body: dict, code: int) -> dict:
+    """root 的响应去掉 globalWeights 后附在 region 的聚合记录上"""
+    out = {"httpStatus": code}
+    for k in ("status", "error", "reason", "received"):
+        if k in body:
+            out[k] = body[k]
+    result = body.get("result")
+    if isinstance(result, dict):
+        out["result"] = {k: v for k, v in result.items() if k != "globalWeights"}
+    return out
+
+
+# =========================
+# 单机验证：region 进程并行预聚合
+# =========================
+
+def _region_worker(engine_name, round_id, client_ids, dim, barrier, out) -> None:
+    """一个 region 进程：先生成本区上传的二进制 body，同步起跑后解码并折叠"""
+    try:
+        from .client_lib import generate_updates_batch
+    except ImportError:
+        from client_lib import generate_updates_batch
+
+    engine = get_engine(engine_name)
+    bodies = [
+        encode_update(u, dtype="float64")
+        for u in generate_updates_batch([(round_id, c) for c in client_ids], dim, as_array=True)
+    ]
+
+    barrier.wait()
+    t0 = time.monotonic()
+    acc = RoundAccumulator(engine, dim)
+    for body in bodies:
+        header, weights = decode_update(body)
+        contrib = DenseContribution.from_vector(engine, engine.as_vector(weights))
+        acc.fold(header["clientId"], contrib, header["samples"], header["localAcc"])
+    total = acc.total_samples
+    weights, avg_acc = acc.finalize()
+    t1 = time.monotonic()
+
+    out.put((list(weights), total, avg_acc, t0, t1))
+
+
+def merge_partials(engine, dim: int, partials: Sequence[Tuple[str, Sequence[float], int, float]]):
+    """root 端：把 (region_id, 区内平均, T_r, 区内 avgAcc) 当作普通 update 折叠"""
+    acc = RoundAccumulator(engine, dim)
+    for region_id, weights, total, avg_acc in partials:
+        contrib = DenseContribution.from_vector(engine, engine.as_vector(weights))
+        acc.fold(region_id, contrib, total, avg_acc)
+    return acc.finalize()
+
+
+def _run_regions(engine_name: str, round_id: str, client_ids: List[str], dim: int, regions: int):
+    """每个 region 一个进程；返回 (partials, 各 region 起止时间中的总墙钟时间)"""
+    import multiprocessing as mp
+
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(regions)
+    out = ctx.Queue()
+    shards = [client_ids[r::regions] for r in range(regions)]
+    procs = [
+        ctx.Process(target=_region_worker, args=(engine_name, round_id, shard, dim, barrier, out))
+        for shard in shards
+    ]
+    for p in procs:
+        p.start()
+    rows = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    wall = max(r[4] for r in rows) - min(r[3] for r in rows)
+    partials = [(f"Region{i}", r[0], r[1], r[2]) for i, r in enumerate(rows)]
+    return partials, wall
+
+
+def _compare(clients: int, dim: int, region_counts: Sequence[int], engine_name: str = "auto") -> Dict:
+    """region 数不同时的吞吐（update / 秒）以及 root 结果与直接 _fedavg 的最大误差"""
+    try:
+        from .client_lib import generate_updates_batch
+    except ImportError:
+        from client_lib import generate_updates_batch
+
+    engine = get_engine(engine_name)
+    round_id = "HIER-BENCH"
+    client_ids = [f"Hospital{i:05d}" for i in range(clients)]
+
+    updates = generate_updates_batch([(round_id, c) for c in client_ids], dim)
+    flat = engine.fedavg([u["weights"] for u in updates], [u["samples"] for u in updates])
+    total = sum(u["samples"] for u in updates)
+    flat_acc = sum(u["localAcc"] * u["samples"] for u in updates) / total
+
+    results: Dict[str, Optional[Dict]] = {}
+    base_rate = None
+    for regions in region_counts:
+        partials, wall = _run_regions(engine.name, round_id, client_ids, dim, regions)
+        weights, avg_acc = merge_partials(engine, dim, partials)
+        rate = clients / wall if wall else float("inf")
+        base_rate = base_rate or rate
+        results[str(regions)] = {
+            "updatesPerSec": round(rate, 1),
+            "speedup": round(rate / base_rate, 2),
+            "maxAbsError": max(abs(a - b) for a, b in zip(weights, flat)),
+            "accError": abs(avg_acc - flat_acc),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Regional pre-aggregation: throughput vs region processes and error vs flat FedAvg"
+    )
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--dim", type=int, default=100_000)
+    parser.add_argument("--regions", default="1,2,4", help="comma separated region counts")
+    parser.add_argument("--engine", default="auto")
+    args = parser.parse_args()
+
+    counts = [int(x) for x in args.regions.split(",")]
+    print(f"cpus: {os.cpu_count()}")
+    print(json.dumps(_compare(args.clients, args.dim, counts, args.engine), indent=2))
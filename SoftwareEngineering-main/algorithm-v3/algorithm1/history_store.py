@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from typing import Dict, List, Optional
+
+
+# =========================
+# 轮次历史：SQLite 元数据 + 独立的权重文件
+# =========================
+#
+#   <root>/history.db            rounds 表（每轮一行，不含权重）
+#   weights_file                 该轮 global model 检查点（见 checkpoints.py），
+#                                little-endian float64 原始字节
+#
+# 内存中不再保留历史记录，/history 只读取请求的那一页。
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rounds (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    round_id     TEXT NOT NULL,
+    timestamp    TEXT NOT NULL,
+    dim          INTEGER NOT NULL,
+    weights_file TEXT NOT NULL,
+    record       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_rounds_round_id ON rounds (round_id);
+"""
+
+_LITTLE = sys.byteorder == "little"
+
+
+class HistoryStore:
+    """按 seq 递增追加的持久化轮次历史（线程安全）"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _conn(self) -> sqlite3.Connection:
+        # 首次使用时才建目录 / 建表，import aggregator 不产生副作用
+        if self._db is None:
+            os.makedirs(self.root, exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.root, "history.db"), check_same_thread=False
+            )
+            db.executescript(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def append(self, record: Dict, weights_file: str, dim: int) -> int:
+        """写入一轮记录（权重已由检查点落盘）；record 不应包含 globalWeights。返回 seq"""
+        rel = os.path.relpath(weights_file, self.root)
+
+        with self._lock:
+            db = self._conn()
+            cur = db.execute(
+                "INSERT INTO rounds (round_id, timestamp, dim, weights_file, record) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (record["roundId"], record["timestamp"], dim, rel, json.dumps(record)),
+            )
+            db.commit()
+            return cur.lastrowid
+
+    def update(self, seq: int, record: Dict) -> None:
+        """替换已有一行的 record（region 模式在 root 响应后补上 upstream 字段）"""
+        with self._lock:
+            db = self._conn()
+            db.execute("UPDATE rounds SET record = ? WHERE seq = ?", (json.dumps(record), seq))
+            db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM rounds").fetchone()[0]
+
+    def page(
+        self,
+        limit: int = 50,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        include_weights: bool = False,
+    ) -> List[Dict]:
+        """按 seq 升序返回一页记录。
+
+        - after：返回 seq > after 的最早 limit 条（向后翻页）
+        - 否则返回 seq < before（缺省为全部）的最近 limit 条
+        """
+        with self._lock:
+            db = self._conn()
+            if after is not None:
+                rows = db.execute(
+                    "SELECT seq, record, weights_file FROM rounds "
+                    "WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (after, limit),
+                ).fetchall()
+            else:
+                rows = db.execute(
+                    "SELECT seq, record, weights_file FROM rounds "
+                    "WHERE seq < ? ORDER BY seq DESC LIMIT ?",
+                    (before if before is not None else sys.maxsize, limit),
+                ).fetchall()
+                rows.reverse()
+
+        records = []
+        for seq, record, weights_file in rows:
+            rec = json.loads(record)
+            rec["seq"] = seq
+            if include_weights:
+                rec["globalWeights"] = self._read_weights(weights_file)
+            records.append(rec)
+        return records
+
+    def weights_path(self, round_id: str) -> Optional[str]:
+        """该 round 最近一次聚合的权重文件路径"""
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT weights_file FROM rounds WHERE round_id = ? ORDER BY seq DESC LIMIT 1",
+                (round_id,),
+            ).fetchone()
+        return os.path.join(self.root, row[0]) if row else None
+
+    def _read_weights(self, rel: str) -> List[float]:
+        buf = array("d")
+        with open(os.path.join(self.root, rel), "rb") as f:
+            buf.frombytes(f.read())
+        if not _LITTLE:
+            buf.byteswap()
+        return buf.tolist()
@@ -13,6 +13,7 @@ def main():
     parser = argparse.ArgumentParser(description="Hospital A FL client")
     parser.add_argument("--round", required=True, help="round id, e.g. R1")
     parser.add_argument("--base_url", default="http://127.0.0.1:8000")
+    parser.add_argument("--wire", choices=("json", "binary", "auto"), default="json")
     args = parser.parse_args()
 
     payload = generate_update(args.round, "HospitalA")
@@ -23,7 +24,7 @@ def main():
     print(f"weights head: {head}")
 
     try:
-        resp = send_update(args.base_url, payload)
+        resp = send_update(args.base_url, payload, wire=args.wire)
     except requests.RequestException as e:
         print(f"Failed to reach aggregator: {e}", file=sys.stderr)
         sys.exit(1)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+import httpx
+
+try:
+    from .simulator import Simulator
+except ImportError:  # 以脚本方式运行 (python loadtest.py)
+    from simulator import Simulator
+
+
+# =========================
+# aggregator 压测：不同并发 client 数下的 req/s 与 p99
+# =========================
+#
+# 每个并发级别用 Simulator 跑若干轮，所有 client 同时上传（arrival=none，
+# 并发上限 = client 数）。--serve 会在子进程里启动待测服务（独立临时 data dir），
+# 便于对比 Flask 开发服务器与 ASGI 入口：
+#
+#   python loadtest.py --serve asgi --levels 10,100,1000
+#   python loadtest.py --serve flask
+#   python loadtest.py --base_url http://host:8000        # 压测已运行的服务
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SERVERS = {
+    "asgi": [os.path.join(HERE, "asgi.py")],
+    "flask": [os.path.join(HERE, "aggregator.py")],
+}
+
+
+def _start_server(kind: str, port: int, data_dir: str, wait: float = 30.0) -> subprocess.Popen:
+    cmd = [sys.executable] + SERVERS[kind] + ["--port", str(port), "--data-dir", data_dir]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}/status"
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{kind} server did not come up on port {port}")
+
+
+def run_levels(
+    base_url: str,
+    levels: t.Sequence[int],
+    dim: int,
+    rounds: int,
+    wire: str,
+) -> t.List[t.Dict]:
+    rows = []
+    for n in levels:
+        sim = Simulator(
+            base_url, n, dim, rounds, arrival="none", wire=wire,
+            concurrency=n, round_prefix=f"LOAD-{n}-{int(time.time())}",
+        )
+        report = asyncio.run(sim.run())
+        rows.append({
+            "clients": n,
+            "requestsPerSec": report["requestsPerSec"],
+            "p50Ms": report["latencyMs"].get("p50"),
+            "p99Ms": report["latencyMs"].get("p99"),
+            "statuses": report["statuses"],
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aggregator load test: req/s and p99 per concurrency level")
+    parser.add_argument("--base_url", default="http://127.0.0.1:8000")
+    parser.add_argument("--serve", choices=("none",) + tuple(SERVERS), default="none",
+                        help="start this server in a subprocess with a fresh data dir")
+    parser.add_argument("--port", type=int, default=8300, help="port for --serve")
+    parser.add_argument("--levels", default="10,100,1000", help="comma separated concurrent client counts")
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--wire", choices=("json", "binary"), default="json")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",")]
+    if args.serve == "none":
+        rows = run_levels(args.base_url, levels, args.dim, args.rounds, args.wire)
+    else:
+        with tempfile.TemporaryDirectory(prefix="fl-loadtest-") as data_dir:
+            proc = _start_server(args.serve, args.port, data_dir)
+            try:
+                rows = run_levels(f"http://127.0.0.1:{args.port}", levels, args.dim, args.rounds, args.wire)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"server={args.serve} dim={args.dim} rounds={args.rounds} wire={args.wire}")
+        print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}  statuses")
+        for r in rows:
+            print(f"{r['clients']:>8} {r['requestsPerSec']:>10} {r['p50Ms']:>10} {r['p99Ms']:>10}  {r['statuses']}")
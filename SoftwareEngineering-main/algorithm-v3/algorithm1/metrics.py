@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import bisect
+import functools
+import math
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+# =========================
+# 进程内指标（Prometheus 文本格式）
+# =========================
+#
+# counter / histogram / gauge 三种类型，GET /metrics 返回 render() 的结果。
+# FL_METRICS=0 时整体关闭：工厂函数返回共享的空对象，timed() 直接返回原函数，
+# timed_lock() 直接返回原锁，热路径上没有任何计时或加锁开销。
+# 开关在 import 时读取，需在进程启动前设置。
+
+ENABLED = os.environ.get("FL_METRICS", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒：50µs .. 10s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# 字节：1KB .. 256MB（x4）
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+# 权重维度：100 .. 10^8
+DIM_BUCKETS = tuple(10 ** i for i in range(2, 9))
+# 批大小
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _fmt(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        # 无 label 的指标直接使用这个 child，热路径上不查字典
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        return sorted(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1.0) -> None:
+        with self._lock:
+            self.value += n
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, n: float = 1.0) -> None:
+        self._default.inc(n)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_str(self.labelnames, values)} {_fmt(child.value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)     # 最后一格为 +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v: float) -> None:
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, v: float) -> None:
+        self._default.observe(v)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cum = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cum += n
+            le = _label_str(self.labelnames, values, f'le="{_fmt(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cum}")
+        labels = _label_str(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_fmt(total)}")
+        lines.append(f"{self.name}_count{labels} {cum}")
+        return lines
+
+
+class Gauge(_Metric):
+    """抓取时调用 fn 取值（队列深度等）；有 labels 时 fn 返回 {label 值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn: Callable, labels=()):
+        self.fn = fn
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return None
+
+    def render(self) -> List[str]:
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            for values, v in sorted((value or {}).items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_fmt(v)}")
+        else:
+            lines.append(f"{self.name} {_fmt(value)}")
+        return lines
+
+
+# =========================
+# 关闭时使用的空对象
+# =========================
+
+class _Noop:
+    __slots__ = ()
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, n: float = 1.0) -> None:
+        pass
+
+    def observe(self, v: float) -> None:
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = _Noop()
+
+
+# =========================
+# 注册表
+# =========================
+
+_REGISTRY: Dict[str, _Metric] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _register(metric: _Metric):
+    # 同名指标只注册一次，重复注册返回已有的对象
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()):
+    return _register(Counter(name, help, labels)) if ENABLED else NOOP
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labels, buckets)) if ENABLED else NOOP
+
+
+def gauge(name: str, help: str, fn: Callable, labels: Sequence[str] = ()) -> None:
+    if ENABLED:
+        with _REGISTRY_LOCK:
+            # 回调型 gauge 以最后一次注册为准（例如新建的 pipeline）
+            _REGISTRY[name] = Gauge(name, help, fn, labels)
+
+
+def timed(hist):
+    """函数耗时装饰器；关闭时原样返回函数"""
+    def wrap(fn):
+        if hist is NOOP:
+            return fn
+
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - t0)
+        return inner
+    return wrap
+
+
+class _TimedLock:
+    """记录 acquire 等待时间的锁包装（支持 with）"""
+
+    __slots__ = ("_lock", "_wait")
+
+    def __init__(self, lock, wait):
+        self._lock = lock
+        self._wait = wait
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        t0 = time.perf_counter()
+        ok = self._lock.acquire(blocking, timeout)
+        self._wait.observe(time.perf_counter() - t0)
+        return ok
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+        return False
+
+
+def timed_lock(lock, hist, *labels):
+    return lock if hist is NOOP else _TimedLock(lock, hist.labels(*labels))
+
+
+def render() -> str:
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    lines: List[str] = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Optional[str]:
+    """/metrics 的响应体；关闭时返回 None（路由返回 404）"""
+    return render() if ENABLED else None
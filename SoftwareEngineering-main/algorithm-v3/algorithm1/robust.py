@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import statistics
+import tempfile
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时走纯 Python 兜底（逐坐标排序，仅适合小规模）
+    np = None
+
+try:
+    from .round_registry import AggregationRule
+except ImportError:  # 以脚本方式运行
+    from round_registry import AggregationRule
+
+
+# =========================
+# Byzantine 鲁棒聚合
+# =========================
+#
+# 输入为 (n_clients, dim) 矩阵 W 与各 client 的 samples。
+#
+#   median        逐坐标 np.partition 选第 n/2 个（introselect，O(n) / 坐标）
+#   trimmed_mean  逐坐标两次 np.partition 分出最小 / 最大各 b 个，对中间取平均，O(n) / 坐标
+#   krum          按列块累加 Gram 矩阵 G = W Wᵀ（BLAS），由 ||wi||² + ||wj||² - 2G
+#                 得到两两距离，O(n² · dim)；每行用 np.partition 取最近的 n - f - 2 个
+#
+# median / trimmed_mean 不按 samples 加权，避免单个 client 虚报样本量左右结果；
+# multi_krum 对选中的 update 做 FedAvg。
+#
+# 所有 kernel 按列分块处理，临时内存只与块大小有关；W 超过 _IN_MEMORY_BYTES
+# 时放在临时文件上的 np.memmap 中。
+#
+# 选择类 kernel 先把列块转置成 (cols, n) 的连续数组，使每个坐标的 n 个值相邻；
+# 且每次只用单个 kth 调用 partition（numpy 对单 kth 有 SIMD 快速路径，
+# 多个 kth 会慢数倍）。
+
+# Gram 矩阵 / 加权求和的列块约含的元素数（n × block_cols）
+_BLOCK_ELEMS = 1 << 22
+
+# 选择类 kernel 的列块（转置后的块留在 L2 中）
+_SELECT_BLOCK_ELEMS = 1 << 18
+
+# W 超过该大小时改用磁盘上的 memmap
+_IN_MEMORY_BYTES = 512 << 20
+
+
+def _column_blocks(n: int, dim: int, elems: int = _BLOCK_ELEMS):
+    cols = max(1, elems // max(n, 1))
+    for start in range(0, dim, cols):
+        yield start, min(start + cols, dim)
+
+
+def alloc_matrix(n: int, dim: int):
+    """(n, dim) float64 矩阵；过大时放在临时文件上"""
+    if n * dim * 8 <= _IN_MEMORY_BYTES:
+        return np.empty((n, dim), dtype=np.float64)
+    return np.memmap(tempfile.TemporaryFile(), dtype=np.float64, mode="w+", shape=(n, dim))
+
+
+# =========================
+# NumPy kernels
+# =========================
+
+def _transposed_block(W, s: int, e: int):
+    """W[:, s:e] 的 (cols, n) 连续副本，可原地 partition"""
+    return np.ascontiguousarray(W[:, s:e].T)
+
+
+def coordinate_median(W):
+    n, dim = W.shape
+    hi = n // 2
+    out = np.empty(dim, dtype=np.float64)
+    for s, e in _column_blocks(n, dim, _SELECT_BLOCK_ELEMS):
+        blk = _transposed_block(W, s, e)
+        blk.partition(hi, axis=1)
+        if n % 2:
+            out[s:e] = blk[:, hi]
+        else:
+            # 偶数个：第 hi-1 小即左半部分的最大值
+            out[s:e] = (blk[:, :hi].max(axis=1) + blk[:, hi]) * 0.5
+    return out
+
+
+def _trim_count(n: int, trim_ratio: float) -> int:
+    # 至少保留一行
+    return min(int(n * trim_ratio), (n - 1) // 2)
+
+
+def trimmed_mean(W, trim_ratio: float):
+    n, dim = W.shape
+    b = _trim_count(n, trim_ratio)
+    if b == 0:
+        return W.mean(axis=0)
+
+    keep = n - 2 * b
+    out = np.empty(dim, dtype=np.float64)
+    for s, e in _column_blocks(n, dim, _SELECT_BLOCK_ELEMS):
+        blk = _transposed_block(W, s, e)
+        # 第一次分出最小的 b 个，第二次在剩余部分中分出最大的 b 个
+        blk.partition(b, axis=1)
+        rest = blk[:, b:]
+        rest.partition(keep - 1, axis=1)
+        out[s:e] = rest[:, :keep].mean(axis=1)
+    return out
+
+
+def pairwise_sq_distances(W):
+    """两两平方欧氏距离（按列块累加 Gram 矩阵，不构造 n × n × dim 的差值）"""
+    n, dim = W.shape
+    gram = np.zeros((n, n), dtype=np.float64)
+    for s, e in _column_blocks(n, dim):
+        blk = W[:, s:e]
+        gram += blk @ blk.T
+
+    sq = np.diag(gram).copy()
+    dist = sq[:, None] + sq[None, :] - 2 * gram
+    np.maximum(dist, 0, out=dist)   # 消除舍入产生的负数
+    return dist
+
+
+def krum_scores(W, byzantine: int):
+    """每个 update 到最近 n - f - 2 个其它 update 的平方距离之和"""
+    n = W.shape[0]
+    if n == 1:
+        return np.zeros(1)
+    dist = pairwise_sq_distances(W)
+    np.fill_diagonal(dist, np.inf)
+    k = min(max(1, n - byzantine - 2), n - 1)
+    return np.partition(dist, k - 1, axis=1)[:, :k].sum(axis=1)
+
+
+def weighted_rows(W, rows: Sequence[int], samples: Sequence[float]):
+    """选中行的 samples 加权平均（按列块，避免花式索引复制整块 W）"""
+    coeffs = np.asarray([samples[i] for i in rows], dtype=np.float64)
+    coeffs /= coeffs.sum()
+    rows = np.asarray(rows)
+    dim = W.shape[1]
+    out = np.empty(dim, dtype=np.float64)
+    for s, e in _column_blocks(len(rows), dim):
+        out[s:e] = coeffs @ W[rows, s:e]
+    return out
+
+
+# =========================
+# 纯 Python 兜底
+# =========================
+
+def _py_median(W: List[List[float]]) -> List[float]:
+    return [statistics.median(col) for col in zip(*W)]
+
+
+def _py_trimmed_mean(W: List[List[float]], trim_ratio: float) -> List[float]:
+    n = len(W)
+    b = _trim_count(n, trim_ratio)
+    out = []
+    for col in zip(*W):
+        kept = sorted(col)[b:n - b]
+        out.append(sum(kept) / len(kept))
+    return out
+
+
+def _py_krum_scores(W: List[List[float]], byzantine: int) -> List[float]:
+    n = len(W)
+    if n == 1:
+        return [0.0]
+    k = min(max(1, n - byzantine - 2), n - 1)
+    scores = []
+    for i, wi in enumerate(W):
+        dists = sorted(
+            sum((a - b) ** 2 for a, b in zip(wi, wj)) for j, wj in enumerate(W) if j != i
+        )
+        scores.append(sum(dists[:k]))
+    return scores
+
+
+def _py_weighted_rows(W, rows: Sequence[int], samples: Sequence[float]) -> List[float]:
+    total = float(sum(samples[i] for i in rows))
+    out = [0.0] * len(W[0])
+    for i in rows:
+        c = samples[i] / total
+        out = [a + x * c for a, x in zip(out, W[i])]
+    return out
+
+
+# =========================
+# 入口
+# =========================
+
+def _select_count(rule: AggregationRule, n: int) -> int:
+    if rule.name == "krum":
+        return 1
+    m = rule.select if rule.select is not None else n - rule.byzantine
+    return min(max(1, m), n)
+
+
+def combine(rule: AggregationRule, W, samples: Sequence[float]) -> Tuple[object, Optional[List[int]]]:
+    """对矩阵 W 应用鲁棒规则，返回 (global 向量, Krum 选中的行号或 None)"""
+    if rule.name == "median":
+        return (coordinate_median(W) if np is not None else _py_median(W)), None
+    if rule.name == "trimmed_mean":
+        if np is not None:
+            return trimmed_mean(W, rule.trim_ratio), None
+        return _py_trimmed_mean(W, rule.trim_ratio), None
+    if rule.name in ("krum", "multi_krum"):
+        n = len(W)
+        m = _select_count(rule, n)
+        if np is not None:
+            scores = krum_scores(W, rule.byzantine)
+            rows = sorted(np.argsort(scores, kind="stable")[:m].tolist())
+            return weighted_rows(W, rows, samples), rows
+        scores = _py_krum_scores(W, rule.byzantine)
+        rows = sorted(sorted(range(n), key=scores.__getitem__)[:m])
+        return _py_weighted_rows(W, rows, samples), rows
+    raise ValueError(f"Not a buffered aggregation rule: {rule.name}")
+
+
+def aggregate(
+    rule: AggregationRule, accum, close: bool = True
+) -> Tuple[List[float], float, Optional[List[str]]]:
+    """从 RoundAccumulator 读回本轮全部 update 并聚合。
+
+    返回 (global_weights, avg_local_acc, 选中的 client 列表或 None)；
+    Krum 类规则下 avg_local_acc 只统计被选中的 client。
+    close=False 时不释放累加器的临时文件（见 RoundAccumulator.finalize）。
+    """
+    clients, samples, local_accs, W = accum.stack()
+    try:
+        vec, rows = combine(rule, W, samples)
+    finally:
+        if close:
+            accum.close()
+
+    chosen = range(len(clients)) if rows is None else rows
+    total = sum(samples[i] for i in chosen)
+    avg_acc = sum(local_accs[i] * samples[i] for i in chosen) / total
+    weights = vec.tolist() if np is not None else list(vec)
+    return weights, avg_acc, None if rows is None else [clients[i] for i in rows]
+
+
+# =========================
+# 代价对比（相对 FedAvg）
+# =========================
+
+RULES_TO_COMPARE = ("median", "trimmed_mean", "krum", "multi_krum")
+
+
+def _compare(clients: int, dim: int, byzantine: int, seed: int = 0) -> Dict[str, Dict[str, float]]:
+    """随机矩阵上各规则的耗时（及相对 FedAvg 的倍数）；前 byzantine 行为放大的恶意 update。
+
+    error 为与诚实 client 均值的 L2 距离，用于直观对比鲁棒性。
+    """
+    rng = np.random.default_rng(seed)
+    W = alloc_matrix(clients, dim)
+    W[:] = rng.normal(size=(clients, dim))
+    W[:byzantine] *= 100.0
+    samples = rng.integers(50, 150, size=clients).astype(np.float64)
+    honest = W[byzantine:].mean(axis=0)
+
+    results = {}
+    t0 = time.perf_counter()
+    fedavg = (samples @ W) / samples.sum()
+    base = time.perf_counter() - t0
+    results["fedavg"] = {"ms": base * 1000, "x": 1.0,
+                         "error": float(np.linalg.norm(fedavg - honest))}
+
+    for name in RULES_TO_COMPARE:
+        rule = AggregationRule(name=name, byzantine=byzantine)
+        t0 = time.perf_counter()
+        vec, _ = combine(rule, W, samples)
+        dt = time.perf_counter() - t0
+        results[name] = {"ms": dt * 1000, "x": dt / base if base else float("inf"),
+                         "error": float(np.linalg.norm(vec - honest))}
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cost of robust aggregation rules vs FedAvg")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=100_000)
+    parser.add_argument("--byzantine", type=int, default=5)
+    args = parser.parse_args()
+
+    if np is None:
+        raise SystemExit("numpy is required for the comparison")
+    for name, r in _compare(args.clients, args.dim, args.byzantine).items():
+        print(f"{name:>13}: {r['ms']:10.2f} ms  x{r['x']:7.1f}  error={r['error']:.4g}")
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+try:
+    from . import metrics
+except ImportError:  # 以脚本方式运行
+    import metrics
+
+
+# =========================
+# 多轮并行：轮次注册表
+# =========================
+
+# 各把锁的 acquire 等待时间（label lock=global / round）
+LOCK_WAIT = metrics.histogram(
+    "fl_lock_wait_seconds", "Time spent waiting to acquire aggregator locks", ("lock",)
+)
+
+
+class RoundClosedError(Exception):
+    """round 已聚合（或已过期丢弃），迟到的 update 不再接收"""
+
+
+class TooManyRoundsError(Exception):
+    """同时打开的 round 数超过上限"""
+
+
+CLOSE_MODES = ("all", "quorum", "deadline")
+
+
+@dataclass(frozen=True)
+class ClosePolicy:
+    """round 何时关闭并聚合。
+
+    - all:      expected_clients 全部到齐
+    - quorum:   收到 quorum 个 client（或 expected 全部到齐）
+    - deadline: 打开 deadline_s 秒后（或 expected 全部到齐）
+    """
+    mode: str = "all"
+    quorum: Optional[int] = None
+    deadline_s: Optional[float] = None
+
+    def __post_init__(self):
+        if self.mode not in CLOSE_MODES:
+            raise ValueError(f"Unknown close policy: {self.mode}")
+        if self.mode == "quorum" and (not isinstance(self.quorum, int) or self.quorum < 1):
+            raise ValueError("quorum policy requires a positive int `quorum`")
+        if self.mode == "deadline" and (
+            not isinstance(self.deadline_s, (int, float)) or self.deadline_s <= 0
+        ):
+            raise ValueError("deadline policy requires a positive `deadline_s`")
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+RULES = ("fedavg", "median", "trimmed_mean", "krum", "multi_krum")
+
+
+@dataclass(frozen=True)
+class AggregationRule:
+    """round 关闭时如何合并 update（kernel 见 robust.py）。
+
+    - fedavg:       按 samples 加权平均（流式累加，默认）
+    - median:       逐坐标中位数
+    - trimmed_mean: 逐坐标去掉两端各 trim_ratio 后取平均
+    - krum:         选出与最近 n - f - 2 个邻居距离和最小的一个 update
+    - multi_krum:   按 Krum 得分选出 select 个（缺省 n - f），再做 FedAvg
+
+    除 fedavg 外都需要本轮全部 update，关闭时从累加器的临时文件读回。
+    """
+    name: str = "fedavg"
+    trim_ratio: float = 0.1
+    byzantine: int = 1
+    select: Optional[int] = None
+
+    def __post_init__(self):
+        if self.name not in RULES:
+            raise ValueError(f"Unknown aggregation rule: {self.name}")
+        if not isinstance(self.trim_ratio, (int, float)) or not 0 <= self.trim_ratio < 0.5:
+            raise ValueError("`trim_ratio` must be in [0, 0.5)")
+        if not isinstance(self.byzantine, int) or self.byzantine < 0:
+            raise ValueError("`byzantine` must be a non-negative int")
+        if self.select is not None and (not isinstance(self.select, int) or self.select < 1):
+            raise ValueError("`select` must be a positive int")
+
+    @property
+    def buffered(self) -> bool:
+        return self.name != "fedavg"
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class Round:
+    """单个 round 的状态；accumulator 与字段读写都在 self.lock 下进行"""
+
+    def __init__(
+        self,
+        round_id: str,
+        expected_clients: Iterable[str],
+        policy: ClosePolicy,
+        rule: Optional[AggregationRule] = None,
+    ):
+        self.round_id = round_id
+        self.expected_clients: FrozenSet[str] = frozenset(expected_clients)
+        self.policy = policy
+        self.rule = rule or AggregationRule()
+        self.lock = metrics.timed_lock(threading.Lock(), LOCK_WAIT, "round")
+        self.opened_at = time.monotonic()
+        self.last_activity = self.opened_at     # 最近一次收到 update 的时间（空闲淘汰用）
+        self.accumulator = None
+        self.base_round: Optional[str] = None   # accumulator 创建时的 global round
+        self.closed = False
+
+    @property
+    def received(self) -> List[str]:
+        return self.accumulator.clients if self.accumulator is not None else []
+
+    def touch(self) -> None:
+        self.last_activity = time.monotonic()
+
+    def idle_for(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return now - self.last_activity
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        if self.policy.mode != "deadline":
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self.opened_at >= self.policy.deadline_s
+
+    def ready(self, now: Optional[float] = None) -> bool:
+        """是否满足关闭条件（调用方需持有 self.lock）"""
+        received = self.received
+        if not received:
+            return False
+        if self.expected_clients and self.expected_clients.issubset(received):
+            return True
+        if self.policy.mode == "quorum":
+            return len(received) >= self.policy.quorum
+        return self.expired(now)
+
+    def describe(self) -> Dict:
+        return {
+            "roundId": self.round_id,
+            "expectedClients": sorted(self.expected_clients),
+            "receivedClients": self.received,
+            "policy": self.policy.to_dict(),
+            "aggregation": self.rule.to_dict(),
+            "ageSec": round(time.monotonic() - self.opened_at, 3),
+            "idleSec": round(self.idle_for(), 3),
+        }
+
+
+class RoundRegistry:
+    """round_id -> Round。
+
+    注册表自身的锁只保护字典的插入 / 删除，聚合计算只持有各 round 的锁，
+    因此不同 round 的上传互不争用。
+    """
+
+    def __init__(
+        self,
+        default_expected: Iterable[str],
+        default_policy: Optional[ClosePolicy] = None,
+        max_open: int = 64,
+        remember_closed: int = 1024,
+        default_rule: Optional[AggregationRule] = None,
+        idle_ttl: Optional[float] = 3600.0,
+    ):
+        self.default_expected = frozenset(default_expected)
+        self.default_policy = default_policy or ClosePolicy()
+        self.default_rule = default_rule or AggregationRule()
+        self.max_open = max_open
+        # 超过 idle_ttl 秒没有新 update 的 round 由清扫线程丢弃（None = 不淘汰），
+        # 避免永远凑不齐的 round 占满 max_open
+        self.idle_ttl = idle_ttl
+        self._remember_closed = remember_closed
+        self._lock = threading.Lock()
+        self._rounds: "OrderedDict[str, Round]" = OrderedDict()
+        self._closed: "OrderedDict[str, None]" = OrderedDict()
+
+    def open(
+        self,
+        round_id: str,
+        expected_clients: Optional[Iterable[str]] = None,
+        policy: Optional[ClosePolicy] = None,
+        rule: Optional[AggregationRule] = None,
+    ) -> Round:
+        """显式打开一个 round（可指定 expected_clients、关闭策略与聚合规则）"""
+        with self._lock:
+            if round_id in self._rounds:
+                raise ValueError(f"Round already open: {round_id}")
+            return self._open_locked(round_id, expected_clients, policy, rule)
+
+    def get_or_open(self, round_id: str) -> Round:
+        """首个 update 到达时按默认配置隐式打开 round"""
+        with self._lock:
+            rnd = self._rounds.get(round_id)
+            if rnd is None:
+                rnd = self._open_locked(round_id, None, None, None)
+            return rnd
+
+    def _open_locked(self, round_id, expected_clients, policy, rule) -> Round:
+        if round_id in self._closed:
+            raise RoundClosedError(round_id)
+        if len(self._rounds) >= self.max_open:
+            raise TooManyRoundsError(round_id)
+
+        rnd = Round(
+            round_id,
+            self.default_expected if expected_clients is None else expected_clients,
+            policy or self.default_policy,
+            rule or self.default_rule,
+        )
+        self._rounds[round_id] = rnd
+        return rnd
+
+    def retire(self, rnd: Round) -> None:
+        """round 关闭后从注册表移除，并记住其 id 以拒绝迟到的 update"""
+        with self._lock:
+            self._rounds.pop(rnd.round_id, None)
+            self._closed[rnd.round_id] = None
+            while len(self._closed) > self._remember_closed:
+                self._closed.popitem(last=False)
+
+    def get(self, round_id: str) -> Optional[Round]:
+        with self._lock:
+            return self._rounds.get(round_id)
+
+    def snapshot(self) -> List[Round]:
+        with self._lock:
+            return list(self._rounds.values())
+
+    def expired(self) -> List[Round]:
+        now = time.monotonic()
+        return [r for r in self.snapshot() if r.expired(now)]
+
+    def idle(self) -> List[Round]:
+        """空闲超过 idle_ttl 的 round（deadline round 由 expired() 处理，不在此列）"""
+        if not self.idle_ttl:
+            return []
+        now = time.monotonic()
+        return [
+            r for r in self.snapshot()
+            if not r.expired(now) and r.idle_for(now) >= self.idle_ttl
+        ]
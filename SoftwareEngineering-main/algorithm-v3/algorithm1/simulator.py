@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+import typing as t
+
+import httpx
+
+try:
+    from .client_lib import generate_update
+    from .wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, encode_update
+except ImportError:  # 以脚本方式运行 (python simulator.py)
+    from client_lib import generate_update
+    from wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, encode_update
+
+
+# =========================
+# 多医院并发模拟（压测 aggregator）
+# =========================
+#
+# 单进程内用 asyncio + 连接池 httpx.AsyncClient 驱动成百上千个合成医院：
+# 每轮先 POST /rounds 声明 expectedClients，再让各医院按到达分布延迟后上传。
+#
+# 指定 regions（region 聚合器地址，见 hierarchy.py）时，医院按轮转分到各 region：
+# root 上的 round 以各 region id 为 expectedClients，各 region 上的 round 只期待本区医院。
+#
+# speed_spread > 0 时每个医院有固定的快慢倍率（lognormal），到达延迟按倍率放大，
+# 模拟算力差异很大的医院；run_async() 对应 aggregator 的异步模式（--async-buffer）：
+# 不开 round，各医院独立循环「训练 -> 上传」，带上最近一次响应里的 modelVersion。
+
+ARRIVALS = ("none", "uniform", "exponential", "lognormal")
+
+
+def _arrival_delay(rnd: random.Random, dist: str, mean: float) -> float:
+    """单个 client 在本轮内的到达延迟（秒）"""
+    if dist == "none" or mean <= 0:
+        return 0.0
+    if dist == "uniform":
+        return rnd.uniform(0, 2 * mean)
+    if dist == "exponential":
+        return rnd.expovariate(1 / mean)
+    # lognormal：长尾（少数很慢的医院），sigma=1 时均值为 mean
+    return rnd.lognormvariate(0, 1) * mean / 1.6487
+
+
+def _percentiles(samples: t.List[float]) -> t.Dict[str, float]:
+    if not samples:
+        return {}
+    xs = sorted(samples)
+
+    def pct(p: float) -> float:
+        return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+    return {
+        "p50": round(pct(50) * 1000, 3),
+        "p90": round(pct(90) * 1000, 3),
+        "p99": round(pct(99) * 1000, 3),
+        "max": round(xs[-1] * 1000, 3),
+    }
+
+
+class Simulator:
+    def __init__(
+        self,
+        base_url: str,
+        clients: int,
+        dim: int,
+        rounds: int,
+        arrival: str = "exponential",
+        arrival_mean: float = 0.05,
+        wire: str = "binary",
+        concurrency: int = 256,
+        timeout: float = 60.0,
+        seed: int = 0,
+        round_prefix: t.Optional[str] = None,
+        rng: str = "numpy",
+        regions: t.Sequence[str] = (),
+        speed_spread: float = 0.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.regions = [u.rstrip("/") for u in regions]
+        self.client_ids = [f"Hospital{i:05d}" for i in range(clients)]
+        self.dim = dim
+        self.rounds = rounds
+        self.arrival = arrival
+        self.arrival_mean = arrival_mean
+        self.wire = wire
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rnd = random.Random(seed)
+        # 默认每次运行一个新前缀：已关闭的 round id 不能再次打开
+        self.round_prefix = round_prefix or f"SIM-{int(time.time() * 1000)}"
+        self.gen_rng = rng
+        # 每个医院的快慢倍率（1 = 平均速度）
+        self.slowness = {
+            cid: self.rnd.lognormvariate(0, speed_spread) if speed_spread > 0 else 1.0
+            for cid in self.client_ids
+        }
+
+        self.latencies: t.List[float] = []
+        self.statuses: t.Dict[str, int] = {}
+
+    def _delay(self, client_id: str) -> float:
+        return _arrival_delay(self.rnd, self.arrival, self.arrival_mean) * self.slowness[client_id]
+
+    def _encode(self, round_id: str, client_id: str,
+                base_version: t.Optional[int] = None) -> t.Tuple[bytes, str]:
+        binary = self.wire == "binary"
+        payload = generate_update(
+            round_id, client_id, weights_len=self.dim,
+            rng=self.gen_rng, as_array=binary and self.gen_rng == "numpy",
+        )
+        if base_version is not None:
+            payload["baseVersion"] = base_version
+        if binary:
+            return encode_update(payload), WIRE_CONTENT_TYPE
+        return json.dumps(payload).encode(), "application/json"
+
+    async def _one(self, http: httpx.AsyncClient, sem: asyncio.Semaphore,
+                   round_id: str, client_id: str, delay: float, url: str) -> None:
+        await asyncio.sleep(delay)
+        # 生成 + 编码是 CPU 工作，放到线程里避免阻塞事件循环
+        body, ctype = await asyncio.to_thread(self._encode, round_id, client_id)
+
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                resp = await http.post(
+                    url + "/submit_update", content=body, headers={"Content-Type": ctype}
+                )
+                key = str(resp.status_code)
+            except httpx.HTTPError as e:
+                key = type(e).__name__
+            self.latencies.append(time.perf_counter() - t0)
+
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    async def _open(self, http: httpx.AsyncClient, url: str, round_id: str,
+                    expected: t.List[str]) -> None:
+        resp = await http.post(url + "/rounds", json={
+            "roundId": round_id,
+            "expectedClients": expected,
+        })
+        if resp.status_code != 200:
+            raise RuntimeError(f"cannot open round {round_id} on {url}: {resp.text}")
+
+    async def _region_ids(self, http: httpx.AsyncClient) -> t.List[str]:
+        ids = []
+        for url in self.regions:
+            region = (await http.get(url + "/status")).json().get("region")
+            if not region:
+                raise RuntimeError(f"{url} is not running as a regional aggregator")
+            ids.append(region)
+        return ids
+
+    async def run(self) -> t.Dict:
+        limits = httpx.Limits(
+            max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+        )
+        sem = asyncio.Semaphore(self.concurrency)
+        round_times = []
+
+        async with httpx.AsyncClient(
+            base_url=self.base_url, limits=limits, timeout=self.timeout
+        ) as http:
+            # 每个医院上传到哪个地址
+            if self.regions:
+                region_ids = await self._region_ids(http)
+                targets = {
+                    cid: self.regions[i % len(self.regions)]
+                    for i, cid in enumerate(self.client_ids)
+                }
+            else:
+                targets = dict.fromkeys(self.client_ids, self.base_url)
+
+            t_start = time.perf_counter()
+            for r in range(self.rounds):
+                round_id = f"{self.round_prefix}-{r + 1}"
+                if self.regions:
+                    await self._open(http, self.base_url, round_id, region_ids)
+                    for url in self.regions:
+                        await self._open(http, url, round_id,
+                                         [c for c in self.client_ids if targets[c] == url])
+                else:
+                    await self._open(http, self.base_url, round_id, self.client_ids)
+
+                t0 = time.perf_counter()
+                await asyncio.gather(*(
+                    self._one(http, sem, round_id, cid, self._delay(cid), targets[cid])
+                    for cid in self.client_ids
+                ))
+                round_times.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - t_start
+
+        return {
+            "clients": len(self.client_ids),
+            "dim": self.dim,
+            "rounds": self.rounds,
+            "wire": self.wire,
+            "arrival": self.arrival,
+            "regions": len(self.regions),
+            "requests": len(self.latencies),
+            "statuses": self.statuses,
+            "latencyMs": _percentiles(self.latencies),
+            "roundsPerSec": round(self.rounds / elapsed, 4) if elapsed else None,
+            "requestsPerSec": round(len(self.latencies) / elapsed, 2) if elapsed else None,
+            "meanRoundSec": round(sum(round_times) / len(round_times), 4) if round_times else None,
+        }
+
+    async def _client_loop(self, http: httpx.AsyncClient, sem: asyncio.Semaphore,
+                           client_id: str, version: int, staleness: t.List[int]) -> None:
+        """异步模式下单个医院：rounds 次「训练（延迟）-> 上传」，基于最近看到的模型版本"""
+        for r in range(self.rounds):
+            await asyncio.sleep(self._delay(client_id))
+            body, ctype = await asyncio.to_thread(
+                self._encode, f"{self.round_prefix}-{r + 1}", client_id, version
+            )
+
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    resp = await http.post(
+                        "/submit_update", content=body, headers={"Content-Type": ctype}
+                    )
+                    key = str(resp.status_code)
+                except httpx.HTTPError as e:
+                    resp, key = None, type(e).__name__
+                self.latencies.append(time.perf_counter() - t0)
+
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+            if resp is not None and resp.status_code == 200:
+                data = resp.json()
+                staleness.append(data["staleness"])
+                version = data["modelVersion"]
+
+    async def run_async(self) -> t.Dict:
+        """对 --async-buffer 模式的 aggregator 压测；每个医院上传 rounds 次"""
+        if self.regions:
+            raise ValueError("async simulation does not support regions")
+        limits = httpx.Limits(
+            max_connections=self.concurrency, max_keepalive_connections=self.concurrency
+        )
+        sem = asyncio.Semaphore(self.concurrency)
+        staleness: t.List[int] = []
+
+        async with httpx.AsyncClient(
+            base_url=self.base_url, limits=limits, timeout=self.timeout
+        ) as http:
+            status = (await http.get("/status")).json()
+            if status.get("mode") != "async":
+                raise RuntimeError(f"{self.base_url} is not running in async mode (--async-buffer)")
+            start_version = status["modelVersion"]
+
+            t_start = time.perf_counter()
+            await asyncio.gather(*(
+                self._client_loop(http, sem, cid, start_version, staleness)
+                for cid in self.client_ids
+            ))
+            elapsed = time.perf_counter() - t_start
+            versions = (await http.get("/status")).json()["modelVersion"] - start_version
+
+        return {
+            "clients": len(self.client_ids),
+            "dim": self.dim,
+            "updatesPerClient": self.rounds,
+            "wire": self.wire,
+            "arrival": self.arrival,
+            "requests": len(self.latencies),
+            "statuses": self.statuses,
+            "latencyMs": _percentiles(self.latencies),
+            "modelVersions": versions,
+            "modelsPerSec": round(versions / elapsed, 4) if elapsed else None,
+            "requestsPerSec": round(len(self.latencies) / elapsed, 2) if elapsed else None,
+            "meanStaleness": round(sum(staleness) / len(staleness), 3) if staleness else None,
+            "maxStaleness": max(staleness, default=None),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate many FL hospitals against the aggregator")
+    parser.add_argument("--base_url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--arrival", choices=ARRIVALS, default="exponential")
+    parser.add_argument("--arrival-mean", type=float, default=0.05, help="seconds")
+    parser.add_argument("--wire", choices=("json", "binary"), default="binary")
+    parser.add_argument("--concurrency", type=int, default=256, help="max in-flight requests")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--round-prefix", default=None,
+                        help="round id prefix (default: SIM-<unix ms>, unique per run)")
+    parser.add_argument("--rng", choices=("python", "numpy"), default="numpy",
+                        help="update generator bitstream (see client_lib.generate_update)")
+    parser.add_argument("--regions", default="",
+                        help="comma separated regional aggregator URLs; base_url is then the root")
+    parser.add_argument("--speed-spread", type=float, default=0.0,
+                        help="lognormal sigma of per-hospital slowness (0 = all equally fast)")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="target an aggregator started with --async-buffer; --rounds is then "
+                             "the number of updates per hospital")
+    args = parser.parse_args()
+
+    sim = Simulator(
+        args.base_url, args.clients, args.dim, args.rounds,
+        arrival=args.arrival, arrival_mean=args.arrival_mean, wire=args.wire,
+        concurrency=args.concurrency, seed=args.seed, round_prefix=args.round_prefix,
+        rng=args.rng, regions=[u for u in args.regions.split(",") if u],
+        speed_spread=args.speed_spread,
+    )
+    try:
+        report = asyncio.run(sim.run_async() if args.async_mode else sim.run())
+    except RuntimeError as e:
+        # 例如 --round-prefix 指定的 round 已在服务端关闭，或服务端模式不匹配
+        raise SystemExit(f"simulator: {e}")
+    print(json.dumps(report, indent=2))
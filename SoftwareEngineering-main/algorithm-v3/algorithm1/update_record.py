@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from array import array
+from typing import Any, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from .compression import CompressedWeights
+except ImportError:  # 以脚本方式运行
+    from compression import CompressedWeights
+
+
+# =========================
+# 类型化的 update 记录
+# =========================
+#
+# 在入口处（/submit_update、coordinator）解析并校验一次，之后只按属性读取；
+# JSON 数字列表在此转成一次 array('d')，后续引擎直接复用同一块缓冲区。
+# 保留按上传字段名的只读访问（update["samples"] / update.get(...)），
+# 现有按 dict 读取的代码无需修改。
+
+# JSON 上传是 list，二进制上传是 body 上的 view，压缩上传是 CompressedWeights
+WEIGHT_TYPES = (list, array, memoryview, CompressedWeights)
+if np is not None:
+    WEIGHT_TYPES += (np.ndarray,)
+
+
+class ModelUpdate:
+    """algorithm1 所需的字段；不含 algorithm2 的 policyHash / agentClaim / proof"""
+
+    __slots__ = (
+        "round_id", "client_id", "weights", "samples", "local_acc", "timestamp",
+        "recon_error", "base_round", "base_version",
+    )
+
+    # 上传字段名 -> 属性名
+    FIELDS = {
+        "roundId": "round_id",
+        "clientId": "client_id",
+        "weights": "weights",
+        "samples": "samples",
+        "localAcc": "local_acc",
+        "timestamp": "timestamp",
+        "reconError": "recon_error",
+        "baseRound": "base_round",
+        "baseVersion": "base_version",
+    }
+
+    def __init__(
+        self,
+        round_id: str,
+        client_id: str,
+        weights,
+        samples: int,
+        local_acc: float,
+        timestamp: str,
+        recon_error: Optional[float] = None,
+        base_round: Optional[str] = None,
+        base_version: Optional[int] = None,
+    ):
+        self.round_id = round_id
+        self.client_id = client_id
+        self.weights = weights
+        self.samples = samples
+        self.local_acc = local_acc
+        self.timestamp = timestamp
+        self.recon_error = recon_error
+        self.base_round = base_round
+        self.base_version = base_version
+
+    @classmethod
+    def from_dict(cls, p: dict) -> "ModelUpdate":
+        """严格校验 client 上传的 JSON schema，并把 list 权重转成 array('d')"""
+        if not isinstance(p, dict):
+            raise ValueError("payload must be a JSON object")
+
+        try:
+            round_id = p["roundId"]
+            client_id = p["clientId"]
+            weights = p["weights"]
+            samples = p["samples"]
+            local_acc = p["localAcc"]
+            timestamp = p["timestamp"]
+        except KeyError as e:
+            raise ValueError(f"Missing field: {e.args[0]}") from None
+
+        for k, v, t in (
+            ("roundId", round_id, str),
+            ("clientId", client_id, str),
+            ("weights", weights, WEIGHT_TYPES),
+            ("samples", samples, int),
+            ("localAcc", local_acc, float),
+            ("timestamp", timestamp, str),
+        ):
+            if not isinstance(v, t):
+                raise ValueError(f"Field `{k}` must be {t}")
+
+        if isinstance(samples, bool) or samples <= 0:
+            raise ValueError("Field `samples` must be a positive int")
+
+        if len(weights) == 0:
+            raise ValueError("weights cannot be empty")
+
+        recon_error = p.get("reconError")
+        if recon_error is not None and not isinstance(recon_error, (int, float)):
+            raise ValueError("Field `reconError` must be a number")
+
+        # 异步模式（见 async_buffer.py）：client 训练所基于的检查点版本
+        base_version = p.get("baseVersion")
+        if base_version is not None and (
+            not isinstance(base_version, int) or isinstance(base_version, bool) or base_version < 0
+        ):
+            raise ValueError("Field `baseVersion` must be a non-negative int")
+
+        if isinstance(weights, list):
+            try:
+                weights = array("d", weights)
+            except TypeError:
+                raise ValueError("Field `weights` must contain only numbers") from None
+
+        return cls(
+            round_id, client_id, weights, samples, local_acc, timestamp,
+            recon_error, p.get("baseRound"), base_version,
+        )
+
+    # ---- 按上传字段名的只读访问 ----
+
+    def __getitem__(self, key: str) -> Any:
+        # 与 dict 一致：未提供的可选字段视为缺失
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        attr = self.FIELDS.get(key)
+        if attr is None:
+            return default
+        value = getattr(self, attr)
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __repr__(self) -> str:
+        return (
+            f"ModelUpdate(round_id={self.round_id!r}, client_id={self.client_id!r}, "
+            f"dim={len(self.weights)}, samples={self.samples})"
+        )
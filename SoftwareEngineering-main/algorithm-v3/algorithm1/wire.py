@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有 numpy 时用 memoryview 解码
+    np = None
+
+try:
+    from .compression import CODECS, CompressedWeights, compress
+except ImportError:  # 以脚本方式运行
+    from compression import CODECS, CompressedWeights, compress
+
+
+# =========================
+# 二进制 update 格式
+# =========================
+#
+#   magic  "FLW1"                 4 bytes
+#   header_len  uint32 LE         4 bytes
+#   header  UTF-8 JSON            header_len bytes
+#           {roundId, clientId, samples, localAcc, timestamp, dtype, dim}
+#   weights  little-endian f4/f8  dim * itemsize bytes
+#
+# 权重段不经过 JSON，服务端直接在请求 body 上建 view（零拷贝）。
+#
+# 压缩上传（见 compression.py）在 header 中额外带
+#   codec / codecMeta / reconError（topk 还有 baseRound），
+# weights 段换成对应 codec 的编码字节。
+
+CONTENT_TYPE = "application/x-fl-update"
+JSON_CONTENT_TYPE = "application/json"
+
+MAGIC = b"FLW1"
+_PREFIX = struct.Struct("<4sI")
+
+# dtype 名 -> array typecode
+_TYPECODES = {"float32": "f", "float64": "d"}
+
+_LITTLE = sys.byteorder == "little"
+
+
+def encode_update(
+    payload: dict,
+    dtype: str = "float32",
+    codec: Optional[str] = None,
+    base: Optional[Sequence[float]] = None,
+    base_round: Optional[str] = None,
+    topk_ratio: float = 0.01,
+) -> bytes:
+    """把 generate_update 的 dict 编码成二进制 body。
+
+    codec 为 None 时发送稠密 float32/float64；否则按 compression.CODECS 压缩，
+    topk 需要 base（上一轮 global model）与其 base_round。
+    """
+    if dtype not in _TYPECODES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    weights = payload["weights"]
+    header = {k: v for k, v in payload.items() if k != "weights"}
+    header["dtype"] = dtype
+    header["dim"] = len(weights)
+
+    if codec is None:
+        if np is not None and isinstance(weights, np.ndarray):
+            # generate_update(as_array=True) 的 ndarray 直接转换，不逐个装箱
+            data = weights.astype("<f4" if dtype == "float32" else "<f8").tobytes()
+        else:
+            buf = array(_TYPECODES[dtype], weights)
+            if not _LITTLE:
+                buf.byteswap()
+            data = buf.tobytes()
+    else:
+        meta, data, error = compress(weights, codec, base=base, topk_ratio=topk_ratio)
+        header["codec"] = codec
+        header["codecMeta"] = meta
+        header["reconError"] = error
+        if codec == "topk":
+            header["baseRound"] = base_round
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode()
+    return b"".join((_PREFIX.pack(MAGIC, len(header_bytes)), header_bytes, data))
+
+
+def decode_update(body: bytes) -> Tuple[dict, Sequence[float]]:
+    """解析二进制 body，返回 (header, weights)。
+
+    weights 是 body 上的只读 view：有 numpy 时为 np.frombuffer，否则为 memoryview；
+    压缩上传返回 CompressedWeights（同样只持有 body 的 view），由服务端解码器折叠。
+    """
+    if len(body) < _PREFIX.size:
+        raise ValueError("binary update too short")
+
+    magic, header_len = _PREFIX.unpack_from(body, 0)
+    if magic != MAGIC:
+        raise ValueError("bad binary update magic")
+
+    start = _PREFIX.size + header_len
+    if start > len(body):
+        raise ValueError("binary update header truncated")
+    try:
+        header = json.loads(bytes(body[_PREFIX.size:start]))
+    except ValueError:
+        raise ValueError("binary update header is not valid JSON")
+    if not isinstance(header, dict):
+        raise ValueError("binary update header must be an object")
+
+    dtype = header.pop("dtype", None)
+    dim = header.pop("dim", None)
+    codec = header.pop("codec", None)
+    if not isinstance(dim, int) or dim < 0:
+        raise ValueError("Field `dim` must be a non-negative int")
+
+    if codec is not None:
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec: {codec}")
+        meta = header.pop("codecMeta", None)
+        if not isinstance(meta, dict):
+            raise ValueError("Field `codecMeta` must be an object")
+        return header, CompressedWeights(codec, meta, memoryview(body)[start:], dim)
+
+    if dtype not in _TYPECODES:
+        raise ValueError(f"Unsupported dtype: {dtype}")
+
+    itemsize = array(_TYPECODES[dtype]).itemsize
+    if len(body) - start != dim * itemsize:
+        raise ValueError(
+            f"weights buffer size mismatch: expected {dim * itemsize} bytes, got {len(body) - start}"
+        )
+
+    if np is not None:
+        weights = np.frombuffer(body, dtype="<f4" if dtype == "float32" else "<f8",
+                                count=dim, offset=start)
+    elif _LITTLE:
+        weights = memoryview(body)[start:].cast(_TYPECODES[dtype])
+    else:
+        # 大端机器上只能拷贝一次做字节序转换
+        weights = array(_TYPECODES[dtype], bytes(body[start:]))
+        weights.byteswap()
+
+    return header, weights
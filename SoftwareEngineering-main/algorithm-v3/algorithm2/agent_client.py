@@ -3,11 +3,12 @@
 import math
 from typing import Dict
 from algorithm1.client_lib import generate_update
-from .policy import CURRENT_POLICY
+from .policy import POLICIES
 
 
 def _weight_l2_norm(weights):
-    return math.sqrt(sum(w * w for w in weights))
+    # math.hypot 在 C 中一次遍历（且避免中间平方和溢出）
+    return math.hypot(*weights)
 
 
 def generate_agent_update(round_id: str, client_id: str) -> Dict:
@@ -21,14 +22,16 @@ def generate_agent_update(round_id: str, client_id: str) -> Dict:
 
     # Agent-side introspection
     weight_norm = _weight_l2_norm(update["weights"])
-    policy_hash = CURRENT_POLICY.hash()
+    # 读取一次快照，hash 与 version 保证来自同一个 policy
+    policy = POLICIES.active
+    policy_hash = policy.hash()
 
     # Agent claim (to be verified by Algorithm 2)
     agent_claim = {
         "samples_used": update["samples"],
         "reported_accuracy": update["localAcc"],
         "weight_norm": round(weight_norm, 6),
-        "policy_version": CURRENT_POLICY.policy_version
+        "policy_version": policy.policy_version
     }
 
     # Mock ZK proof placeholder (结构对齐真实系统)
@@ -0,0 +1,143 @@
+from typing import Any, Dict, Optional
+
+from algorithm1.update_record import ModelUpdate
+
+
+class AgentUpdate:
+    """
+    Agent update parsed once at the coordinator edge.
+
+    `model` holds the Algorithm 1 fields (weights already in an array('d')
+    or NumPy buffer) and is handed to the aggregator as-is, so dropping the
+    Algorithm 2 fields copies nothing. Reads by wire name (update["samples"],
+    update.get("policyHash")) keep the dict-based verifier and reward working.
+    """
+
+    __slots__ = ("model", "policy_hash", "agent_claim", "proof")
+
+    # wire name -> attribute
+    FIELDS = {
+        "policyHash": "policy_hash",
+        "agentClaim": "agent_claim",
+        "proof": "proof",
+    }
+
+    def __init__(
+        self,
+        model: ModelUpdate,
+        policy_hash: Optional[str] = None,
+        agent_claim: Optional[Dict[str, Any]] = None,
+        proof: Optional[Dict[str, Any]] = None,
+    ):
+        self.model = model
+        self.policy_hash = policy_hash
+        self.agent_claim = agent_claim
+        self.proof = proof
+
+    @classmethod
+    def from_dict(cls, update: Dict[str, Any]) -> "AgentUpdate":
+        """Validate and convert once; raises ValueError on a malformed update."""
+        return cls(
+            ModelUpdate.from_dict(update),
+            update.get("policyHash"),
+            update.get("agentClaim"),
+            update.get("proof"),
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        attr = self.FIELDS.get(key)
+        if attr is None:
+            return self.model.get(key, default)
+        value = getattr(self, attr)
+        return default if value is None else value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __repr__(self) -> str:
+        return f"AgentUpdate({self.model!r}, policy_hash={self.policy_hash!r})"
+
+
+# -----------------------------
+# Allocation microbenchmark
+# -----------------------------
+
+def _bench_allocations(dim: int, updates: int) -> Dict[str, Dict[str, float]]:
+    """
+    Peak traced memory and time per update from an incoming JSON dict to a
+    contribution ready to fold, for the old dict path and the record path.
+
+    The dict path reproduces the pre-record steps: verify the dict, copy it
+    without agent fields, isinstance-check every key, convert the weights
+    list to an engine vector and serialise that vector for the spill file.
+    """
+    import time
+    import tracemalloc
+
+    from algorithm1.fedavg_engine import DenseContribution, get_engine
+    from .agent_client import generate_agent_update
+    from .verifier import verify_update
+
+    engine = get_engine("auto")
+    required = {"roundId": str, "clientId": str, "weights": list,
+                "samples": int, "localAcc": float, "timestamp": str}
+    agent_fields = ("policyHash", "agentClaim", "proof")
+
+    def dict_path(update):
+        verify_update(update)
+        forwarded = dict(update)
+        for k in agent_fields:
+            forwarded.pop(k, None)
+        for k, t in required.items():
+            if not isinstance(forwarded[k], t):
+                raise ValueError(k)
+        vec = engine.as_vector(forwarded["weights"])
+        return vec, vec.tobytes()
+
+    def record_path(update):
+        record = AgentUpdate.from_dict(update)
+        verify_update(record)
+        return DenseContribution.from_vector(engine, engine.as_vector(record.model.weights))
+
+    base = generate_agent_update("BENCH", "HospitalA")
+    base["weights"] = [((i * 7919) % 1000) / 1000.0 - 0.5 for i in range(dim)]
+
+    results = {}
+    for name, path in (("dict", dict_path), ("record", record_path)):
+        tracemalloc.start()
+        peak = 0
+        t0 = time.perf_counter()
+        for _ in range(updates):
+            tracemalloc.reset_peak()
+            start, _ = tracemalloc.get_traced_memory()
+            out = path(base)
+            peak += tracemalloc.get_traced_memory()[1] - start
+            del out
+        elapsed = time.perf_counter() - t0
+        tracemalloc.stop()
+        results[name] = {
+            "peakKiBPerUpdate": round(peak / updates / 1024, 1),
+            "usPerUpdate": round(elapsed / updates * 1e6, 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Per-update allocations: dict path vs AgentUpdate record "
+                    "(run as python -m algorithm2.agent_update)"
+    )
+    parser.add_argument("--dim", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps(_bench_allocations(args.dim, args.updates), indent=2))
@@ -2,8 +2,10 @@
 
 import hashlib
 import json
+import threading
+import time
 from dataclasses import dataclass, asdict
-from typing import Dict
+from typing import Dict, NamedTuple, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -21,12 +23,19 @@ class TrainingPolicy:
         """
         Deterministic policy commitment.
         Used by agent to bind its update to a policy.
+
+        The policy is frozen, so the digest is computed once and cached
+        on the instance (outside the dataclass fields).
         """
-        payload = json.dumps(self.to_dict(), sort_keys=True)
-        return hashlib.sha256(payload.encode()).hexdigest()
+        cached = self.__dict__.get("_commitment")
+        if cached is None:
+            payload = json.dumps(self.to_dict(), sort_keys=True)
+            cached = hashlib.sha256(payload.encode()).hexdigest()
+            self.__dict__["_commitment"] = cached
+        return cached
 
 
-# 当前系统激活的 policy（可热更新）
+# 系统初始激活的 policy（热更新见下方 POLICIES）
 CURRENT_POLICY = TrainingPolicy(
     max_samples=150,
     max_rounds=50,
@@ -34,3 +43,61 @@ CURRENT_POLICY = TrainingPolicy(
     max_weight_norm=25.0,
     policy_version="v1.0"
 )
+
+
+class _Snapshot(NamedTuple):
+    active: TrainingPolicy
+    # policy hash -> (policy, accepted until; None = no expiry)
+    accepted: Dict[str, Tuple[TrainingPolicy, Optional[float]]]
+
+
+class PolicyRegistry:
+    """
+    Versioned policy store with atomic hot reload.
+
+    Readers never lock: they read one immutable snapshot reference.
+    activate() builds a new snapshot and swaps it in, keeping the previous
+    active policy verifiable for `grace_seconds` so updates committed just
+    before the switch are not rejected.
+    """
+
+    def __init__(self, initial: TrainingPolicy, grace_seconds: float = 300.0):
+        self.grace_seconds = grace_seconds
+        self._write_lock = threading.Lock()
+        self._snapshot = _Snapshot(initial, {initial.hash(): (initial, None)})
+
+    @property
+    def active(self) -> TrainingPolicy:
+        return self._snapshot.active
+
+    def activate(self, policy: TrainingPolicy, grace_seconds: Optional[float] = None) -> None:
+        """Make `policy` active; the previous one stays valid for the grace window."""
+        grace = self.grace_seconds if grace_seconds is None else grace_seconds
+        now = time.monotonic()
+
+        with self._write_lock:
+            old = self._snapshot
+            accepted = {
+                h: entry for h, entry in old.accepted.items()
+                if entry[1] is None or entry[1] > now
+            }
+            prev_hash = old.active.hash()
+            if prev_hash != policy.hash():
+                accepted[prev_hash] = (old.active, now + grace)
+            accepted[policy.hash()] = (policy, None)
+            self._snapshot = _Snapshot(policy, accepted)
+
+    def lookup(self, policy_hash: Optional[str]) -> Optional[TrainingPolicy]:
+        """O(1): the policy an update committed to, if it is still accepted."""
+        entry = self._snapshot.accepted.get(policy_hash)
+        if entry is None:
+            return None
+        policy, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            return None
+        return policy
+
+
+# Registry used by the agent, verifier and reward; swap policies via
+# POLICIES.activate(...) rather than rebinding CURRENT_POLICY.
+POLICIES = PolicyRegistry(CURRENT_POLICY)
@@ -1,8 +1,12 @@
 
 from typing import Dict
-from .policy import CURRENT_POLICY
+from algorithm1 import metrics
+from .policy import POLICIES
 
+REWARD_SECONDS = metrics.histogram("fl_reward_seconds", "Time spent in compute_reward")
 
+
+@metrics.timed(REWARD_SECONDS)
 def compute_reward(update: Dict) -> float:
     """
     Reward function designed to incentivize:
@@ -13,6 +17,8 @@ def compute_reward(update: Dict) -> float:
 
     samples = update["samples"]
     acc = update["localAcc"]
+    # 按 update 承诺的 policy 计算；已不被接受时退回当前激活版本
+    policy = POLICIES.lookup(update.get("policyHash")) or POLICIES.active
 
     # 基础贡献
     base_reward = samples * acc
@@ -22,7 +28,7 @@ def compute_reward(update: Dict) -> float:
         base_reward *= 1.2
 
     # efficiency penalty
-    if samples > 0.8 * CURRENT_POLICY.max_samples:
+    if samples > 0.8 * policy.max_samples:
         base_reward *= 0.9
 
     return round(base_reward, 4)
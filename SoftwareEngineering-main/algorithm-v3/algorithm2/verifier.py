@@ -1,55 +1,260 @@
 
-from typing import Dict, Tuple
-from .policy import CURRENT_POLICY
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from algorithm1 import metrics
+from .policy import POLICIES, TrainingPolicy
+
+try:
+    import numpy as np
+except ImportError:  # verify_batch falls back to a plain loop
+    np = None
 
 
 class VerificationError(Exception):
     pass
 
 
-def _check_policy_hash(update: Dict):
-    if update.get("policyHash") != CURRENT_POLICY.hash():
+VERIFY_SECONDS = metrics.histogram("fl_verify_seconds", "Time spent in verify_update")
+VERIFY_BATCH_SECONDS = metrics.histogram("fl_verify_batch_seconds", "Time spent in verify_batch")
+VERIFY_BATCH_SIZE = metrics.histogram(
+    "fl_verify_batch_size", "Updates per verify_batch call", buckets=metrics.COUNT_BUCKETS
+)
+
+
+def _check_policy_hash(update: Dict) -> TrainingPolicy:
+    """Resolve the policy the update committed to (active or still in overlap)."""
+    policy = POLICIES.lookup(update.get("policyHash"))
+    if policy is None:
         raise VerificationError("Policy hash mismatch")
+    return policy
 
 
-def _check_samples(update: Dict):
+def _check_samples(update: Dict, policy: TrainingPolicy):
     samples = update["samples"]
-    if samples > CURRENT_POLICY.max_samples:
+    if samples > policy.max_samples:
         raise VerificationError("Sample count exceeds policy bound")
 
 
-def _check_accuracy(update: Dict):
+def _check_accuracy(update: Dict, policy: TrainingPolicy):
     acc = update["localAcc"]
-    if acc < CURRENT_POLICY.min_accuracy:
+    if acc < policy.min_accuracy:
         raise VerificationError("Reported accuracy below minimum threshold")
 
 
-def _check_weight_norm(update: Dict):
+def _check_weight_norm(update: Dict, policy: TrainingPolicy):
     claimed_norm = update["agentClaim"]["weight_norm"]
-    if claimed_norm > CURRENT_POLICY.max_weight_norm:
+    if claimed_norm > policy.max_weight_norm:
         raise VerificationError("Weight norm exceeds policy limit")
 
 
-def _check_proof_structure(update: Dict):
+def _check_proof_structure(update: Dict, policy: TrainingPolicy):
     proof = update.get("proof", {})
     if proof.get("scheme") != "zk-mock":
         raise VerificationError("Unsupported proof scheme")
-    if proof.get("policy_hash") != CURRENT_POLICY.hash():
+    if proof.get("policy_hash") != policy.hash():
         raise VerificationError("Proof-policy mismatch")
 
 
+@metrics.timed(VERIFY_SECONDS)
 def verify_update(update: Dict) -> Tuple[bool, str]:
     """
     Algorithm 2 verification pipeline.
     Returns (accepted, reason).
+
+    Bounds come from the policy the update committed to, so updates built
+    against the previous version keep verifying during a policy switch.
     """
     try:
-        _check_policy_hash(update)
-        _check_samples(update)
-        _check_accuracy(update)
-        _check_weight_norm(update)
-        _check_proof_structure(update)
+        policy = _check_policy_hash(update)
+        _check_samples(update, policy)
+        _check_accuracy(update, policy)
+        _check_weight_norm(update, policy)
+        _check_proof_structure(update, policy)
     except VerificationError as e:
         return False, str(e)
 
     return True, "accepted"
+
+
+# -----------------------------
+# Server-measured weights
+# -----------------------------
+
+def measured_screen(update: Dict) -> Callable[[object], Optional[str]]:
+    """
+    Build the screen passed to algorithm1.aggregator.submit.
+
+    The aggregator measures the real weight norm while folding the update
+    into the round (one pass over the weights) and calls the screen with
+    the resulting WeightStats; a returned reason rejects and undoes the
+    update. Non-finite weights are rejected by the aggregator itself.
+    The agent's claimed norm is only a cheap pre-filter in verify_update.
+    """
+    policy = POLICIES.lookup(update.get("policyHash")) or POLICIES.active
+    limit = policy.max_weight_norm
+
+    def screen(stats) -> Optional[str]:
+        if stats.norm > limit:
+            return REASONS[WEIGHT_NORM_EXCEEDED]
+        return None
+
+    return screen
+
+
+# -----------------------------
+# Batch verification
+# -----------------------------
+
+# Reason codes returned by verify_batch; messages match verify_update.
+ACCEPTED = 0
+POLICY_HASH_MISMATCH = 1
+SAMPLES_EXCEEDED = 2
+ACCURACY_TOO_LOW = 3
+WEIGHT_NORM_EXCEEDED = 4
+UNSUPPORTED_PROOF = 5
+PROOF_POLICY_MISMATCH = 6
+MALFORMED = 7
+
+REASONS = (
+    "accepted",
+    "Policy hash mismatch",
+    "Sample count exceeds policy bound",
+    "Reported accuracy below minimum threshold",
+    "Weight norm exceeds policy limit",
+    "Unsupported proof scheme",
+    "Proof-policy mismatch",
+    "Malformed update",
+)
+
+
+class BatchVerification(NamedTuple):
+    accepted: List[bool]
+    codes: List[int]
+
+    @property
+    def reasons(self) -> List[str]:
+        return [REASONS[c] for c in self.codes]
+
+
+def _columns(updates: Sequence[Dict]) -> Dict[str, list]:
+    """Pull the fields every check needs into one list per column."""
+    claims = [u.get("agentClaim") for u in updates]
+    proofs = [u.get("proof", {}) for u in updates]
+    return {
+        "policy_hash": [u.get("policyHash") for u in updates],
+        "samples": [u.get("samples") for u in updates],
+        "acc": [u.get("localAcc") for u in updates],
+        "norm": [c.get("weight_norm") if isinstance(c, dict) else None for c in claims],
+        "scheme": [p.get("scheme") if isinstance(p, dict) else None for p in proofs],
+        "proof_hash": [p.get("policy_hash") if isinstance(p, dict) else None for p in proofs],
+    }
+
+
+def _is_number(v) -> bool:
+    return isinstance(v, (int, float))
+
+
+def _resolve_policies(hashes: list) -> List[Optional[TrainingPolicy]]:
+    """One registry lookup per distinct hash in the batch."""
+    seen: Dict[object, Optional[TrainingPolicy]] = {}
+    out = []
+    for h in hashes:
+        try:
+            policy = seen[h]
+        except KeyError:
+            policy = seen[h] = POLICIES.lookup(h)
+        except TypeError:  # unhashable policyHash
+            policy = None
+        out.append(policy)
+    return out
+
+
+def _first_failure(cols: Dict[str, list], i: int, policy: Optional[TrainingPolicy]) -> int:
+    """Scalar path: same check order as verify_update, no exceptions."""
+    if policy is None:
+        return POLICY_HASH_MISMATCH
+    samples, acc, norm = cols["samples"][i], cols["acc"][i], cols["norm"][i]
+    if not _is_number(samples):
+        return MALFORMED
+    if samples > policy.max_samples:
+        return SAMPLES_EXCEEDED
+    if not _is_number(acc):
+        return MALFORMED
+    if acc < policy.min_accuracy:
+        return ACCURACY_TOO_LOW
+    if not _is_number(norm):
+        return MALFORMED
+    if norm > policy.max_weight_norm:
+        return WEIGHT_NORM_EXCEEDED
+    if cols["scheme"][i] != "zk-mock":
+        return UNSUPPORTED_PROOF
+    if cols["proof_hash"][i] != cols["policy_hash"][i]:
+        return PROOF_POLICY_MISMATCH
+    return ACCEPTED
+
+
+def _numeric(col: list):
+    """Non-numbers -> NaN so the comparison is False and the missing mask decides."""
+    arr = np.array([v if _is_number(v) else np.nan for v in col], dtype=np.float64)
+    return arr, np.isnan(arr)
+
+
+def _bounds(policies: List[Optional[TrainingPolicy]], field: str):
+    """Per-row policy bound; NaN where the hash did not resolve (row fails first)."""
+    return np.array(
+        [getattr(p, field) if p is not None else np.nan for p in policies],
+        dtype=np.float64,
+    )
+
+
+def _codes_vectorized(cols: Dict[str, list], policies: List[Optional[TrainingPolicy]]) -> List[int]:
+    n = len(cols["samples"])
+    samples, samples_missing = _numeric(cols["samples"])
+    acc, acc_missing = _numeric(cols["acc"])
+    norm, norm_missing = _numeric(cols["norm"])
+
+    # One row per check, in verify_update order; first failing row wins.
+    fails = np.stack([
+        np.array([p is None for p in policies], dtype=bool),
+        samples_missing | (samples > _bounds(policies, "max_samples")),
+        acc_missing | (acc < _bounds(policies, "min_accuracy")),
+        norm_missing | (norm > _bounds(policies, "max_weight_norm")),
+        np.array([s != "zk-mock" for s in cols["scheme"]], dtype=bool),
+        np.array([ph != h for ph, h in zip(cols["proof_hash"], cols["policy_hash"])], dtype=bool),
+    ])
+    codes = np.stack([
+        np.full(n, POLICY_HASH_MISMATCH),
+        np.where(samples_missing, MALFORMED, SAMPLES_EXCEEDED),
+        np.where(acc_missing, MALFORMED, ACCURACY_TOO_LOW),
+        np.where(norm_missing, MALFORMED, WEIGHT_NORM_EXCEEDED),
+        np.full(n, UNSUPPORTED_PROOF),
+        np.full(n, PROOF_POLICY_MISMATCH),
+    ])
+
+    first = fails.argmax(axis=0)
+    result = np.where(fails.any(axis=0), codes[first, np.arange(n)], ACCEPTED)
+    return result.tolist()
+
+
+@metrics.timed(VERIFY_BATCH_SECONDS)
+def verify_batch(updates: Sequence[Dict]) -> BatchVerification:
+    """
+    Verify a batch of updates column-wise in a single pass.
+
+    Returns the same decision and reason as calling verify_update on each
+    item, but resolves each distinct policy hash once per batch and never
+    raises for rejections. Updates with a missing or non-numeric samples /
+    localAcc / weight_norm get MALFORMED where verify_update would raise.
+    """
+    if not updates:
+        return BatchVerification([], [])
+    VERIFY_BATCH_SIZE.observe(len(updates))
+
+    cols = _columns(updates)
+    policies = _resolve_policies(cols["policy_hash"])
+
+    if np is not None:
+        codes = _codes_vectorized(cols, policies)
+    else:
+        codes = [_first_failure(cols, i, policies[i]) for i in range(len(updates))]
+
+    return BatchVerification([c == ACCEPTED for c in codes], codes)
@@ -1,75 +1,408 @@
 
-from typing import Dict, Any
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Optional
 
 # Algorithm 2 imports
-from algorithm2.verifier import verify_update
+from algorithm2.agent_update import AgentUpdate
+from algorithm2.verifier import MALFORMED, REASONS, measured_screen, verify_batch, verify_update
 from algorithm2.reward import compute_reward
 
-# Algorithm 1 import
-# 假设 aggregator.py 中暴露的是 submit_update(update: dict) -> dict
-from algorithm1.aggregator import submit_update
+# Algorithm 1 imports
+# aggregator.submit(update, screen) -> (body, status)，与 /submit_update 共用同一入口
+from algorithm1 import metrics
+from algorithm1.aggregator import submit
+from algorithm1.update_record import ModelUpdate
 
 
-def _strip_agent_metadata(update: Dict[str, Any]) -> Dict[str, Any]:
+# -----------------------------
+# Metrics (exposed by the aggregator's /metrics in the same process)
+# -----------------------------
+
+HANDLE_SECONDS = metrics.histogram("fl_coordinator_handle_seconds", "Time spent in handle_update")
+UPDATES = metrics.counter(
+    "fl_coordinator_updates_total", "Coordinator responses by status", ("status",)
+)
+STAGE_SECONDS = metrics.histogram(
+    "fl_coordinator_stage_seconds", "Pipeline stage service time per update", ("stage",)
+)
+STAGE_WAIT_SECONDS = metrics.histogram(
+    "fl_coordinator_stage_wait_seconds", "Time an update waited in a stage queue", ("stage",)
+)
+STAGE_ERRORS = metrics.counter(
+    "fl_coordinator_stage_errors_total", "Updates failed by an exception in a stage", ("stage",)
+)
+
+
+def _strip_agent_metadata(update: AgentUpdate) -> ModelUpdate:
     """
     Remove Algorithm 2–specific fields before forwarding
     the update to Algorithm 1.
     """
-    forwarded = dict(update)
-    forwarded.pop("policyHash", None)
-    forwarded.pop("agentClaim", None)
-    forwarded.pop("proof", None)
-    return forwarded
+    # AgentUpdate 解析时已把 algorithm1 字段单独存放，直接转交，不拷贝
+    return update.model
+
+
+def _parse(update) -> AgentUpdate:
+    """Parse a raw update once at the edge (records pass through)."""
+    if isinstance(update, AgentUpdate):
+        return update
+    return AgentUpdate.from_dict(update)
+
+
+def _rejected(update, reason: str, measured=None) -> Dict[str, Any]:
+    UPDATES.labels("rejected").inc()
+    response = {
+        "status": "rejected",
+        "reason": reason,
+        "roundId": update.get("roundId"),
+        "clientId": update.get("clientId")
+    }
+    if measured is not None:
+        response["measured"] = measured
+    return response
+
+
+def _aggregate(update: AgentUpdate) -> Dict[str, Any]:
+    """Step 2: forward to Algorithm 1 (weights measured server-side in the same pass)."""
+    clean_update = _strip_agent_metadata(update)
+    aggregation_result, _ = submit(clean_update, screen=measured_screen(update))
+    return aggregation_result
+
+
+def _respond(update: AgentUpdate, aggregation_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Steps 3-4: reward and unified response (aggregation_result already accepted)."""
+    reward = compute_reward(update)
+
+    response = {
+        "status": aggregation_result.get("status"),
+        "roundId": update.get("roundId"),
+        "clientId": update.get("clientId"),
+        "reward": reward,
+        "measured": aggregation_result.get("measured")
+    }
+
+    # 仅在聚合完成时返回全局模型
+    if aggregation_result.get("status") == "aggregated":
+        response["aggregationResult"] = aggregation_result.get("result")
+
+    UPDATES.labels(response["status"]).inc()
+    return response
+
 
+def _aggregation_rejected(aggregation_result: Dict[str, Any]) -> bool:
+    return aggregation_result.get("status") == "rejected" or "error" in aggregation_result
 
-def handle_update(update: Dict[str, Any]) -> Dict[str, Any]:
+
+@metrics.timed(HANDLE_SECONDS)
+def handle_update(update) -> Dict[str, Any]:
     """
     Unified backend entry point.
 
+    Accepts a raw dict or an already parsed AgentUpdate; a dict that does
+    not match the update schema is rejected as "Malformed update".
+
     Execution order:
     1. Algorithm 2 verification
-    2. Algorithm 1 aggregation (if accepted)
+    2. Algorithm 1 aggregation (if accepted); the weight norm is measured
+       server-side in the same pass and checked against the policy
     3. Algorithm 2 reward computation
     4. Unified response
     """
 
+    try:
+        update = _parse(update)
+    except ValueError:
+        return _rejected(update, REASONS[MALFORMED])
+
     # -----------------------------
     # Step 1: Algorithm 2 – Verify
     # -----------------------------
     accepted, reason = verify_update(update)
 
     if not accepted:
-        return {
-            "status": "rejected",
-            "reason": reason,
-            "roundId": update.get("roundId"),
-            "clientId": update.get("clientId")
-        }
+        return _rejected(update, reason)
 
     # --------------------------------
     # Step 2: Forward to Algorithm 1
     # --------------------------------
-    clean_update = _strip_agent_metadata(update)
+    aggregation_result = _aggregate(update)
 
-    aggregation_result = submit_update(clean_update)
+    if _aggregation_rejected(aggregation_result):
+        return _rejected(
+            update,
+            aggregation_result.get("reason") or aggregation_result.get("error"),
+            aggregation_result.get("measured"),
+        )
 
     # --------------------------------
-    # Step 3: Algorithm 2 – Incentive
+    # Step 3-4: Incentive + response
     # --------------------------------
-    reward = compute_reward(update)
+    return _respond(update, aggregation_result)
 
-    # --------------------------------
-    # Step 4: Normalize response
-    # --------------------------------
-    response = {
-        "status": aggregation_result.get("status"),
-        "roundId": update.get("roundId"),
-        "clientId": update.get("clientId"),
-        "reward": reward
-    }
 
-    # 仅在聚合完成时返回全局模型
-    if aggregation_result.get("status") == "aggregated":
-        response["aggregationResult"] = aggregation_result.get("result")
+# -----------------------------
+# Asynchronous staged pipeline
+# -----------------------------
 
-    return response
+class StageStats:
+    """Latency counters for one pipeline stage (queue wait + service time)."""
+
+    __slots__ = ("count", "errors", "busy_s", "max_busy_s", "wait_s", "max_wait_s", "_busy", "_wait")
+
+    def __init__(self, stage: str = ""):
+        self._busy = STAGE_SECONDS.labels(stage)
+        self._wait = STAGE_WAIT_SECONDS.labels(stage)
+        self.count = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.max_busy_s = 0.0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+
+    def record(self, wait_s: float, busy_s: float) -> None:
+        self._busy.observe(busy_s)
+        self._wait.observe(wait_s)
+        self.count += 1
+        self.wait_s += wait_s
+        self.busy_s += busy_s
+        if wait_s > self.max_wait_s:
+            self.max_wait_s = wait_s
+        if busy_s > self.max_busy_s:
+            self.max_busy_s = busy_s
+
+    def to_dict(self) -> Dict[str, Any]:
+        n = self.count or 1
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "meanMs": round(self.busy_s / n * 1000, 3),
+            "maxMs": round(self.max_busy_s * 1000, 3),
+            "meanWaitMs": round(self.wait_s / n * 1000, 3),
+            "maxWaitMs": round(self.max_wait_s * 1000, 3),
+        }
+
+
+class _Job:
+    __slots__ = ("update", "future", "enqueued", "result")
+
+    def __init__(self, update, future: asyncio.Future):
+        self.update = update
+        self.future = future
+        self.enqueued = time.perf_counter()
+        self.result: Optional[Dict[str, Any]] = None
+
+
+STAGES = ("verify", "aggregate", "reward")
+
+
+def _parse_and_verify(batch: List[_Job]) -> List[int]:
+    """Verify stage body (runs on the pool): parse each job in place, then verify_batch."""
+    codes = [MALFORMED] * len(batch)
+    parsed = []
+    for i, job in enumerate(batch):
+        try:
+            job.update = _parse(job.update)
+        except ValueError:
+            continue
+        parsed.append(i)
+
+    if parsed:
+        result = verify_batch([batch[i].update for i in parsed])
+        for i, code in zip(parsed, result.codes):
+            codes[i] = code
+    return codes
+
+
+class AsyncCoordinator:
+    """
+    verify -> aggregate -> reward as asyncio stages joined by bounded queues.
+
+    Verify and reward run on a shared thread pool; verify workers drain up
+    to `verify_batch_size` queued updates at a time and check them with
+    verify_batch. When the aggregator falls behind, its queue fills, verify
+    workers block on put, and handle_update_async callers block on the
+    verify queue: backpressure reaches the producers instead of growing
+    memory. Updates are parsed into AgentUpdate records on the pool, and
+    responses match handle_update.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        aggregate_workers: int = 2,
+        queue_size: int = 256,
+        verify_batch_size: int = 64,
+        executor: Optional[ThreadPoolExecutor] = None,
+    ):
+        self.workers = workers
+        self.aggregate_workers = aggregate_workers
+        self.queue_size = queue_size
+        self.verify_batch_size = verify_batch_size
+        self._own_executor = executor is None
+        self._executor = executor
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stages = {name: StageStats(name) for name in STAGES}
+
+    # ---- lifecycle ----
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers + self.aggregate_workers,
+                thread_name_prefix="coordinator",
+            )
+        self._queues = {name: asyncio.Queue(self.queue_size) for name in STAGES}
+        metrics.gauge(
+            "fl_coordinator_queue_depth", "Updates waiting in each pipeline stage queue",
+            lambda: {(name,): q.qsize() for name, q in self._queues.items()}, ("stage",),
+        )
+
+        runners = (
+            (self._verify_worker, self.workers),
+            (self._aggregate_worker, self.aggregate_workers),
+            (self._reward_worker, self.workers),
+        )
+        for runner, n in runners:
+            self._tasks.extend(asyncio.create_task(runner()) for _ in range(n))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._own_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def __aenter__(self) -> "AsyncCoordinator":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    # ---- public API ----
+
+    async def _enqueue(self, update) -> asyncio.Future:
+        await self.start()
+        job = _Job(update, self._loop.create_future())
+        await self._queues["verify"].put(job)     # 队列满时在此阻塞（背压）
+        return job.future
+
+    async def handle_update_async(self, update) -> Dict[str, Any]:
+        return await (await self._enqueue(update))
+
+    async def handle_updates(self, updates: Iterable) -> List[Dict[str, Any]]:
+        """Feed updates through the pipeline; results are returned in input order."""
+        futures = [await self._enqueue(u) for u in updates]
+        return list(await asyncio.gather(*futures))
+
+    def stats(self) -> Dict[str, Any]:
+        out = {name: s.to_dict() for name, s in self.stages.items()}
+        for name, q in self._queues.items():
+            out[name]["queued"] = q.qsize()
+        return out
+
+    # ---- stages ----
+
+    def _finish(self, job: _Job, response: Dict[str, Any]) -> None:
+        if not job.future.done():
+            job.future.set_result(response)
+
+    def _fail(self, stage: str, jobs: List[_Job], exc: BaseException) -> None:
+        self.stages[stage].errors += len(jobs)
+        STAGE_ERRORS.labels(stage).inc(len(jobs))
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(exc)
+
+    async def _verify_worker(self) -> None:
+        queue, stats = self._queues["verify"], self.stages["verify"]
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.verify_batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            t0 = time.perf_counter()
+            try:
+                codes = await self._loop.run_in_executor(self._executor, _parse_and_verify, batch)
+            except Exception as e:
+                self._fail("verify", batch, e)
+                continue
+            busy = time.perf_counter() - t0
+
+            for job, code in zip(batch, codes):
+                stats.record(t0 - job.enqueued, busy)
+                if code:
+                    self._finish(job, _rejected(job.update, REASONS[code]))
+                else:
+                    job.enqueued = time.perf_counter()
+                    await self._queues["aggregate"].put(job)
+
+    async def _aggregate_worker(self) -> None:
+        queue, stats = self._queues["aggregate"], self.stages["aggregate"]
+        while True:
+            job = await queue.get()
+            t0 = time.perf_counter()
+            try:
+                result = await self._loop.run_in_executor(self._executor, _aggregate, job.update)
+            except Exception as e:
+                self._fail("aggregate", [job], e)
+                continue
+            stats.record(t0 - job.enqueued, time.perf_counter() - t0)
+
+            if _aggregation_rejected(result):
+                self._finish(job, _rejected(
+                    job.update, result.get("reason") or result.get("error"), result.get("measured")
+                ))
+                continue
+            job.result = result
+            job.enqueued = time.perf_counter()
+            await self._queues["reward"].put(job)
+
+    async def _reward_worker(self) -> None:
+        queue, stats = self._queues["reward"], self.stages["reward"]
+        while True:
+            job = await queue.get()
+            t0 = time.perf_counter()
+            try:
+                response = await self._loop.run_in_executor(
+                    self._executor, _respond, job.update, job.result
+                )
+            except Exception as e:
+                self._fail("reward", [job], e)
+                continue
+            stats.record(t0 - job.enqueued, time.perf_counter() - t0)
+            self._finish(job, response)
+
+
+# 模块级入口共用一个 pipeline（首次调用时在当前事件循环中启动）
+_PIPELINE: Optional[AsyncCoordinator] = None
+
+
+def _pipeline() -> AsyncCoordinator:
+    global _PIPELINE
+    loop = asyncio.get_running_loop()
+    if _PIPELINE is None or (_PIPELINE._loop is not None and _PIPELINE._loop is not loop):
+        if _PIPELINE is not None and _PIPELINE._own_executor and _PIPELINE._executor is not None:
+            # 上一个事件循环已结束，其 worker task 随之失效
+            _PIPELINE._executor.shutdown(wait=False)
+        _PIPELINE = AsyncCoordinator()
+    return _PIPELINE
+
+
+async def handle_update_async(update) -> Dict[str, Any]:
+    """Async counterpart of handle_update, served by the staged pipeline."""
+    return await _pipeline().handle_update_async(update)
+
+
+async def handle_updates(updates: Iterable) -> List[Dict[str, Any]]:
+    """Batch entry point: results in input order, with backpressure on the producer."""
+    return await _pipeline().handle_updates(updates)
@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+# =========================
+# Idempotency-Key 配置（可用环境变量覆盖）
+# =========================
+
+# 已完成请求的结果最多保留多少条、每条保留多久（秒）。
+# 客户端在 TTL 内用同一个 key 重试，拿到的是第一次的结果，不会再写链 / 写库。
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+
+MAX_KEY_LENGTH = 255
+
+
+def fingerprint(*parts):
+    """请求内容的摘要：同一个 key 只能用于同一个请求"""
+    return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode()).hexdigest()
+
+
+def _cacheable(task):
+    # 成功与 4xx（业务拒绝）是确定的结果，可以重放；
+    # 5xx / 未预期的异常可能是暂时性故障，不缓存，允许客户端用同一个 key 重试。
+    # bulk 接口的汇总中有 5xx 项（ledger 整块暂时失败）时同样不缓存
+    if task.cancelled():
+        return False
+    e = task.exception()
+    if e is not None:
+        return isinstance(e, HTTPException) and e.status_code < 500
+    result = task.result()
+    if isinstance(result, dict) and isinstance(result.get("results"), list):
+        return not any(r.get("code", 0) >= 500 for r in result["results"])
+    return True
+
+
+class ReplayedHTTPException(HTTPException):
+    """重放第一次请求的 HTTPException：状态码 / detail 不变，另带 Idempotent-Replayed 头"""
+
+    def __init__(self, original):
+        super().__init__(
+            status_code=original.status_code,
+            detail=original.detail,
+            headers={**(original.headers or {}), "Idempotent-Replayed": "true"},
+        )
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "task", "expires")
+
+    def __init__(self, fingerprint, task):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires = None         # 在途时为 None
+
+
+class IdempotencyCache:
+    """Idempotency-Key -> 响应结果的有界 TTL 缓存，同时合并在途的相同请求。
+
+    第一个请求在独立的 task 中执行处理函数；在它完成前到达的相同 key 的请求
+    等待同一个 task（asyncio.shield：某个调用者断开不会取消其它人的请求）。
+    完成后的结果按 TTL 保留，异常（HTTPException）同样会重放（ReplayedHTTPException）。
+    缓存在进程内：多个 worker 时只保证同一进程内的幂等。
+    """
+
+    def __init__(self, maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()      # key -> _Entry
+
+    def __len__(self):
+        return len(self._data)
+
+    async def run(self, key, fingerprint, fn):
+        """返回 (result, replayed)；fn 为无参 async 函数"""
+        entry = self._data.get(key)
+        if entry is not None and entry.expires is not None and entry.expires < time.monotonic():
+            del self._data[key]
+            entry = None
+
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key has already been used for a different request"
+                )
+            self._data.move_to_end(key)
+            try:
+                return await asyncio.shield(entry.task), True
+            except HTTPException as e:
+                # 每个重放者一个新的异常对象，不修改第一个请求收到的那个
+                raise ReplayedHTTPException(e) from None
+
+        task = asyncio.ensure_future(fn())
+        entry = _Entry(fingerprint, task)
+        self._data[key] = entry
+        task.add_done_callback(lambda t: self._settle(key, entry))
+        self._evict()
+        return await asyncio.shield(task), False
+
+    def _settle(self, key, entry):
+        if self._data.get(key) is not entry:
+            return
+        if _cacheable(entry.task):
+            entry.expires = time.monotonic() + self.ttl
+        else:
+            del self._data[key]
+
+    def _evict(self):
+        # 先淘汰最旧的已完成条目；在途条目只有在全部是在途时才淘汰（仅失去合并，不影响正确性）
+        excess = len(self._data) - self.maxsize
+        if excess <= 0:
+            return
+        for key in [k for k, e in self._data.items() if e.expires is not None][:excess]:
+            del self._data[key]
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class SingleFlight:
+    """合并在途的相同操作（不带 Idempotency-Key 时也生效）。
+
+    同一 key 的并发调用只执行一次 fn，所有等待者得到同一个结果或异常；
+    完成后立即移除，不缓存。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 所有等待者都已取消时，避免 "exception was never retrieved"
+        if not task.cancelled():
+            task.exception()
@@ -1,33 +1,299 @@
-import requests
-
-LEDGER_BASE = "http://localhost:4000"
-
-def create_prescription(prescription_id, hash):
-    r = requests.post(
-        f"{LEDGER_BASE}/create",  # 去掉 /ledger
-        json={
-            "prescriptionId": prescription_id,
-            "hash": hash
-        }
-    )
-    if r.status_code != 200:
-        raise Exception("Ledger create failed")
-    return r.json()
-
-def verify_prescription(prescription_id):
-    r = requests.post(
-        f"{LEDGER_BASE}/verify",  # 去掉 /ledger
-        json={"prescriptionId": prescription_id}
-    )
-    if r.status_code != 200:
-        raise Exception("Ledger verify failed")
-    return r.json()
-
-def dispense_prescription(prescription_id):
-    r = requests.post(
-        f"{LEDGER_BASE}/dispense",  # 去掉 /ledger
-        json={"prescriptionId": prescription_id}
-    )
-    if r.status_code != 200:
-        raise Exception("Ledger dispense failed")
-    return r.json()
+import asyncio
+import os
+import random
+import time
+
+import httpx
+
+import metrics
+
+LEDGER_BASE = os.environ.get("LEDGER_BASE", "http://localhost:4000")
+
+# =========================
+# 连接池 / 超时 / 重试配置（可用环境变量覆盖）
+# =========================
+
+CONNECT_TIMEOUT = float(os.environ.get("LEDGER_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("LEDGER_READ_TIMEOUT", "5"))
+POOL_TIMEOUT = float(os.environ.get("LEDGER_POOL_TIMEOUT", "5"))
+
+# 同时在途的 ledger 请求上限（也是连接池大小）
+MAX_IN_FLIGHT = int(os.environ.get("LEDGER_MAX_IN_FLIGHT", "200"))
+
+# 首次请求之外最多重试几次；退避为 BACKOFF_BASE * 2^n 上的 full jitter
+MAX_RETRIES = int(os.environ.get("LEDGER_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.environ.get("LEDGER_BACKOFF_BASE", "0.05"))
+BACKOFF_MAX = 1.0
+
+# 重放不会改变链上状态的操作：请求可能已到达 ledger 的失败（读超时 / 5xx）也可重试。
+# create / dispense 重放会得到 "already exists" / "Replay attack"，只在请求确定
+# 没有发出（连接失败、连接池超时）时重试。
+IDEMPOTENT = {"verify"}
+
+# 组提交：缓冲 BATCH_WINDOW 秒或攒满 BATCH_MAX_OPS 个操作后，一次 POST /batch，
+# ledger 把它们写进同一个区块。LEDGER_BATCH=0 时退回每个操作一次请求。
+BATCH_ENABLED = os.environ.get("LEDGER_BATCH", "1") != "0"
+BATCH_WINDOW = float(os.environ.get("LEDGER_BATCH_WINDOW_MS", "5")) / 1000
+BATCH_MAX_OPS = int(os.environ.get("LEDGER_BATCH_MAX_OPS", "64"))
+
+# 请求一定没有到达 ledger 的错误
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# 指标：每次 HTTP 尝试的延迟（outcome: ok / rejected(4xx) / error(5xx、网络)）、重试次数、批大小
+LEDGER_SECONDS = metrics.histogram(
+    "prescriptions_ledger_seconds", "Ledger HTTP call latency per attempt", ("op", "outcome")
+)
+LEDGER_RETRIES = metrics.counter("prescriptions_ledger_retries_total", "Ledger call retries", ("op",))
+BATCH_SIZE = metrics.histogram(
+    "prescriptions_ledger_batch_ops", "Operations per group-commit /batch", buckets=metrics.COUNT_BUCKETS
+)
+
+
+class LedgerError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_transient(e):
+    """不可达 / 超时 / 5xx / 响应异常（没有 4xx 状态码）：暂时性故障，稍后重试可能成功；
+    4xx 是 ledger 的业务拒绝（状态不对 / 重放），是确定的结果"""
+    status = getattr(e, "status_code", None)
+    return status is None or status >= 500
+
+
+class LedgerClient:
+    """共享 keep-alive 连接池的异步 ledger 客户端（每个事件循环一个实例）"""
+
+    def __init__(self, base_url=LEDGER_BASE, max_in_flight=MAX_IN_FLIGHT, max_retries=MAX_RETRIES,
+                 transport=None):
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self._sem = asyncio.Semaphore(max_in_flight)
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(
+                READ_TIMEOUT, connect=CONNECT_TIMEOUT, pool=POOL_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=max_in_flight,
+                max_keepalive_connections=max_in_flight,
+            ),
+            transport=transport,
+        )
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def call(self, op, body):
+        """POST /{op}；返回 ledger 的 JSON，失败时抛出 LedgerError"""
+        retry_ambiguous = op in IDEMPOTENT
+        attempt = 0
+        while True:
+            try:
+                async with self._sem:
+                    self.in_flight += 1
+                    t0 = time.perf_counter()
+                    try:
+                        r = await self._http.post(f"/{op}", json=body)
+                    finally:
+                        self.in_flight -= 1
+            except _NOT_SENT as e:
+                LEDGER_SECONDS.labels(op, "error").observe(time.perf_counter() - t0)
+                error = LedgerError(f"ledger unreachable: {e!r}")
+            except httpx.HTTPError as e:
+                LEDGER_SECONDS.labels(op, "error").observe(time.perf_counter() - t0)
+                if not retry_ambiguous:
+                    raise LedgerError(f"ledger {op} failed: {e!r}") from e
+                error = LedgerError(f"ledger {op} failed: {e!r}")
+            else:
+                outcome = "ok" if r.status_code == 200 else "rejected" if r.status_code < 500 else "error"
+                LEDGER_SECONDS.labels(op, outcome).observe(time.perf_counter() - t0)
+                if r.status_code == 200:
+                    try:
+                        return r.json()
+                    except ValueError as e:
+                        # 200 但不是 JSON（代理错误页等）：按 ledger 失败处理，不能当作成功
+                        raise LedgerError(f"ledger {op} returned a non-JSON response") from e
+                # 4xx 是业务拒绝（状态不对 / 重放），重试没有意义
+                if r.status_code < 500 or not retry_ambiguous:
+                    raise LedgerError(_message(r), r.status_code)
+                error = LedgerError(_message(r), r.status_code)
+
+            if attempt >= self.max_retries:
+                raise error
+            LEDGER_RETRIES.labels(op).inc()
+            await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+            attempt += 1
+
+
+class LedgerBatcher:
+    """把并发的 ledger 操作合并成 POST /batch（group commit）。
+
+    第一个操作入队时开始计时，BATCH_WINDOW 到期或攒满 max_ops 时发送；
+    每个调用者拿到自己那一项的结果。/batch 整体失败（网络 / 5xx）时本批所有
+    调用者收到同一个 LedgerError。批内含 create / dispense，因此按非幂等操作重试。
+    """
+
+    def __init__(self, client, window=BATCH_WINDOW, max_ops=BATCH_MAX_OPS):
+        self.client = client
+        self.window = window
+        self.max_ops = max_ops
+        self._pending = []          # [(op dict, future)]
+        self._timer = None
+        self._inflight = set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def submit(self, op, body):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((dict(body, op=op), fut))
+        if len(self._pending) >= self.max_ops:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch):
+        BATCH_SIZE.observe(len(batch))
+        try:
+            results = _batch_results(
+                await self.client.call("batch", {"ops": [op for op, _ in batch]}), len(batch)
+            )
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (op, fut), r in zip(batch, results):
+            if fut.done():          # 调用者已取消
+                continue
+            if r.get("success"):
+                fut.set_result(r)
+            else:
+                fut.set_exception(LedgerError(r.get("message") or f"ledger {op['op']} failed", 400))
+
+    async def aclose(self):
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+
+def _batch_results(resp, n):
+    """校验 /batch 响应：必须是含 n 个对象的 results 列表，否则抛出 LedgerError"""
+    results = resp.get("results") if isinstance(resp, dict) else None
+    if (not isinstance(results, list) or len(results) != n
+            or not all(isinstance(r, dict) for r in results)):
+        raise LedgerError("ledger batch returned a malformed result")
+    return results
+
+
+def _message(r):
+    try:
+        body = r.json()
+    except ValueError:
+        return r.text
+    return (body.get("message") if isinstance(body, dict) else None) or r.text
+
+
+# =========================
+# 模块级接口（main.py 使用）
+# =========================
+
+_client = None
+_batcher = None
+_client_loop = None
+
+# 设置后新建的客户端不走网络，而是交给这个 httpx transport
+# （benchmarks/ 用 httpx.MockTransport 接入进程内的假 ledger）
+TRANSPORT = None
+
+
+def _get_client():
+    # AsyncClient 绑定在创建它的事件循环上
+    global _client, _batcher, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = LedgerClient(transport=TRANSPORT)
+        _batcher = LedgerBatcher(_client) if BATCH_ENABLED else None
+        _client_loop = loop
+        client, batcher = _client, _batcher
+        metrics.gauge(
+            "prescriptions_ledger_in_flight", "Ledger HTTP requests in flight", lambda: client.in_flight
+        )
+        metrics.gauge(
+            "prescriptions_ledger_batch_pending", "Operations waiting for the next group commit",
+            lambda: len(batcher) if batcher is not None else 0
+        )
+    return _client
+
+
+async def _submit(op, body):
+    client = _get_client()
+    if _batcher is not None:
+        return await _batcher.submit(op, body)
+    return await client.call(op, body)
+
+
+async def aclose():
+    global _client, _batcher, _client_loop
+    if _batcher is not None:
+        await _batcher.aclose()
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _batcher = None
+    _client_loop = None
+
+
+# ledger /batch 单次最多接受的操作数（backend2 MAX_BATCH_OPS）
+LEDGER_BATCH_LIMIT = 1000
+
+
+async def submit_batch(ops):
+    """bulk 接口：直接按 LEDGER_BATCH_LIMIT 分块调用 /batch（按顺序发送）。
+
+    返回与 ops 对齐的 [{success, message?, transient?}]；某一块整体失败时，该块每一项都是
+    失败，暂时性故障（见 is_transient）另带 transient: True。
+    """
+    client = _get_client()
+    results = []
+    for i in range(0, len(ops), LEDGER_BATCH_LIMIT):
+        chunk = ops[i:i + LEDGER_BATCH_LIMIT]
+        try:
+            chunk_results = _batch_results(await client.call("batch", {"ops": chunk}), len(chunk))
+        except LedgerError as e:
+            failed = {"success": False, "message": str(e)}
+            if is_transient(e):
+                failed["transient"] = True
+            chunk_results = [failed] * len(chunk)
+        results.extend(chunk_results)
+    return results
+
+
+async def create_prescription(prescription_id, hash):
+    return await _submit("create", {
+        "prescriptionId": prescription_id,
+        "hash": hash
+    })
+
+
+async def verify_prescription(prescription_id):
+    return await _submit("verify", {"prescriptionId": prescription_id})
+
+
+async def dispense_prescription(prescription_id):
+    return await _submit("dispense", {"prescriptionId": prescription_id})
@@ -1,8 +1,14 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 from datetime import datetime
+from typing import Optional
 import hashlib
+import time
 import uuid
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI(title="Prescription Backend (Backend1)")
@@ -16,13 +22,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+import metrics
+from store import PrescriptionStore
+from idempotency import (
+    IdempotencyCache, ReplayedHTTPException, SingleFlight, fingerprint, MAX_KEY_LENGTH
+)
 from ledger_client import (
+    aclose as ledger_close,
+    submit_batch as ledger_batch,
     create_prescription as ledger_create,
     verify_prescription as ledger_verify,
-    dispense_prescription as ledger_dispense
+    dispense_prescription as ledger_dispense,
+    is_transient as ledger_transient
 )
 
-app = FastAPI(title="Prescription Backend (Backend1)")
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # 关闭 ledger 连接池
+    await ledger_close()
+
+
+app = FastAPI(title="Prescription Backend (Backend1)", lifespan=lifespan)
+
+
+# =========================
+# 指标（GET /metrics，见 metrics.py；PRESCRIPTIONS_METRICS=0 关闭）
+# =========================
+
+HTTP_SECONDS = metrics.histogram(
+    "prescriptions_http_request_seconds", "Request latency by route and status",
+    ("method", "route", "code")
+)
+IDEMPOTENT_REPLAYS = metrics.counter(
+    "prescriptions_idempotent_replays_total", "Requests answered from the Idempotency-Key cache",
+    ("route",)
+)
+
+if metrics.ENABLED:
+    # 关闭时不注册中间件，请求路径上没有额外开销
+    @app.middleware("http")
+    async def observe_request(request, call_next):
+        t0 = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        HTTP_SECONDS.labels(
+            request.method, route.path if route else "unmatched", response.status_code
+        ).observe(time.perf_counter() - t0)
+        return response
 
 # =========================
 # 数据模型
@@ -31,6 +79,12 @@ app = FastAPI(title="Prescription Backend (Backend1)")
 class CreatePrescriptionRequest(BaseModel):
     payload: str
 
+class BulkCreateRequest(BaseModel):
+    payloads: list[str]
+
+class BulkIdsRequest(BaseModel):
+    ids: list[str]
+
 class Prescription(BaseModel):
     id: str
     payload: str
@@ -40,10 +94,56 @@ class Prescription(BaseModel):
 
 
 # =========================
-# 内存数据库（Demo 用）
+# SQLite 存储（prescriptions.db，见 store.py）
 # =========================
+#
+# store 的调用都是同步 SQLite（写锁等待最长 busy_timeout=5s）：
+# async 处理函数里一律 await run_in_threadpool(...)，不阻塞事件循环上的其它请求。
 
-db: dict[str, Prescription] = {}
+store = PrescriptionStore()
+
+
+# =========================
+# 幂等（Idempotency-Key，见 idempotency.py）
+# =========================
+#
+# 客户端超时后重试写接口时带上同一个 Idempotency-Key：TTL 内返回第一次的结果
+# （响应头 Idempotent-Replayed: true），不会重复创建处方 / 重复写链。
+# 同一处方的并发 verify / dispense 即使不带 key 也会合并成一次 ledger 调用。
+
+idempotency = IdempotencyCache()
+inflight = SingleFlight()
+
+metrics.gauge(
+    "prescriptions_idempotency_keys", "Idempotency-Key entries (completed and in flight)",
+    lambda: len(idempotency)
+)
+metrics.gauge(
+    "prescriptions_coalesced_in_flight", "verify / dispense operations in flight (coalesced per id)",
+    lambda: len(inflight)
+)
+
+
+async def _idempotent(route, key, body, fn):
+    """不带 key 时直接执行；带 key 时按 (route, key) 重放 / 合并。body 用于校验 key 没有被复用"""
+    if key is None:
+        return await fn()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"
+        )
+
+    try:
+        result, replayed = await idempotency.run((route, key), fingerprint(route, body), fn)
+    except ReplayedHTTPException:
+        # 第一次请求被拒绝（4xx）时重放同样的错误，也带 Idempotent-Replayed 头
+        IDEMPOTENT_REPLAYS.labels(route).inc()
+        raise
+    if replayed:
+        IDEMPOTENT_REPLAYS.labels(route).inc()
+        return JSONResponse(jsonable_encoder(result), headers={"Idempotent-Replayed": "true"})
+    return result
 
 
 # =========================
@@ -55,32 +155,44 @@ def ping():
     return {"msg": "ok"}
 
 
+@app.get("/metrics")
+def metrics_text():
+    """Prometheus 文本格式"""
+    text = metrics.snapshot()
+    if text is None:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return Response(text, media_type=metrics.CONTENT_TYPE)
+
+
 # =========================
 # Create Prescription
 # =========================
 
 @app.post("/prescriptions/create")
-def create_prescription(req: CreatePrescriptionRequest):
+async def create_prescription(
+    req: CreatePrescriptionRequest,
+    idempotency_key: Optional[str] = Header(None)
+):
+    return await _idempotent(
+        "create", idempotency_key, req.payload, lambda: _create(req.payload)
+    )
+
+
+async def _create(payload):
     prescription_id = str(uuid.uuid4())
-    payload_hash = hashlib.sha256(req.payload.encode()).hexdigest()
+    payload_hash = hashlib.sha256(payload.encode()).hexdigest()
 
     # 1️⃣ 先写链（链是权威）
     try:
-        ledger_create(prescription_id, payload_hash)
+        await ledger_create(prescription_id, payload_hash)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ledger create failed: {e}")
 
     # 2️⃣ 再写本地状态
-    prescription = Prescription(
-        id=prescription_id,
-        payload=req.payload,
-        hash=payload_hash,
-        status="CREATED",
-        createdAt=datetime.now()
+    await run_in_threadpool(
+        store.insert, prescription_id, payload, payload_hash, "CREATED", datetime.now()
     )
 
-    db[prescription_id] = prescription
-
     return {
         "id": prescription_id,
         "hash": payload_hash,
@@ -88,31 +200,56 @@ def create_prescription(req: CreatePrescriptionRequest):
     }
 
 
+def _ledger_failed(op, e):
+    """ledger 拒绝（4xx）-> 400；不可达 / 超时 / 5xx -> 502。
+
+    502 不会被 Idempotency-Key 缓存，客户端可以用同一个 key 重试。
+    """
+    code = 502 if ledger_transient(e) else 400
+    return HTTPException(status_code=code, detail=f"Ledger {op} failed: {e}")
+
+
 # =========================
 # Verify Prescription
 # =========================
 
 @app.post("/prescriptions/verify")
-def verify_prescription(prescription_id: str):
-    if prescription_id not in db:
-        raise HTTPException(status_code=404, detail="Prescription not found")
+async def verify_prescription(
+    prescription_id: str,
+    idempotency_key: Optional[str] = Header(None)
+):
+    # 同一处方的并发 verify 只执行一次（只调用一次 ledger），所有请求共享结果
+    return await _idempotent(
+        "verify", idempotency_key, prescription_id,
+        lambda: inflight.do(("verify", prescription_id), lambda: _verify(prescription_id))
+    )
+
 
-    prescription = db[prescription_id]
+async def _verify(prescription_id):
+    status = await run_in_threadpool(store.status, prescription_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Prescription not found")
 
-    if prescription.status != "CREATED":
+    # 状态不对时不必调用链
+    if status != "CREATED":
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot verify prescription in status {prescription.status}"
+            detail=f"Cannot verify prescription in status {status}"
         )
 
     # 1️⃣ 写链
     try:
-        ledger_verify(prescription_id)
+        await ledger_verify(prescription_id)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Ledger verify failed: {e}")
+        raise _ledger_failed("verify", e)
 
-    # 2️⃣ 更新本地状态
-    prescription.status = "VERIFIED"
+    # 2️⃣ 更新本地状态（条件 UPDATE，并发请求中只有一个成功）
+    if not await run_in_threadpool(store.transition, prescription_id, "CREATED", "VERIFIED"):
+        status = await run_in_threadpool(store.status, prescription_id)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot verify prescription in status {status}"
+        )
 
     return {
         "id": prescription_id,
@@ -125,26 +262,41 @@ def verify_prescription(prescription_id: str):
 # =========================
 
 @app.post("/prescriptions/dispense")
-def dispense_prescription(prescription_id: str):
-    if prescription_id not in db:
-        raise HTTPException(status_code=404, detail="Prescription not found")
+async def dispense_prescription(
+    prescription_id: str,
+    idempotency_key: Optional[str] = Header(None)
+):
+    # 同一处方的并发 dispense 只执行一次（只调用一次 ledger），所有请求共享结果
+    return await _idempotent(
+        "dispense", idempotency_key, prescription_id,
+        lambda: inflight.do(("dispense", prescription_id), lambda: _dispense(prescription_id))
+    )
+
 
-    prescription = db[prescription_id]
+async def _dispense(prescription_id):
+    status = await run_in_threadpool(store.status, prescription_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Prescription not found")
 
-    if prescription.status != "VERIFIED":
+    if status != "VERIFIED":
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot dispense prescription in status {prescription.status}"
+            detail=f"Cannot dispense prescription in status {status}"
         )
 
     # 1️⃣ 写链（防重放最终由链兜底）
     try:
-        ledger_dispense(prescription_id)
+        await ledger_dispense(prescription_id)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Ledger dispense failed: {e}")
+        raise _ledger_failed("dispense", e)
 
     # 2️⃣ 更新本地状态
-    prescription.status = "DISPENSED"
+    if not await run_in_threadpool(store.transition, prescription_id, "VERIFIED", "DISPENSED"):
+        status = await run_in_threadpool(store.status, prescription_id)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cannot dispense prescription in status {status}"
+        )
 
     return {
         "id": prescription_id,
@@ -152,15 +304,145 @@ def dispense_prescription(prescription_id: str):
     }
 
 
+# =========================
+# Bulk（批量）接口
+# =========================
+#
+# 每一项单独返回结果（成功：id + status；失败：id + error + code），
+# 部分失败不影响其它项。整批只调用一次（分块的）ledger /batch，
+# 本地状态变更在一个事务内完成。
+
+MAX_BULK_ITEMS = 10000
+
+
+def _check_bulk_size(n):
+    if n > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ITEMS} items per request")
+
+
+def _item_error(prescription_id, code, error):
+    return {"id": prescription_id, "error": error, "code": code}
+
+
+def _summary(results):
+    failed = sum(1 for r in results if "error" in r)
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
+
+
+@app.post("/prescriptions/bulk/create")
+async def bulk_create(req: BulkCreateRequest, idempotency_key: Optional[str] = Header(None)):
+    _check_bulk_size(len(req.payloads))
+    return await _idempotent(
+        "bulk/create", idempotency_key, req.payloads, lambda: _bulk_create(req.payloads)
+    )
+
+
+async def _bulk_create(payloads):
+    # 每个位置都是一张新处方（与逐个调用 /create 一致），相同的 payload 也各自生成 ID
+    ids = [str(uuid.uuid4()) for _ in payloads]
+    hashes = [hashlib.sha256(p.encode()).hexdigest() for p in payloads]
+
+    # 1️⃣ 先写链（一次批量调用）
+    ledger_results = await ledger_batch([
+        {"op": "create", "prescriptionId": i, "hash": h} for i, h in zip(ids, hashes)
+    ])
+
+    # 2️⃣ 再写本地状态（一个事务）
+    now = datetime.now()
+    rows = [
+        (i, p, h, "CREATED", now)
+        for i, p, h, r in zip(ids, payloads, hashes, ledger_results) if r.get("success")
+    ]
+    if rows:
+        await run_in_threadpool(store.insert_many, rows)
+
+    return _summary([
+        {"id": i, "hash": h, "status": "CREATED"} if r.get("success")
+        else _item_error(i, 502 if r.get("transient") else 500, f"Ledger create failed: {r.get('message')}")
+        for i, h, r in zip(ids, hashes, ledger_results)
+    ])
+
+
+async def _bulk_transition(ids, op, from_status, to_status):
+    """bulk verify / dispense：本地预检 -> 一次 ledger 批量 -> 一个事务内条件 UPDATE
+
+    重复的 id 只处理一次，结果映射回每个位置。
+    """
+    _check_bulk_size(len(ids))
+    unique = list(dict.fromkeys(ids))
+    statuses = await run_in_threadpool(store.statuses, unique)
+
+    results = {}
+    eligible = []
+    for i in unique:
+        status = statuses.get(i)
+        if status is None:
+            results[i] = _item_error(i, 404, "Prescription not found")
+        elif status != from_status:
+            results[i] = _item_error(i, 400, f"Cannot {op} prescription in status {status}")
+        else:
+            eligible.append(i)
+
+    if eligible:
+        ledger_results = await ledger_batch([
+            {"op": op, "prescriptionId": i} for i in eligible
+        ])
+        confirmed = []
+        for i, r in zip(eligible, ledger_results):
+            if r.get("success"):
+                confirmed.append(i)
+            else:
+                results[i] = _item_error(
+                    i, 502 if r.get("transient") else 400, f"Ledger {op} failed: {r.get('message')}"
+                )
+
+        done = await run_in_threadpool(store.transition_many, confirmed, from_status, to_status)
+        for i, ok in zip(confirmed, done):
+            results[i] = (
+                {"id": i, "status": to_status} if ok
+                else _item_error(i, 409, f"Cannot {op} prescription: status changed by a concurrent request")
+            )
+
+    return _summary([results[i] for i in ids])
+
+
+@app.post("/prescriptions/bulk/verify")
+async def bulk_verify(req: BulkIdsRequest, idempotency_key: Optional[str] = Header(None)):
+    return await _idempotent(
+        "bulk/verify", idempotency_key, req.ids,
+        lambda: _bulk_transition(req.ids, "verify", "CREATED", "VERIFIED")
+    )
+
+
+@app.post("/prescriptions/bulk/dispense")
+async def bulk_dispense(req: BulkIdsRequest, idempotency_key: Optional[str] = Header(None)):
+    return await _idempotent(
+        "bulk/dispense", idempotency_key, req.ids,
+        lambda: _bulk_transition(req.ids, "dispense", "VERIFIED", "DISPENSED")
+    )
+
+
+@app.post("/prescriptions/bulk/get")
+def bulk_get(req: BulkIdsRequest):
+    _check_bulk_size(len(req.ids))
+    rows = store.get_many(req.ids)
+    return _summary([
+        Prescription(**rows[i]) if i in rows
+        else _item_error(i, 404, "Prescription not found")
+        for i in req.ids
+    ])
+
+
 # =========================
 # Get Prescription
 # =========================
 
 @app.get("/prescriptions/{prescription_id}")
 def get_prescription(prescription_id: str):
-    if prescription_id not in db:
+    row = store.get(prescription_id)
+    if row is None:
         raise HTTPException(status_code=404, detail="Prescription not found")
-    return db[prescription_id]
+    return Prescription(**row)
 
 # 如果你是通过命令行启动，请使用端口 8001:
 # uvicorn main:app --reload --port 8001
\ No newline at end of file
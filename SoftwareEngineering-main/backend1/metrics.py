@@ -0,0 +1,267 @@
+import bisect
+import math
+import os
+import threading
+import time
+
+
+# =========================
+# 进程内指标（Prometheus 文本格式，GET /metrics）
+# =========================
+#
+# 与 algorithm1/metrics.py 相同的最小实现（两个服务分别部署，不共享代码）。
+# PRESCRIPTIONS_METRICS=0 时整体关闭：工厂函数返回共享的空对象，
+# main.py 不注册计时中间件，/metrics 返回 404。
+
+ENABLED = os.environ.get("PRESCRIPTIONS_METRICS", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒：50µs .. 10s
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# 批大小
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _fmt(v):
+    if v == math.inf:
+        return "+Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _escape(v):
+    return str(v).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _label_str(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        # 无 label 的指标直接使用这个 child，热路径上不查字典
+        self._default = None if self.labelnames else self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _items(self):
+        return sorted(self._children.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._items():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1.0):
+        with self._lock:
+            self.value += n
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, n=1.0):
+        self._default.inc(n)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_str(self.labelnames, values)} {_fmt(child.value)}"]
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)     # 最后一格为 +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, v):
+        i = bisect.bisect_left(self.bounds, v)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += v
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, hist):
+        self.hist = hist
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, v):
+        self._default.observe(v)
+
+    def time(self):
+        return _Timer(self._default)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cum = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cum += n
+            le = _label_str(self.labelnames, values, f'le="{_fmt(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {cum}")
+        labels = _label_str(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_fmt(total)}")
+        lines.append(f"{self.name}_count{labels} {cum}")
+        return lines
+
+
+class Gauge(_Metric):
+    """抓取时调用 fn 取值（队列深度等）；有 labels 时 fn 返回 {label 值元组: 数值}"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        self.fn = fn
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return None
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if self.labelnames:
+            for values, v in sorted((value or {}).items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, values)} {_fmt(v)}")
+        else:
+            lines.append(f"{self.name} {_fmt(value)}")
+        return lines
+
+
+# =========================
+# 关闭时使用的空对象
+# =========================
+
+class _Noop:
+    __slots__ = ()
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, n=1.0):
+        pass
+
+    def observe(self, v):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP = _Noop()
+
+
+# =========================
+# 注册表
+# =========================
+
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _register(metric):
+    # 同名指标只注册一次，重复注册返回已有的对象
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name, help, labels=()):
+    return _register(Counter(name, help, labels)) if ENABLED else NOOP
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labels, buckets)) if ENABLED else NOOP
+
+
+def gauge(name, help, fn, labels=()):
+    if ENABLED:
+        with _REGISTRY_LOCK:
+            # 回调型 gauge 以最后一次注册为准
+            _REGISTRY[name] = Gauge(name, help, fn, labels)
+
+
+def render():
+    with _REGISTRY_LOCK:
+        metrics = list(_REGISTRY.values())
+    lines = []
+    for m in metrics:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """/metrics 的响应体；关闭时返回 None（路由返回 404）"""
+    return render() if ENABLED else None
@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+DB_PATH = os.environ.get(
+    "PRESCRIPTIONS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "prescriptions.db"),
+)
+
+# GET 读缓存：最多缓存多少条、每条最多使用多久（秒）。
+# 只有 status 会变化；本进程的写入会立即失效对应条目，TTL 限制的是
+# 其它 worker 进程写入后本进程最多返回多久的旧状态。
+CACHE_SIZE = int(os.environ.get("PRESCRIPTIONS_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.environ.get("PRESCRIPTIONS_CACHE_TTL", "1.0"))
+
+# =========================
+# SQL（固定语句文本，sqlite3 按连接缓存编译结果，即预编译语句）
+# =========================
+
+# 与已有 prescriptions.db 的表结构一致
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prescriptions (
+    id VARCHAR NOT NULL,
+    payload VARCHAR,
+    hash VARCHAR,
+    status VARCHAR,
+    "createdAt" DATETIME,
+    PRIMARY KEY (id)
+)
+"""
+
+SQL_INSERT = (
+    'INSERT INTO prescriptions (id, payload, hash, status, "createdAt") '
+    "VALUES (?, ?, ?, ?, ?)"
+)
+SQL_GET = 'SELECT id, payload, hash, status, "createdAt" FROM prescriptions WHERE id = ?'
+SQL_STATUS = "SELECT status FROM prescriptions WHERE id = ?"
+# 单条语句完成 "检查当前状态 + 修改"，并发请求中只有一个能成功
+SQL_TRANSITION = "UPDATE prescriptions SET status = ? WHERE id = ? AND status = ?"
+
+COLUMNS = ("id", "payload", "hash", "status", "createdAt")
+
+CACHE_LOOKUPS = metrics.counter(
+    "prescriptions_cache_lookups_total", "GET read-cache lookups", ("result",)
+)
+_CACHE_HIT = CACHE_LOOKUPS.labels("hit")
+_CACHE_MISS = CACHE_LOOKUPS.labels("miss")
+
+# IN (...) 每次最多带多少个参数（低于 SQLite 的参数个数上限）
+_IN_CHUNK = 500
+
+
+def _chunks(items, n=_IN_CHUNK):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _in_query(select, n):
+    return f"{select} WHERE id IN ({','.join('?' * n)})"
+
+
+class _LRUCache:
+    """带 TTL 的有界 LRU（GET 在线程池中执行，需要加锁）"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()      # id -> (expires, row)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def put(self, key, row):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, row)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class PrescriptionStore:
+    """处方的持久化存储（SQLite，WAL 模式）。
+
+    每个线程一个连接（main.py 的调用都在线程池中执行，不占用事件循环）；
+    多个 uvicorn worker 进程各自打开自己的连接，WAL 下读写互不阻塞。
+    """
+
+    def __init__(self, path=DB_PATH, cache_size=CACHE_SIZE, cache_ttl=CACHE_TTL):
+        self.path = path
+        self.cache = _LRUCache(cache_size, cache_ttl)
+        self._local = threading.local()
+        self._conn().execute(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：单条语句自动提交，需要事务时显式 BEGIN
+            conn = sqlite3.connect(self.path, isolation_level=None, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def insert(self, prescription_id, payload, hash, status, created_at):
+        self._conn().execute(
+            SQL_INSERT,
+            (prescription_id, payload, hash, status, created_at.isoformat(sep=" ")),
+        )
+
+    def get(self, prescription_id):
+        """返回 {id, payload, hash, status, createdAt}，不存在时返回 None（经 LRU 缓存）"""
+        row = self.cache.get(prescription_id)
+        if row is not None:
+            _CACHE_HIT.inc()
+            return row
+        _CACHE_MISS.inc()
+        r = self._conn().execute(SQL_GET, (prescription_id,)).fetchone()
+        if r is None:
+            return None
+        row = dict(zip(COLUMNS, r))
+        self.cache.put(prescription_id, row)
+        return row
+
+    def status(self, prescription_id):
+        """当前状态（不经缓存）；不存在时返回 None"""
+        r = self._conn().execute(SQL_STATUS, (prescription_id,)).fetchone()
+        return r[0] if r else None
+
+    # ---- 批量操作（bulk 接口）----
+
+    def insert_many(self, rows):
+        """rows: [(id, payload, hash, status, created_at)]，一个事务内写入"""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(
+                SQL_INSERT,
+                [(i, p, h, st, c.isoformat(sep=" ")) for i, p, h, st, c in rows],
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def statuses(self, ids):
+        """{id: status}（不经缓存）；不存在的 id 不在结果中"""
+        conn = self._conn()
+        out = {}
+        for chunk in _chunks(list(dict.fromkeys(ids))):
+            out.update(conn.execute(
+                _in_query("SELECT id, status FROM prescriptions", len(chunk)), chunk
+            ).fetchall())
+        return out
+
+    def get_many(self, ids):
+        """{id: row}；先查 LRU 缓存，未命中的一次 IN 查询取回"""
+        out = {}
+        missing = []
+        for i in dict.fromkeys(ids):
+            row = self.cache.get(i)
+            if row is None:
+                missing.append(i)
+            else:
+                out[i] = row
+        _CACHE_HIT.inc(len(out))
+        _CACHE_MISS.inc(len(missing))
+
+        conn = self._conn()
+        select = 'SELECT id, payload, hash, status, "createdAt" FROM prescriptions'
+        for chunk in _chunks(missing):
+            for r in conn.execute(_in_query(select, len(chunk)), chunk):
+                row = dict(zip(COLUMNS, r))
+                self.cache.put(row["id"], row)
+                out[row["id"]] = row
+        return out
+
+    def transition_many(self, ids, from_status, to_status):
+        """逐个条件 UPDATE，同一事务内提交；返回与 ids 对齐的是否成功列表"""
+        conn = self._conn()
+        done = []
+        conn.execute("BEGIN")
+        try:
+            for i in ids:
+                done.append(conn.execute(SQL_TRANSITION, (to_status, i, from_status)).rowcount == 1)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        for i in ids:
+            self.cache.discard(i)
+        return done
+
+    def transition(self, prescription_id, from_status, to_status):
+        """status 为 from_status 时改为 to_status；返回是否修改成功"""
+        cur = self._conn().execute(SQL_TRANSITION, (to_status, prescription_id, from_status))
+        self.cache.discard(prescription_id)
+        return cur.rowcount == 1
@@ -1,6 +1,7 @@
 const { Blockchain } = require("./ledger/blockchain");
 const { StateStore } = require("./ledger/state");
 const { Contracts } = require("./ledger/contracts");
+const metrics = require("./ledger/metrics");
 const express = require("express");
 
 const blockchain = new Blockchain();
@@ -25,6 +26,10 @@ const ledger = {
   recordModelVersion: (roundId, modelHash) =>
     contracts.RecordModelVersion(roundId, modelHash),
 
+  /* Batch: many txs in one block */
+  submitBatch: (ops) =>
+    contracts.SubmitBatch(ops),
+
   getModelVersions: () =>
     state.getModelVersions(),
 
@@ -53,14 +58,45 @@ function selfTest() {
 // ======================================
 const app = express();
 const port = 4000;
+const MAX_BATCH_OPS = 1000;
+
+// Metrics (GET /metrics, Prometheus text format; LEDGER_METRICS=0 disables)
+const httpSeconds = metrics.histogram(
+  "ledger_http_request_seconds", "Request latency by route and status", ["method", "route", "code"]
+);
+const txResults = metrics.counter(
+  "ledger_batch_ops_total", "Operations submitted through /batch by outcome", ["outcome"]
+);
+metrics.gauge("ledger_chain_height", "Index of the latest block", () => blockchain.getLatestBlock().index);
+
+if (metrics.ENABLED) {
+  app.use((req, res, next) => {
+    const start = process.hrtime.bigint();
+    res.on("finish", () => {
+      const route = req.route ? req.route.path : "unmatched";
+      httpSeconds
+        .labels(req.method, route, res.statusCode)
+        .observe(Number(process.hrtime.bigint() - start) / 1e9);
+    });
+    next();
+  });
+}
 
-app.use(express.json());
+// 1mb leaves room for a full /batch (MAX_BATCH_OPS ops)
+app.use(express.json({ limit: "1mb" }));
 
 // Health check
 app.get("/health", (req, res) => {
   res.json({ status: "ok" });
 });
 
+app.get("/metrics", (req, res) => {
+  if (!metrics.ENABLED) {
+    return res.status(404).json({ success: false, message: "metrics disabled" });
+  }
+  res.type(metrics.CONTENT_TYPE).send(metrics.render());
+});
+
 // Prescription APIs
 app.post("/create", (req, res) => {
   const { prescriptionId, hash } = req.body;
@@ -92,6 +128,27 @@ app.post("/dispense", (req, res) => {
   }
 });
 
+// Group commit: { ops: [{ op, prescriptionId, hash, roundId, modelHash }] }
+// -> { success, block: { index, hash } | null, results: [{ success, message? }] }
+// Always 200 when the batch itself is well formed; check each result.
+app.post("/batch", (req, res) => {
+  const { ops } = req.body || {};
+  if (!Array.isArray(ops) || ops.length === 0) {
+    return res.status(400).json({ success: false, message: "ops must be a non-empty array" });
+  }
+  if (ops.length > MAX_BATCH_OPS) {
+    return res.status(413).json({ success: false, message: `at most ${MAX_BATCH_OPS} ops per batch` });
+  }
+
+  const { block, results } = ledger.submitBatch(ops);
+  for (const r of results) txResults.labels(r.success ? "ok" : "rejected").inc();
+  res.json({
+    success: true,
+    block: block ? { index: block.index, hash: block.hash } : null,
+    results
+  });
+});
+
 app.post("/record_model", (req, res) => {
   const { roundId, modelHash } = req.body;
   try {
@@ -1,4 +1,12 @@
 const { sha256 } = require("./crypto");
+const metrics = require("./metrics");
+
+const blockSeconds = metrics.histogram(
+  "ledger_block_seconds", "Time to hash and append one block"
+);
+const blockTxs = metrics.histogram(
+  "ledger_block_txs", "Transactions per block", [], metrics.COUNT_BUCKETS
+);
 
 class Blockchain {
   constructor() {
@@ -18,6 +26,7 @@ class Blockchain {
   }
 
   addBlock(txs) {
+    const start = process.hrtime.bigint();
     const prev = this.getLatestBlock();
 
     const block = {
@@ -36,6 +45,8 @@ class Blockchain {
     console.log("====================================");
 
     this.chain.push(block);
+    blockSeconds.observe(Number(process.hrtime.bigint() - start) / 1e9);
+    blockTxs.observe(txs.length);
     return block;
   }
 
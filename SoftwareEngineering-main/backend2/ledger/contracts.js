@@ -4,51 +4,92 @@ class Contracts {
     this.state = state;
   }
 
-  CreatePrescription(prescriptionId, hash) {
+  /* ---------- State transition + tx (no block) ---------- */
+
+  applyCreatePrescription(prescriptionId, hash) {
     this.state.createPrescription(prescriptionId);
+    return { type: "CreatePrescription", prescriptionId, hash };
+  }
+
+  applyVerifyPrescription(prescriptionId) {
+    this.state.verifyPrescription(prescriptionId);
+    return { type: "VerifyPrescription", prescriptionId };
+  }
+
+  applyDispensePrescription(prescriptionId) {
+    this.state.dispensePrescription(prescriptionId);
+    return { type: "DispensePrescription", prescriptionId };
+  }
+
+  applyRecordModelVersion(roundId, modelHash) {
+    this.state.recordModelVersion(roundId, modelHash);
+    return { type: "RecordModelVersion", roundId, modelHash };
+  }
 
+  /* ---------- One tx per block ---------- */
+
+  CreatePrescription(prescriptionId, hash) {
     return this.blockchain.addBlock([
-      {
-        type: "CreatePrescription",
-        prescriptionId,
-        hash
-      }
+      this.applyCreatePrescription(prescriptionId, hash)
     ]);
   }
 
   VerifyPrescription(prescriptionId) {
-    this.state.verifyPrescription(prescriptionId);
-
     return this.blockchain.addBlock([
-      {
-        type: "VerifyPrescription",
-        prescriptionId
-      }
+      this.applyVerifyPrescription(prescriptionId)
     ]);
   }
 
   DispensePrescription(prescriptionId) {
-    this.state.dispensePrescription(prescriptionId);
-
     return this.blockchain.addBlock([
-      {
-        type: "DispensePrescription",
-        prescriptionId
-      }
+      this.applyDispensePrescription(prescriptionId)
     ]);
   }
 
   RecordModelVersion(roundId, modelHash) {
-    this.state.recordModelVersion(roundId, modelHash);
-
     return this.blockchain.addBlock([
-      {
-        type: "RecordModelVersion",
-        roundId,
-        modelHash
-      }
+      this.applyRecordModelVersion(roundId, modelHash)
     ]);
   }
+
+  /* ---------- Group commit ---------- */
+
+  // ops: [{ op: "create" | "verify" | "dispense" | "record_model", ... }]
+  // Each op is applied in order against the current state; ops that fail
+  // are reported individually and leave no tx. All successful txs go into
+  // one block. Returns { block, results } with one result per op.
+  SubmitBatch(ops) {
+    const txs = [];
+    const results = ops.map((o) => {
+      try {
+        txs.push(this.applyOp(o || {}));
+        return { success: true };
+      } catch (e) {
+        return { success: false, message: e.message };
+      }
+    });
+
+    const block = txs.length ? this.blockchain.addBlock(txs) : null;
+    return { block, results };
+  }
+
+  applyOp(o) {
+    switch (o.op) {
+      case "create":
+        if (!o.prescriptionId || !o.hash) {
+          throw new Error("prescriptionId and hash are required");
+        }
+        return this.applyCreatePrescription(o.prescriptionId, o.hash);
+      case "verify":
+        return this.applyVerifyPrescription(o.prescriptionId);
+      case "dispense":
+        return this.applyDispensePrescription(o.prescriptionId);
+      case "record_model":
+        return this.applyRecordModelVersion(o.roundId, o.modelHash);
+      default:
+        throw new Error(`Unknown op: ${o.op}`);
+    }
+  }
 }
 
 module.exports = { Contracts };
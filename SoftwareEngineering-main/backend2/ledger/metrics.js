@@ -0,0 +1,169 @@
+// Minimal in-process metrics rendered in Prometheus text format (GET /metrics).
+// LEDGER_METRICS=0 turns everything off: the factories hand back a shared
+// no-op object and index.js skips the timing middleware.
+
+const ENABLED = process.env.LEDGER_METRICS !== "0";
+
+const CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8";
+
+// seconds: 50us .. 10s
+const LATENCY_BUCKETS = [
+  0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+  0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+];
+const COUNT_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024];
+
+const registry = new Map();
+
+function labelStr(names, values, extra) {
+  const parts = names.map(
+    (n, i) => `${n}="${String(values[i]).replace(/\\/g, "\\\\").replace(/"/g, '\\"').replace(/\n/g, "\\n")}"`
+  );
+  if (extra) parts.push(extra);
+  return parts.length ? `{${parts.join(",")}}` : "";
+}
+
+class Metric {
+  constructor(name, help, labelNames = []) {
+    this.name = name;
+    this.help = help;
+    this.labelNames = labelNames;
+    this.children = new Map();
+    this.default = null;
+  }
+
+  // Unlabelled metrics keep their only child here (no map lookup per call)
+  init() {
+    if (!this.labelNames.length) this.default = this.labels();
+    return this;
+  }
+
+  labels(...values) {
+    const key = JSON.stringify(values.map(String));
+    let child = this.children.get(key);
+    if (!child) {
+      child = this.newChild();
+      this.children.set(key, child);
+    }
+    return child;
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} ${this.type}`];
+    for (const [key, child] of this.children) {
+      lines.push(...this.renderChild(JSON.parse(key), child));
+    }
+    return lines;
+  }
+}
+
+class Counter extends Metric {
+  get type() {
+    return "counter";
+  }
+
+  newChild() {
+    return { value: 0, inc(n = 1) { this.value += n; } };
+  }
+
+  inc(n = 1) {
+    this.default.inc(n);
+  }
+
+  renderChild(values, child) {
+    return [`${this.name}${labelStr(this.labelNames, values)} ${child.value}`];
+  }
+}
+
+class Histogram extends Metric {
+  constructor(name, help, labelNames = [], buckets = LATENCY_BUCKETS) {
+    super(name, help, labelNames);
+    this.buckets = buckets;
+  }
+
+  get type() {
+    return "histogram";
+  }
+
+  newChild() {
+    const bounds = this.buckets;
+    return {
+      counts: new Array(bounds.length + 1).fill(0),
+      sum: 0,
+      observe(v) {
+        let i = 0;
+        while (i < bounds.length && v > bounds[i]) i++;
+        this.counts[i]++;
+        this.sum += v;
+      }
+    };
+  }
+
+  observe(v) {
+    this.default.observe(v);
+  }
+
+  renderChild(values, child) {
+    const lines = [];
+    let cum = 0;
+    this.buckets.forEach((b, i) => {
+      cum += child.counts[i];
+      lines.push(`${this.name}_bucket${labelStr(this.labelNames, values, `le="${b}"`)} ${cum}`);
+    });
+    cum += child.counts[this.buckets.length];
+    lines.push(`${this.name}_bucket${labelStr(this.labelNames, values, 'le="+Inf"')} ${cum}`);
+    lines.push(`${this.name}_sum${labelStr(this.labelNames, values)} ${child.sum}`);
+    lines.push(`${this.name}_count${labelStr(this.labelNames, values)} ${cum}`);
+    return lines;
+  }
+}
+
+// Read at scrape time (queue depths, chain height)
+class Gauge {
+  constructor(name, help, fn) {
+    this.name = name;
+    this.help = help;
+    this.fn = fn;
+  }
+
+  render() {
+    return [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} gauge`, `${this.name} ${this.fn()}`];
+  }
+}
+
+const NOOP = {
+  labels() { return NOOP; },
+  inc() {},
+  observe() {}
+};
+
+function register(metric) {
+  if (!registry.has(metric.name)) registry.set(metric.name, metric);
+  return registry.get(metric.name);
+}
+
+const counter = (name, help, labelNames) =>
+  ENABLED ? register(new Counter(name, help, labelNames).init()) : NOOP;
+
+const histogram = (name, help, labelNames, buckets) =>
+  ENABLED ? register(new Histogram(name, help, labelNames, buckets).init()) : NOOP;
+
+function gauge(name, help, fn) {
+  if (ENABLED) registry.set(name, new Gauge(name, help, fn));
+}
+
+function render() {
+  const lines = [];
+  for (const m of registry.values()) lines.push(...m.render());
+  return lines.join("\n") + "\n";
+}
+
+module.exports = {
+  ENABLED,
+  CONTENT_TYPE,
+  COUNT_BUCKETS,
+  counter,
+  histogram,
+  gauge,
+  render
+};
@@ -0,0 +1,47 @@
+"""Aggregation at several (clients x dim) sizes."""
+import numpy as np
+
+from algorithm1 import aggregator
+from algorithm1.fedavg_engine import DenseContribution, RoundAccumulator
+
+# combinations above this many weights in memory (~160 MB of float64) are skipped
+MAX_ELEMENTS = 20_000_000
+
+
+def _weights(clients, dim):
+    if clients * dim > MAX_ELEMENTS:
+        raise NotImplementedError
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((clients, dim)), rng.integers(50, 200, clients).tolist()
+
+
+class FedAvg:
+    """aggregator._fedavg over a round's materialised updates."""
+
+    params = [[10, 100, 1000], [1_000, 100_000]]
+    param_names = ["clients", "dim"]
+
+    def setup(self, clients, dim):
+        weights, samples = _weights(clients, dim)
+        self.updates = [{"weights": w, "samples": s} for w, s in zip(weights, samples)]
+
+    def time_fedavg(self, clients, dim):
+        aggregator._fedavg(self.updates)
+
+
+class RoundFold:
+    """The /submit_update path: fold each update into the round accumulator, then finalize."""
+
+    params = [[10, 100, 1000], [1_000, 100_000]]
+    param_names = ["clients", "dim"]
+
+    def setup(self, clients, dim):
+        weights, self.samples = _weights(clients, dim)
+        engine = aggregator.ENGINE
+        self.contribs = [DenseContribution.from_vector(engine, engine.as_vector(w)) for w in weights]
+
+    def time_fold_and_finalize(self, clients, dim):
+        acc = RoundAccumulator(aggregator.ENGINE, dim)
+        for i, (c, s) in enumerate(zip(self.contribs, self.samples)):
+            acc.fold(f"client-{i}", c, s, 0.5)
+        acc.finalize()
@@ -0,0 +1,97 @@
+"""backend1 request throughput, in process, against FakeLedger.
+
+Requests go through httpx.ASGITransport straight into the FastAPI app,
+the ledger client through httpx.MockTransport into FakeLedger, and
+prescriptions into a temporary SQLite file: no sockets anywhere.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+
+from fake_ledger import FakeLedger
+
+_APP = None
+
+
+def _backend1():
+    """Import backend1 once, pointed at a throwaway database and the fake ledger."""
+    global _APP
+    if _APP is None:
+        os.environ["PRESCRIPTIONS_DB"] = os.path.join(
+            tempfile.mkdtemp(prefix="bench-backend1-"), "prescriptions.db"
+        )
+        import ledger_client
+        import main
+
+        ledger_client.TRANSPORT = FakeLedger().transport()
+        _APP = main.app
+    return _APP
+
+
+async def _flows(n, concurrency):
+    """n create -> verify -> dispense flows with at most `concurrency` in flight."""
+    import ledger_client
+
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=_backend1())
+
+    async def flow(c, i):
+        async with sem:
+            r = await c.post("/prescriptions/create", json={"payload": f"rx-{i}"})
+            pid = r.json()["id"]
+            await c.post("/prescriptions/verify", params={"prescription_id": pid})
+            await c.post("/prescriptions/dispense", params={"prescription_id": pid})
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend1") as c:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(flow(c, i) for i in range(n)))
+        elapsed = time.perf_counter() - t0
+    # the pooled ledger client belongs to this event loop
+    await ledger_client.aclose()
+    return 3 * n / elapsed
+
+
+async def _bulk(n):
+    import ledger_client
+
+    transport = httpx.ASGITransport(app=_backend1())
+    async with httpx.AsyncClient(transport=transport, base_url="http://backend1", timeout=60) as c:
+        t0 = time.perf_counter()
+        r = await c.post("/prescriptions/bulk/create", json={"payloads": [f"rx-{i}" for i in range(n)]})
+        ids = [item["id"] for item in r.json()["results"]]
+        await c.post("/prescriptions/bulk/verify", json={"ids": ids})
+        await c.post("/prescriptions/bulk/dispense", json={"ids": ids})
+        elapsed = time.perf_counter() - t0
+    await ledger_client.aclose()
+    return 3 * n / elapsed
+
+
+class Backend1Throughput:
+    params = [[1, 16, 128]]
+    param_names = ["concurrency"]
+
+    def setup(self, concurrency):
+        _backend1()
+
+    def track_requests_per_sec(self, concurrency):
+        return asyncio.run(_flows(max(100, 4 * concurrency), concurrency))
+
+    track_requests_per_sec.unit = "requests/s"
+    track_requests_per_sec.better = "higher"
+
+
+class Backend1Bulk:
+    params = [[100, 5000]]
+    param_names = ["items"]
+
+    def setup(self, items):
+        _backend1()
+
+    def track_items_per_sec(self, items):
+        return asyncio.run(_bulk(items))
+
+    track_items_per_sec.unit = "items/s"
+    track_items_per_sec.better = "higher"
@@ -0,0 +1,27 @@
+"""Client-side update generation."""
+from algorithm1.client_lib import generate_update, generate_updates_batch
+from algorithm2.agent_client import generate_agent_update
+
+
+class GenerateUpdate:
+    params = [[20, 1_000, 100_000], ["python", "numpy"]]
+    param_names = ["dim", "rng"]
+
+    def time_generate_update(self, dim, rng):
+        generate_update("BENCH-1", "HospitalA", weights_len=dim, rng=rng)
+
+
+class GenerateBatch:
+    params = [[64, 1024], [1_000]]
+    param_names = ["batch", "dim"]
+
+    def setup(self, batch, dim):
+        self.pairs = [(f"BENCH-{i}", "HospitalA" if i % 2 else "HospitalB") for i in range(batch)]
+
+    def time_generate_updates_batch(self, batch, dim):
+        generate_updates_batch(self.pairs, weights_len=dim)
+
+
+class GenerateAgentUpdate:
+    def time_generate_agent_update(self):
+        generate_agent_update("BENCH-1", "HospitalA")
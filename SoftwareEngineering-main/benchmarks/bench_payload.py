@@ -0,0 +1,43 @@
+"""Upload parsing and validation: JSON vs binary wire format."""
+import json
+
+from algorithm1 import aggregator
+from algorithm1.client_lib import generate_update
+from algorithm1.wire import CONTENT_TYPE as WIRE_CONTENT_TYPE, JSON_CONTENT_TYPE, encode_update
+from algorithm2.agent_client import generate_agent_update
+from algorithm2.agent_update import AgentUpdate
+
+
+class ParseUpload:
+    """aggregator.parse_upload, then the conversion submit does before folding."""
+
+    params = [[1_000, 100_000], ["json", "binary"]]
+    param_names = ["dim", "format"]
+
+    def setup(self, dim, format):
+        payload = generate_update("BENCH-1", "HospitalA", weights_len=dim, rng="numpy")
+        if format == "json":
+            self.body, self.mimetype = json.dumps(payload).encode(), JSON_CONTENT_TYPE
+        else:
+            self.body, self.mimetype = encode_update(payload, dtype="float64"), WIRE_CONTENT_TYPE
+
+    def time_parse_upload(self, dim, format):
+        aggregator.parse_upload(self.body, self.mimetype)
+
+    def time_parse_and_convert(self, dim, format):
+        update = aggregator.parse_upload(self.body, self.mimetype)
+        aggregator._to_contribution(update.weights)
+
+
+class AgentParse:
+    """Coordinator edge: raw agent update dict -> AgentUpdate record."""
+
+    params = [[20, 100_000]]
+    param_names = ["dim"]
+
+    def setup(self, dim):
+        self.update = generate_agent_update("BENCH-1", "HospitalA")
+        self.update["weights"] = generate_update("BENCH-1", "HospitalA", weights_len=dim, rng="numpy")["weights"]
+
+    def time_agent_update_from_dict(self, dim):
+        AgentUpdate.from_dict(self.update)
@@ -0,0 +1,39 @@
+"""Algorithm 2 verification (per update vs batched) and reward."""
+from algorithm2.agent_client import generate_agent_update
+from algorithm2.agent_update import AgentUpdate
+from algorithm2.reward import compute_reward
+from algorithm2.verifier import verify_batch, verify_update
+
+
+def _updates(n):
+    return [
+        AgentUpdate.from_dict(generate_agent_update(f"BENCH-{i}", "HospitalA" if i % 2 else "HospitalB"))
+        for i in range(n)
+    ]
+
+
+class Verify:
+    params = [[1, 64, 1024]]
+    param_names = ["batch"]
+
+    def setup(self, batch):
+        self.updates = _updates(batch)
+
+    def time_verify_update_loop(self, batch):
+        for u in self.updates:
+            verify_update(u)
+
+    def time_verify_batch(self, batch):
+        verify_batch(self.updates)
+
+
+class Reward:
+    params = [[1, 1024]]
+    param_names = ["batch"]
+
+    def setup(self, batch):
+        self.updates = _updates(batch)
+
+    def time_compute_reward(self, batch):
+        for u in self.updates:
+            compute_reward(u)
@@ -0,0 +1,68 @@
+"""
+Compare two result files written by run.py.
+
+    python benchmarks/compare.py OLD.json NEW.json [--threshold 1.10]
+
+Prints new/old ratios of the medians for benchmarks present in both files.
+A ratio is "worse" when time goes up or a higher-is-better track value
+goes down by more than the threshold. Exits with status 1 if any benchmark
+regressed, so it can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+
+def _load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(old, new, threshold):
+    rows = []
+    for name, n in new["results"].items():
+        o = old["results"].get(name)
+        if o is None or "error" in o or "error" in n or not o["median"]:
+            continue
+        ratio = n["median"] / o["median"]
+        # worse > 1 means slower / lower throughput
+        worse = ratio if n.get("better", "lower") == "lower" else 1 / ratio if ratio else float("inf")
+        if worse > threshold:
+            verdict = "REGRESSION"
+        elif worse < 1 / threshold:
+            verdict = "improved"
+        else:
+            verdict = ""
+        rows.append((name, o["median"], n["median"], ratio, verdict, n.get("unit", "")))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="ratio beyond which a change is reported (default 1.10 = 10%%)")
+    parser.add_argument("--only-changed", action="store_true")
+    args = parser.parse_args(argv)
+
+    old, new = _load(args.old), _load(args.new)
+    if old.get("machine") != new.get("machine"):
+        print("warning: results come from different machines or Python / numpy versions\n")
+
+    rows = compare(old, new, args.threshold)
+    print(f"old: {(old.get('commit') or '?')[:10]}  new: {(new.get('commit') or '?')[:10]}\n")
+    print(f"{'benchmark':<80} {'old':>12} {'new':>12} {'ratio':>7}")
+    for name, o, n, ratio, verdict, unit in rows:
+        if args.only_changed and not verdict:
+            continue
+        print(f"{name:<80} {o:>12.6g} {n:>12.6g} {ratio:>7.3f}  {verdict} {unit if unit != 'seconds' else ''}")
+
+    regressions = sum(1 for r in rows if r[4] == "REGRESSION")
+    print(f"\n{len(rows)} compared, {regressions} regressions, "
+          f"{sum(1 for r in rows if r[4] == 'improved')} improved")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""In-process stand-in for the backend2 ledger, served through httpx.MockTransport."""
+import json
+
+import httpx
+
+
+class FakeLedger:
+    """
+    Same endpoints, state machine and error messages as backend2
+    (ledger/state.js, index.js) but no hashing, blocks or network, so
+    backend1 benchmarks measure backend1 rather than the ledger.
+    """
+
+    def __init__(self):
+        self.prescriptions = {}      # id -> "Active" | "Dispensed"
+        self.blocks = 0
+        self.calls = 0
+
+    def _apply(self, op, body):
+        pid = body.get("prescriptionId")
+        state = self.prescriptions.get(pid)
+        if op == "create":
+            if state:
+                raise ValueError("Prescription already exists")
+            self.prescriptions[pid] = "Active"
+        elif op == "verify":
+            if not state:
+                raise ValueError("Prescription not found")
+            if state != "Active":
+                raise ValueError(f"Cannot verify prescription in state: {state}")
+        elif op == "dispense":
+            if not state:
+                raise ValueError("Prescription not found")
+            if state == "Dispensed":
+                raise ValueError("Replay attack detected: already dispensed")
+            self.prescriptions[pid] = "Dispensed"
+        elif op != "record_model":
+            raise ValueError(f"Unknown op: {op}")
+
+    def _batch(self, ops):
+        results = []
+        for o in ops:
+            try:
+                self._apply(o.get("op"), o)
+                results.append({"success": True})
+            except ValueError as e:
+                results.append({"success": False, "message": str(e)})
+        block = None
+        if any(r["success"] for r in results):
+            self.blocks += 1
+            block = {"index": self.blocks, "hash": "0" * 64}
+        return {"success": True, "block": block, "results": results}
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        op = request.url.path.strip("/")
+        body = json.loads(request.content or b"{}")
+        if op == "batch":
+            return httpx.Response(200, json=self._batch(body.get("ops") or []))
+        try:
+            self._apply(op, body)
+        except ValueError as e:
+            return httpx.Response(400, json={"success": False, "message": str(e)})
+        self.blocks += 1
+        return httpx.Response(200, json={"success": True})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
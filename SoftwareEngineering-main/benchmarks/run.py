@@ -0,0 +1,250 @@
+"""
+Run the benchmark suite and save the results as JSON.
+
+    python benchmarks/run.py                          # everything
+    python benchmarks/run.py -b aggregation -b verify # name filters (regex)
+    python benchmarks/run.py --quick                  # one short sample each
+    python benchmarks/compare.py OLD.json NEW.json    # ratios + regressions
+
+Benchmarks live in bench_*.py as asv-style classes: optional `params` /
+`param_names`, `setup(*params)` (raise NotImplementedError to skip a
+combination), `time_*` methods (seconds per call) and `track_*` methods
+(return a value; set `.unit` and `.better = "higher"` on the method).
+"""
+import argparse
+import datetime
+import importlib
+import inspect
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+
+# algorithm1 / algorithm2 are packages under algorithm-v3; backend1 modules are top level
+for path in (HERE, os.path.join(ROOT, "algorithm-v3"), os.path.join(ROOT, "backend1")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+RESULTS_DIR = os.path.join(HERE, "results")
+
+
+# -----------------------------
+# Discovery
+# -----------------------------
+
+def _modules():
+    for name in sorted(os.listdir(HERE)):
+        if name.startswith("bench_") and name.endswith(".py"):
+            yield importlib.import_module(name[:-3])
+
+
+def _param_sets(cls):
+    params = getattr(cls, "params", None)
+    if params is None:
+        return [()]
+    if not params or not isinstance(params[0], (list, tuple)):
+        params = [params]            # a single parameter given as a flat list
+    return list(itertools.product(*params))
+
+
+def _label(cls, method, combo):
+    name = f"{cls.__module__}.{cls.__name__}.{method}"
+    if not combo:
+        return name
+    names = getattr(cls, "param_names", None) or [f"p{i}" for i in range(len(combo))]
+    return f"{name}({', '.join(f'{n}={v}' for n, v in zip(names, combo))})"
+
+
+def discover(patterns):
+    """[(label, cls, method name, params)] in file / definition order."""
+    found = []
+    for module in _modules():
+        classes = [
+            c for _, c in inspect.getmembers(module, inspect.isclass)
+            if c.__module__ == module.__name__
+        ]
+        classes.sort(key=lambda c: inspect.getsourcelines(c)[1])
+        for cls in classes:
+            methods = [m for m in vars(cls) if m.startswith(("time_", "track_"))]
+            for combo in _param_sets(cls):
+                for m in methods:
+                    label = _label(cls, m, combo)
+                    if not patterns or any(re.search(p, label) for p in patterns):
+                        found.append((label, cls, m, combo))
+    return found
+
+
+# -----------------------------
+# Measurement
+# -----------------------------
+
+def _time(fn, repeat, min_time):
+    fn()                                   # warm-up (lazy imports, caches)
+    t0 = time.perf_counter()
+    fn()
+    once = time.perf_counter() - t0
+    number = max(1, int(min_time / once)) if once > 0 else 1000
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - t0) / number)
+    return {
+        "kind": "time",
+        "unit": "seconds",
+        "better": "lower",
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _track(fn, method, repeat):
+    fn()                                   # warm-up
+    values = [fn() for _ in range(repeat)]
+    return {
+        "kind": "track",
+        "unit": getattr(method, "unit", ""),
+        "better": getattr(method, "better", "lower"),
+        "median": statistics.median(values),
+        "min": min(values),
+        "max": max(values),
+        "values": values,
+        "repeat": repeat,
+    }
+
+
+def run_one(cls, name, combo, repeat, min_time):
+    bench = cls()
+    if hasattr(bench, "setup"):
+        try:
+            bench.setup(*combo)
+        except NotImplementedError:
+            return None
+    try:
+        method = getattr(bench, name)
+        fn = lambda: method(*combo)
+        if name.startswith("time_"):
+            return _time(fn, repeat, min_time)
+        return _track(fn, getattr(cls, name), repeat)
+    finally:
+        if hasattr(bench, "teardown"):
+            bench.teardown(*combo)
+
+
+# -----------------------------
+# Environment
+# -----------------------------
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or None
+
+
+def machine_info():
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {
+        "hostname": platform.node(),
+        "platform": platform.platform(),
+        "cpu": _cpu_model(),
+        "cpuCount": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": numpy_version,
+    }
+
+
+def _fmt(result):
+    if result["kind"] == "time":
+        v = result["median"]
+        for unit, scale in (("s", 1), ("ms", 1e3), ("us", 1e6), ("ns", 1e9)):
+            if v * scale >= 1 or unit == "ns":
+                return f"{v * scale:10.3f} {unit}"
+    return f"{result['median']:10.1f} {result['unit']}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run benchmarks/bench_*.py and save JSON results")
+    parser.add_argument("-b", "--bench", action="append", default=[],
+                        help="regex on the benchmark name; may be repeated")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2,
+                        help="seconds per time_* sample (calls are looped to reach it)")
+    parser.add_argument("--quick", action="store_true", help="--repeat 1 --min-time 0.01")
+    parser.add_argument("--output", default=None, help="JSON path (default: benchmarks/results/)")
+    parser.add_argument("--list", action="store_true", help="list benchmark names and exit")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.repeat, args.min_time = 1, 0.01
+
+    benches = discover(args.bench)
+    if args.list:
+        print("\n".join(label for label, *_ in benches))
+        return 0
+
+    commit = _git("rev-parse", "HEAD")
+    report = {
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "machine": machine_info(),
+        "env": {k: os.environ.get(k) for k in ("FL_METRICS", "PRESCRIPTIONS_METRICS", "OMP_NUM_THREADS")},
+        "config": {"repeat": args.repeat, "minTime": args.min_time},
+        "results": {},
+    }
+
+    for label, cls, name, combo in benches:
+        try:
+            result = run_one(cls, name, combo, args.repeat, args.min_time)
+        except Exception as e:
+            result = {"error": repr(e)}
+        if result is None:
+            continue
+        report["results"][label] = result
+        print(f"{label:<80} {'ERROR ' + result['error'] if 'error' in result else _fmt(result)}",
+              flush=True)
+
+    path = args.output
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(RESULTS_DIR, f"{(commit or 'nogit')[:10]}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nsaved {len(report['results'])} results to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())